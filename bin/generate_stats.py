@@ -1,4 +1,5 @@
 from util.configuration import Configuration
+from util import cache
 from modules.reporting.stats import StatsGenerator
 
 import logging
@@ -15,13 +16,15 @@ if __name__ == '__main__':
     
     # Load the configuration file
     config = Configuration('/home/cgueret/Code/CEDAR/DataDump-mini-vt/config.ini')
+    if config.get_cache() != None:
+        cache.configure(*config.get_cache())
     
     # Initialise the stats generator
     statsGenerator = StatsGenerator(config.get_SPARQL(),
                                     config.get_graph_name('raw-data'),
                                     config.get_graph_name('rules'),
                                     config.get_graph_name('release'),
-                                    True) # Use the cache to speed up testing
+                                    True) # Use the query cache to speed up testing
     
     # Go !
     statsGenerator.go('/tmp/stats.html')
@@ -6,8 +6,9 @@ import rdflib
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
                                                 '../integrator')))
 from util.configuration import Configuration
+from util.sparql import SPARQLWrap
+from util import cache
 from rdflib.graph import ConjunctiveGraph
-from SPARQLWrapper import SPARQLWrapper
 from modules.tablinker.namespace import PROV
 
 DESCRIBE_QUERY = """
@@ -27,7 +28,7 @@ class ProvenanceTracker(object):
         
     def track(self, resource):
         graph = ConjunctiveGraph()
-        sparql = SPARQLWrapper(self.conf.get_SPARQL())
+        sparql = SPARQLWrap(self.conf.get_SPARQL())
         
         queue = [resource]
         while len(queue) != 0:
@@ -36,8 +37,7 @@ class ProvenanceTracker(object):
             query = query.replace('__RELEASE__', self.conf.get_graph_name('release'))
             query = query.replace('__RULES__', self.conf.get_graph_name('rules'))
             query = query.replace('__RAW_DATA__', self.conf.get_graph_name('raw-data'))
-            sparql.setQuery(query)
-            results = sparql.query().convert()
+            results = sparql.run_construct(query)
             for statement in results:
                 # Add the statement to the graph
                 graph.add(statement)
@@ -73,6 +73,8 @@ if __name__ == '__main__':
     
     # Get the provenance of the resource
     configuration = Configuration(args.configuration)
+    if configuration.get_cache() != None:
+        cache.configure(*configuration.get_cache())
     data_ns = rdflib.namespace.Namespace(configuration.get_namespace('data'))
     provTracker = ProvenanceTracker(configuration)
     provTracker.track(data_ns[args.resource])
@@ -46,4 +46,9 @@ if __name__ == '__main__':
     # Step 5 : generate some statistics
     integrator.generate_statistics()
     
+    # Step 6 (optional) : push everything to the triple store if it was not
+    # used during the run
+    if config.isOffline() and config.isPush():
+        integrator.push_to_store()
+    
     
\ No newline at end of file
@@ -38,32 +38,31 @@ def colName(number):
         number = number // length - 1
     return output
 
-def getColumns(row):
-    columns = []
-    node = row.firstChild
-    end = row.lastChild
-    while node != end:
-        (_, t) = node.qname
-        
+def getColumnRuns(row):
+    '''
+    Get the cells of a row as a list of (first column, number of columns,
+    cell) runs. Repeated cells are not expanded, covered cells are None
+    '''
+    runs = []
+    first = 0
+    for node in row.childNodes:
         # Focus on table cells only
+        if node.nodeType != node.ELEMENT_NODE:
+            continue
+        (_, t) = node.qname
         if t != 'covered-table-cell' and t != 'table-cell':
             continue
         
-        # If the cell is covered insert a None, otherwise use the cell
+        # If the cell is covered use None, otherwise use the cell
         n = node if t == 'table-cell' else None
-        columns.append(n)
         
         # Shall we repeat this ?
         repeat = node.getAttrNS(TABLENS, 'number-columns-repeated')
-        if repeat != None:
-            repeat = int(repeat) - 1
-            while repeat != 0:
-                columns.append(n)
-                repeat = repeat - 1
+        count = int(repeat) if repeat != None else 1
         
-        # Move to next node
-        node = node.nextSibling
-    return columns
+        runs.append((first, count, n))
+        first = first + count
+    return runs
 
 def copyStyle(style, autoStylesCache):
     autoStylesCache['lastIndex'] = autoStylesCache['lastIndex'] + 1
@@ -178,16 +177,14 @@ def recolor(fileName, markingFileName, outputFileName):
         tables = doc.getElementsByType(Table)
         for tableIndex in range(0, len(tables)):
             if tableIndex in marking:
-                coloredCells = set()
                 table = tables[tableIndex]
                 rows = table.getElementsByType(TableRow)
                 for rowIndex in range(0, len(rows)):
-                    cols = getColumns(rows[rowIndex])
-                    for colIndex in range(0, len(cols)):
-                        cell = cols[colIndex]
-                        
+                    # A repeated cell is a single node, colored once using
+                    # the marking of its first column
+                    for (colIndex, _, cell) in getColumnRuns(rows[rowIndex]):
                         # Ignore cells that are spanned over
-                        if cell == None or cell in coloredCells:
+                        if cell == None:
                             continue
                 
                         # Get the cell name and the current style
@@ -208,10 +205,6 @@ def recolor(fileName, markingFileName, outputFileName):
                         # Change the color
                         logger.debug("--- %s ---" % cellName)
                         setColor(cell, autoStylesCache, color)
-    
-                        # Add the cell to the set of colored ones
-                        # (rows can contain copies of cells if they span)
-                        coloredCells.add(cell)
                         
         # Suppress the background colors
         # Suppress the other color if any
@@ -4,11 +4,17 @@ import multiprocessing
 
 # Import utilities
 from util.push import Pusher
+from util.scheduler import AdaptiveScheduler
+from util import transport, cache
+from util.localstore import get_store
 from util.sparql import SPARQLWrap
+from util.writer import EXTENSIONS
+from util.manifest import Manifest, hash_file, hash_values, hash_dependencies, set_aside
 
 # Import modules for the pipeline
 from modules.tablinker.tablinker import TabLinker
-from modules.rules.rulesmaker import RuleMaker
+from modules.rules.rulesmaker import RuleMaker, load_all_headers, load_mappings
+from modules.rules.mappings import MappingIndex
 from modules.rules.rulesinject import RulesInjector
 from modules.cube.cubemaker import CubeMaker
 from modules.reporting.stats import StatsGenerator
@@ -17,6 +23,21 @@ from modules.reporting.stats import StatsGenerator
 import logging
 log = logging.getLogger(__name__)
 
+# Workbooks larger than this (in bytes) get their sheets split over all the
+# processes instead of being processed by only one of them
+SPLIT_SIZE = 5 * 1024 * 1024
+
+# Name of the manifest saved next to the outputs of a step, hidden to not be
+# pushed along with them
+MANIFEST = '.manifest.json'
+
+# Name of the DSD in the manifest of the release
+DSD = 'dsd'
+
+# Data loaded once by the main process and inherited by the workers when
+# they are forked, instead of being loaded again by each of them
+_shared = {}
+
 SHEETS_QUERY = """
 PREFIX tablinker: <http://bit.ly/cedar-tablink#>
 SELECT DISTINCT ?sheet FROM __RAW_DATA__ WHERE {
@@ -30,6 +51,14 @@ class Integrator(object):
         # Save the configuration
         self._conf = configuration
         
+        # Set up the connections to the triple store
+        transport.configure(**self._conf.get_http_settings())
+        
+        # Cache the results of the queries
+        cache_settings = self._conf.get_cache()
+        if cache_settings != None:
+            cache.configure(*cache_settings)
+        
         # Create the output paths if necessary
         for path in ['raw-data', 'mappings', 'rules', 'release', 'enriched-src']:
             if not os.path.exists(self._conf.get_path(path)):
@@ -39,38 +68,88 @@ class Integrator(object):
         '''
         Convert the input annotated spreadsheet files into raw RDF tabular data.
         This function uses multi-processing to process several file in parallel.
-        At the end all the data is pushed to the triple store
+        The sheets of the largest files are split over all the processes.
+        Only the files which are new or changed since the previous run, as
+        recorded in the manifest, are converted. At the end the data is
+        pushed to the triple store
         '''
+        # Load the manifest of the previous run
+        manifest = Manifest(os.path.join(self._conf.get_path('raw-data'), MANIFEST))
+        output_format = self._conf.get_output_format()
+        settings = hash_values(self._conf.get_namespace('data'),
+                               self._conf.isCompress(), output_format)
+        
         # Prepare a task list
         tasks = []
+        names = set()
         input_files = glob.glob(self._conf.get_path('source-data') + '/*.ods')
         for input_file in sorted(input_files):
             name = os.path.basename(input_file).split('.')[0]
-            output_file = self._conf.get_path('raw-data') + name + '.ttl'
+            names.add(name)
+            signature = hash_values(hash_file(input_file), settings)
+            if manifest.is_up_to_date(name, signature):
+                log.info("[{}] Unchanged since the last run".format(name))
+                continue
+            output_file = self._conf.get_path('raw-data') + name + EXTENSIONS[output_format]
+            dump_file = output_file + '.bz2' if self._conf.isCompress() else output_file
             task = {'name'       :name,
                     'input_file' :input_file,
                     'output_file':output_file,
+                    'dump'       :dump_file,
+                    'signature'  :signature,
                     'target'     :self._conf.get_namespace('data'),
-                    'compress'   :self._conf.isCompress()}
+                    'compress'   :self._conf.isCompress(),
+                    'format'     :output_format}
             tasks.append(task)
         
+        # Keep the previous outputs of the files converted again or removed
+        # aside, their content has to be removed from the store
+        previous_files = []
+        if not manifest.is_new():
+            for name in [t['name'] for t in tasks] + [n for n in manifest.get_sources() if n not in names]:
+                previous_files.extend(self._forget(manifest, name))
     
         # Call tablinker in parallel
         pool_size = multiprocessing.cpu_count()
+        small_tasks = [t for t in tasks if os.path.getsize(t['input_file']) < SPLIT_SIZE]
         pool = multiprocessing.Pool(processes=pool_size)
-        pool.map(generate_raw_data_thread, tasks)
+        pool.map(generate_raw_data_thread, small_tasks)
         pool.close()
         pool.join()
         
-        # Push everything to the triple store
-        self._push_to_graph(self._conf.get_graph_name('raw-data'),
-                            self._conf.get_path('raw-data'))
+        # Process the large files one by one, using all the processes
+        for task in tasks:
+            if task not in small_tasks:
+                task['processes'] = pool_size
+                generate_raw_data_thread(task)
+        
+        # Record the files converted, the failed ones will be tried again
+        (_, new_files) = self._record(manifest, tasks,
+                                      [(t['signature'], None) for t in tasks])
+        
+        # Push everything to the triple store, or only what changed
+        self._push_changes(manifest, self._conf.get_graph_name('raw-data'),
+                           self._conf.get_path('raw-data'),
+                           previous_files, new_files)
+        manifest.save()
         
     def generate_harmonization_rules(self):
         '''
         Generate harmonisation rules based on the data sets found in the raw-rdf
-        data and the mapping rules in the mappings directory
+        data and the mapping rules in the mappings directory. The rules of a
+        sheet are only generated again if its headers or the mappings used
+        for them changed since the last run
         '''
+        # Load the manifest of the previous run
+        manifest = Manifest(os.path.join(self._conf.get_path('rules'), MANIFEST))
+        settings = hash_values(self._conf.get_namespace('data'),
+                               self._conf.isCompress())
+        
+        # Get the headers of all the sheets at once
+        headers = load_all_headers(self._conf.get_SPARQL(),
+                                   self._conf.get_graph_name('raw-data'),
+                                   self._conf.get_namespace('data'))
+        
         # Prepare a task list
         tasks = []
         
@@ -78,36 +157,89 @@ class Integrator(object):
         for dataset in self._get_sheets_list():
             name = dataset.split('/')[-1]
             output = self._conf.get_path('rules') + '/' + name + '.ttl'
+            dump = output + '.bz2' if self._conf.isCompress() else output
+            signature = manifest.get_signature(name)
             task = {'dataset' : dataset,
+                    'name'    : name,
                     'output'  : output,
+                    'dump'    : dump,
+                    'settings': settings,
+                    'previous': signature if manifest.is_up_to_date(name, signature) else None,
+                    'incremental': not manifest.is_new(),
                     'endpoint': self._conf.get_SPARQL(),
                     'target'  : self._conf.get_namespace('data'),
-                    'raw-data': self._conf.get_graph_name('raw-data'),
+                    'headers' : headers.get(unicode(dataset), []),
                     'mappings': self._conf.get_path('mappings'),
                     'compress': self._conf.isCompress()}
             tasks.append(task)
         
+        # Load the mappings once for all the workers
+        log.info("Loading mappings")
+        _shared['mappings'] = load_mappings(self._conf.get_path('mappings'))
+        _shared['index'] = MappingIndex(_shared['mappings'])
+        
         # Call rules maker in parallel, avoid hammering the store too much
-        pool = multiprocessing.Pool(processes=4)
-        pool.map(generate_harmonization_rules_thread, tasks)
-        pool.close()
-        pool.join()
+        try:
+            pool = multiprocessing.Pool(processes=self._conf.get_processes('rules', 4))
+            results = pool.map(generate_harmonization_rules_thread, tasks)
+            pool.close()
+            pool.join()
+        finally:
+            _shared.clear()
         
+        # Record the new outputs and those set aside by the workers
+        (previous_files, new_files) = self._record(manifest, tasks, results)
+
+        # Forget about the sheets which are gone
+        if not manifest.is_new():
+            names = set([t['name'] for t in tasks])
+            for name in manifest.get_sources():
+                if name not in names:
+                    previous_files.extend(self._forget(manifest, name))
+
         # Push all the data to the triple store
-        self._push_to_graph(self._conf.get_graph_name('rules'),
-                            self._conf.get_path('rules'))
+        self._push_changes(manifest, self._conf.get_graph_name('rules'),
+                           self._conf.get_path('rules'),
+                           previous_files, new_files)
+        manifest.save()
 
     def generate_release(self):
         '''
         Get a list of data set to be processed and try to harmonised them into
-        one big data cube
+        one big data cube. Only the sheets for which the raw data or the rules
+        changed since the last run are processed again
         '''
+        # Load the manifests of this step and of the steps it depends on
+        manifest = Manifest(os.path.join(self._conf.get_path('release'), MANIFEST))
+        raw_data = Manifest(os.path.join(self._conf.get_path('raw-data'), MANIFEST))
+        rules = Manifest(os.path.join(self._conf.get_path('rules'), MANIFEST))
+        settings = hash_values(self._conf.get_namespace('data'),
+                               self._conf.isCompress(),
+                               self._conf.get_measure())
+        
         # Prepare a task list
         tasks = []
+        names = set()
+        previous_files = []
         for sheet_name in self._get_sheets_list():
+            name = unicode(sheet_name)
+            names.add(name)
+            workbook = name.rsplit('-S', 1)[0]
+            signature = hash_dependencies(settings,
+                                          raw_data.get_signature(workbook),
+                                          rules.get_signature(name))
+            if manifest.is_up_to_date(name, signature):
+                log.info("[{}] Unchanged since the last run".format(sheet_name))
+                continue
             output_file = self._conf.get_path('release') + sheet_name + '.ttl'
+            dump_file = output_file + '.bz2' if self._conf.isCompress() else output_file
+            if not manifest.is_new():
+                previous_files.extend(self._forget(manifest, name))
             task = {'sheet_name'     : sheet_name,
+                    'name'           : name,
                     'output_file'    : output_file,
+                    'dump'           : dump_file,
+                    'signature'      : signature,
                     'endpoint'       : self._conf.get_SPARQL(),
                     'compress'       : self._conf.isCompress(),
                     'target'         : self._conf.get_namespace('data'),
@@ -116,17 +248,48 @@ class Integrator(object):
                     'rules_graph'    : self._conf.get_graph_name('rules'),
                     'measure'        : self._conf.get_measure()}
             tasks.append(task)
+        if not manifest.is_new():
+            for name in manifest.get_sources():
+                if name not in names and name != DSD:
+                    previous_files.extend(self._forget(manifest, name))
 
-        # Call cube in parallel, avoid hammering the store too much
+        # Call cube in parallel, avoid hammering the store too much. The
+        # harmonisation is done locally so use all the CPUs when working
+        # offline
         cpu_count = multiprocessing.cpu_count()
-        pool = multiprocessing.Pool(processes=min(4, cpu_count))
+        pool_size = self._conf.get_processes('release', min(4, cpu_count))
+        if self._conf.isOffline():
+            pool_size = cpu_count
+        pool = multiprocessing.Pool(processes=pool_size)
         pool.map(generate_release_thread, tasks)
         pool.close()
         pool.join()
+        
+        # Record the new outputs
+        (_, new_files) = self._record(manifest, tasks,
+                                      [(t['signature'], None) for t in tasks])
             
         # Push all the data to the triple store
-        self._push_to_graph(self._conf.get_graph_name('release'),
-                            self._conf.get_path('release'))
+        self._push_changes(manifest, self._conf.get_graph_name('release'),
+                           self._conf.get_path('release'),
+                           previous_files, new_files)
+        
+        # The DSD depends on the configuration and on all the sheets
+        dsd_file_name = self._conf.get_path('release') + 'dsd.ttl'
+        dsd_dump_file = dsd_file_name + '.bz2' if self._conf.isCompress() else dsd_file_name
+        slices = self._conf.get_slices()
+        dsd_signature = hash_dependencies(self._conf.get_cube_title(),
+                                          self._conf.get_measure(),
+                                          self._conf.get_measureunit(),
+                                          repr([sorted(s.items()) for s in slices]),
+                                          *[manifest.get_signature(n) for n in sorted(names)])
+        if manifest.is_up_to_date(DSD, dsd_signature):
+            log.info("The DSD is unchanged since the last run")
+            manifest.save()
+            return
+        previous_files = []
+        if not manifest.is_new():
+            previous_files = self._forget(manifest, DSD)
     
         # Create an instance of CubeMaker
         cubeMaker = CubeMaker(self._conf.get_SPARQL(),
@@ -137,38 +300,52 @@ class Integrator(object):
         cubeMaker.set_compress(self._conf.isCompress())
         
         # Update the DSD
-        dsd_file_name = self._conf.get_path('release') + 'dsd.ttl'
         log.info("Asking CubeMaker to generate the DSD")
         cubeMaker.generate_dsd(self._conf.get_cube_title(),
                                self._conf.get_measure(),
                                self._conf.get_measureunit(),
-                               self._conf.get_slices(),
+                               slices,
                                dsd_file_name)
         
-        # Load the DSD
-        pusher = Pusher(self._conf.get_SPARUL(),
-                        self._conf.get_user(),
-                        self._conf.get_secret())
+        # Load the DSD, replacing the previous one
         log.info("[{}] Adding the content of the DSD".format(self._conf.get_graph_name('release')))
-        if self._conf.isCompress():
-            dsd_file_name = dsd_file_name + ".bz2"
-        pusher.upload_file(self._conf.get_graph_name('release'), dsd_file_name)
+        self._update_graph(self._conf.get_graph_name('release'),
+                           previous_files, [dsd_dump_file])
+        manifest.update(DSD, dsd_signature, [dsd_dump_file])
+        manifest.save()
         
     def generate_enriched_source_files(self):
         '''
         This step opens all the source files and inject the mappings rules
         back into them as annotations. This optional part of the workflow
-        generates files that are useful for assessing what has been generated
+        generates files that are useful for assessing what has been generated.
+        Only the files for which the raw data or the rules of one of the
+        sheets changed since the last run are generated again
         ''' 
+        # Load the manifests of this step and of the steps it depends on
+        manifest = Manifest(os.path.join(self._conf.get_path('enriched-src'), MANIFEST))
+        raw_data = Manifest(os.path.join(self._conf.get_path('raw-data'), MANIFEST))
+        rules = Manifest(os.path.join(self._conf.get_path('rules'), MANIFEST))
+        
         # Prepare a task list
         tasks = []
         input_files = glob.glob(self._conf.get_path('source-data') + '/*.ods')
         for input_file in sorted(input_files):
             base_name = os.path.basename(input_file)
+            workbook = base_name.split('.')[0]
+            sheets = [n for n in rules.get_sources() if n.rsplit('-S', 1)[0] == workbook]
+            signature = hash_dependencies(raw_data.get_signature(workbook),
+                                          *[rules.get_signature(n) for n in sheets])
+            if manifest.is_up_to_date(base_name, signature):
+                log.info("[{}] Unchanged since the last run".format(base_name))
+                continue
             output_file = self._conf.get_path('enriched-src') + base_name
             task = {'input_file'     : input_file,
                     'output_file'    : output_file,
                     'base_name'      : base_name,
+                    'name'           : base_name,
+                    'dump'           : output_file,
+                    'signature'      : signature,
                     'endpoint'       : self._conf.get_SPARQL(),
                     'raw_data_graph' : self._conf.get_graph_name('raw-data'),
                     'rules_graph'    : self._conf.get_graph_name('rules')}
@@ -176,10 +353,15 @@ class Integrator(object):
 
         # Call cube in parallel, avoid hammering the store too much
         cpu_count = multiprocessing.cpu_count()
-        pool = multiprocessing.Pool(processes=min(4, cpu_count))
+        pool_size = self._conf.get_processes('enriched', min(4, cpu_count))
+        pool = multiprocessing.Pool(processes=pool_size)
         pool.map(generate_enriched_source_files_thread, tasks)
         pool.close()
         pool.join()
+        
+        # Record the new outputs
+        self._record(manifest, tasks, [(t['signature'], None) for t in tasks])
+        manifest.save()
     
     def generate_statistics(self):
         '''
@@ -204,13 +386,47 @@ class Integrator(object):
         datasets = [sparql.format(r['sheet']) for r in results]
         return datasets
     
-    def _push_to_graph(self, named_graph, directory):
+    def push_to_store(self):
         '''
-        Push data to to the triple store
+        Push all the outputs to the triple store. This is the last step of
+        an offline run
+        '''
+        pusher = self._get_remote_pusher()
+        for name in ['raw-data', 'rules', 'release']:
+            self._push_to_graph(self._conf.get_graph_name(name),
+                                self._conf.get_path(name), pusher)
+        
+    def _get_pusher(self):
+        '''
+        Get the pusher used to load the outputs of the steps, the local store
+        in offline mode
+        '''
+        if self._conf.isOffline():
+            return get_store()
+        return self._get_remote_pusher()
+        
+    def _get_remote_pusher(self):
+        '''
+        Get a pusher for the triple store set up with the loading methods
+        configured
         '''
         pusher = Pusher(self._conf.get_SPARUL(),
                         self._conf.get_user(),
                         self._conf.get_secret())
+        pusher.set_method(self._conf.get_push_method())
+        pusher.set_scheduler(AdaptiveScheduler(**self._conf.get_scheduler_settings()))
+        pusher.set_graph_store(self._conf.get_graph_store())
+        bulk_loader = self._conf.get_bulk_loader()
+        if bulk_loader != None:
+            pusher.set_bulk_loader(*bulk_loader)
+        return pusher
+        
+    def _push_to_graph(self, named_graph, directory, pusher=None):
+        '''
+        Push data to to the triple store
+        '''
+        if pusher == None:
+            pusher = self._get_pusher()
         log.info("[{}] Cleaning the content of the graph ".format(named_graph))
         pusher.clean_graph(named_graph)
         log.info("[{}] Loading files in {}".format(named_graph, directory))
@@ -218,6 +434,65 @@ class Integrator(object):
             log.info("[{}] Loading {}".format(named_graph, input_file))
             pusher.upload_file(named_graph, input_file)
         log.info("[{}] Done loading data".format(named_graph))
+        
+    def _push_changes(self, manifest, named_graph, directory,
+                      previous_files, new_files):
+        '''
+        Push all the content of a directory to the triple store if there was
+        no previous manifest, otherwise only replace what changed
+        '''
+        if self._conf.isOffline():
+            # The local store starts empty, load everything
+            for input_file in previous_files:
+                os.remove(input_file)
+            self._push_to_graph(named_graph, directory)
+        elif manifest.is_new():
+            self._push_to_graph(named_graph, directory)
+        else:
+            self._update_graph(named_graph, previous_files, new_files)
+    
+    def _forget(self, manifest, name):
+        '''
+        Remove a source from the manifest and set its outputs aside. Returns
+        the list of outputs set aside
+        '''
+        previous_files = [set_aside(f) for f in manifest.get_outputs(name)]
+        manifest.remove(name)
+        return [f for f in previous_files if f != None]
+    
+    def _record(self, manifest, tasks, results):
+        '''
+        Record in the manifest the outputs of the tasks based on the
+        (signature, previous file) returned for them. Failed tasks are
+        forgotten to be tried again. Returns the list of the previous files
+        set aside and the list of the new files
+        '''
+        previous_files = []
+        new_files = []
+        for (task, (signature, previous_file)) in zip(tasks, results):
+            if previous_file != None:
+                previous_files.append(previous_file)
+            if signature == None or not os.path.exists(task['dump']):
+                manifest.remove(task['name'])
+            elif manifest.get_signature(task['name']) != signature or task['dump'] not in manifest.get_outputs(task['name']):
+                manifest.update(task['name'], signature, [task['dump']])
+                new_files.append(task['dump'])
+        return (previous_files, new_files)
+    
+    def _update_graph(self, named_graph, previous_files, new_files):
+        '''
+        Replace in the triple store the content of the previous files by the
+        one of the new files. The previous files are deleted once done
+        '''
+        pusher = self._get_pusher()
+        for input_file in previous_files:
+            log.info("[{}] Removing {}".format(named_graph, input_file))
+            pusher.delete_file(named_graph, input_file)
+            os.remove(input_file)
+        for input_file in new_files:
+            log.info("[{}] Loading {}".format(named_graph, input_file))
+            pusher.upload_file(named_graph, input_file)
+        log.info("[{}] Done updating data".format(named_graph))
 
 def generate_raw_data_thread(parameters):
     '''
@@ -230,11 +505,15 @@ def generate_raw_data_thread(parameters):
     tLinker = TabLinker(input_file, output_file, processAnnotations=True)
     tLinker.set_target_namespace(parameters['target'])
     tLinker.set_compress(parameters['compress'])
+    tLinker.set_output_format(parameters['format'])
+    tLinker.set_processes(parameters.get('processes', 1))
     tLinker.doLink()
 
 def generate_harmonization_rules_thread(parameters):
     '''
-    Worker thread for generate_harmonization_rules
+    Worker thread for generate_harmonization_rules. Returns the signature of
+    the rules and the previous output set aside, if the rules were generated
+    again
     '''
     dataset = parameters['dataset']
     output = parameters['output']
@@ -243,11 +522,31 @@ def generate_harmonization_rules_thread(parameters):
         rulesMaker = RuleMaker(parameters['endpoint'], dataset, output)
         rulesMaker.set_target_namespace(parameters['target'])
         rulesMaker.set_compress(parameters['compress'])
-        rulesMaker.loadMappings(parameters['mappings']) 
-        rulesMaker.loadHeaders(parameters['raw-data'])
+        if 'mappings' in _shared:
+            rulesMaker.setMappings(_shared['mappings'], _shared['index'])
+        else:
+            rulesMaker.loadMappings(parameters['mappings'])
+        rulesMaker.setHeaders(parameters['headers'])
+        signature = hash_values(parameters['settings'], rulesMaker.get_signature())
+        if signature == parameters['previous']:
+            log.info("[{}] Unchanged since the last run".format(dataset))
+            return (signature, None)
+    except Exception as e:
+        log.error("[{}] Error in RulesMaker: {}".format(dataset.n3(), e))
+        return (None, None)
+    previous_file = None
+    if parameters['incremental']:
+        previous_file = set_aside(parameters['dump'])
+    try:
         rulesMaker.process()
+        return (signature, previous_file)
     except Exception as e:
         log.error("[{}] Error in RulesMaker: {}".format(dataset.n3(), e))
+    # The previous rules are still in the store, they have to be removed
+    # with the partial output, which is not pushed
+    if os.path.exists(parameters['dump']):
+        os.remove(parameters['dump'])
+    return (None, previous_file)
 
 def generate_release_thread(parameters):
     '''
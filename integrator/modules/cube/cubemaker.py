@@ -1,14 +1,17 @@
 import bz2
 import sys
-import requests
+from itertools import chain
     
 from util.sparql import SPARQLWrap
+from util.writer import TriplesWriter
+from util.localstore import LOCAL, get_store
 
 from rdflib import ConjunctiveGraph, Literal
 from rdflib.namespace import XSD, RDFS, RDF, DCTERMS, Namespace
 from rdflib.term import URIRef, BNode
 from modules.tablinker.namespace import PROV
 from modules.cube.namespace import QB, SDMXDIMENSION, SDMXATTRIBUTE
+from modules.cube.harmoniser import Harmoniser, QUERY_CELLS, QUERY_MAPPINGS
 
 # TODO: If the value is not an int mark the point as being ignored
 # TODO: When getting the RDF model from the construct, look for dimensions used
@@ -110,10 +113,20 @@ class CubeMaker(object):
         graph.add((dsd_uri, RDF.type, QB.DataStructureDefinition))
         graph.add((dsd_uri, SDMXATTRIBUTE.unitMeasure, URIRef(measure_unit)))
         
-        # Bind all the dimensions
+        # Get the dimensions and the members of all the slices at once
+        queries = [(QUERY_DIMS, {'__RELEASE__' : self.release_graph_name})]
+        for s in slices:
+            s2 = [Literal(s).n3() for s in s['sources']]
+            params = {'__RELEASE__' : self.release_graph_name,
+                      '__RAW_DATA__': self.raw_data_graph_name,
+                      '__SOURCES__' : ','.join(s2)
+                      }
+            queries.append((QUERY_MEMBER_OBS, params))
         sparql = SPARQLWrap(self.end_point)
-        params = {'__RELEASE__' : self.release_graph_name}
-        results = sparql.run_select(QUERY_DIMS, params)
+        all_results = sparql.run_select_many(queries)
+        
+        # Bind all the dimensions
+        results = all_results[0]
         dims = [URIRef(r['dim']['value']) for r in results]
         if URIRef(measure) in dims:
             dims.remove(URIRef(measure)) # We need to remove the measure
@@ -171,14 +184,7 @@ class CubeMaker(object):
             graph.add((slice_uri, URIRef(s['property']), val))
         
             # Attach all the relevant observations to it
-            sparql = SPARQLWrap(self.end_point)
-            s2 = [Literal(s).n3() for s in s['sources']]
-            params = {'__RELEASE__' : self.release_graph_name,
-                      '__RAW_DATA__': self.raw_data_graph_name,
-                      '__SOURCES__' : ','.join(s2)
-                      }
-            results = sparql.run_select(QUERY_MEMBER_OBS, params)
-            for r in results:
+            for r in all_results[index + 1]:
                 graph.add((slice_uri, QB.observation, URIRef(r['obs']['value'])))
                 
         log.info("[{}] Contains {} triples".format(output_file, len(graph)))
@@ -195,50 +201,29 @@ class CubeMaker(object):
         Process all the data cells in the target sheet and look for rules to
         harmonise them, save the output into outputfile_name
         """
-        # Set the parameters for the SPARQL queries
-        query_params = {'SHEET'        : self.data_ns[sheet_name],
-                        '__RAW_DATA__' : self.raw_data_graph_name,
-                        '__RULES__'    : self.rules_graph_name,
-                        '__MEASURE__'  : measure}
-        
-        # Prepare the SPARQL construct
-        query = """
-        PREFIX qb: <http://purl.org/linked-data/cube#>
-        PREFIX prov: <http://www.w3.org/ns/prov#>
-        PREFIX tablinker: <http://bit.ly/cedar-tablink#>
-        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
-        
-        CONSTRUCT {
-            `iri(bif:concat(?cell,"-h"))` a qb:Observation;
-                <__MEASURE__> ?popcount;
-                ?dim ?val;
-                prov:wasDerivedFrom ?cell;
-                prov:wasGeneratedBy `iri(bif:concat(?cell,"-activity"))`.
-            `iri(bif:concat(?cell,"-activity"))` a prov:Activity;
-                rdfs:label "Harmonise";
-                prov:used ?mapping.
-        } 
-        FROM __RAW_DATA__
-        FROM __RULES__
-        WHERE {
-            ?cell a tablinker:DataCell.
-            ?cell tablinker:sheet <SHEET>.
-            ?cell tablinker:dimension ?dimension.
-            ?cell tablinker:value ?popcounts.
-            ?mapping a oa:Annotation.
-            ?mapping oa:hasTarget ?dimension.
-            ?mapping oa:hasBody ?mapping_body.
-            ?mapping_body ?dim ?val.
-            FILTER (?dim != rdf:type)
-            BIND (xsd:decimal(?popcounts) as ?popcount) 
-        }"""
-        for (k, v) in query_params.iteritems():
-                query = query.replace(k, v)
-        
-        # Launch the query and stream back the output to the file
-        r = requests.post(self.end_point, data={'query' : query}, stream=True)
-        out = bz2.BZ2File(output_file + '.bz2', 'wb', compresslevel=9) if self.compress_output else open(output_file, "wb")
-        for chunk in r.iter_content(2048):
-            out.write(chunk)
-        out.close() 
+        sheet = self.data_ns[sheet_name]
         
+        # Index the data cells and the mappings of the sheet
+        harmoniser = Harmoniser(measure)
+        if self.end_point == LOCAL:
+            harmoniser.load_graph(get_store().graph, sheet)
+        else:
+            sparql = SPARQLWrap(self.end_point)
+            params = {'__SHEET__'    : sheet.n3(),
+                      '__RAW_DATA__' : self.raw_data_graph_name,
+                      '__RULES__'    : self.rules_graph_name}
+            cells = chain.from_iterable(sparql.run_select_pages(QUERY_CELLS, params, 'cell'))
+            mappings = chain.from_iterable(sparql.run_select_pages(QUERY_MAPPINGS, params, 'target'))
+            harmoniser.load_results(cells, mappings, sparql)
+        
+        # Stream the observations to the output
+        writer = TriplesWriter(output_file, 'turtle', self.compress_output)
+        writer.bind('qb', QB)
+        writer.bind('prov', PROV)
+        writer.bind('rdfs', RDFS)
+        writer.bind('xsd', XSD)
+        writer.bind('data', self.data_ns)
+        for triple in harmoniser.triples():
+            writer.add(triple)
+        log.info("[{}] Contains {} triples".format(output_file, len(writer)))
+        writer.close()
@@ -0,0 +1,147 @@
+import re
+
+from rdflib.namespace import RDF, RDFS, XSD
+from rdflib.term import URIRef, Literal
+from modules.tablinker.namespace import TABLINKER, PROV, OA
+from modules.cube.namespace import QB
+
+# Lexical form of the values that can be cast to a xsd:decimal
+DECIMAL = re.compile(r'^[+-]?(\d+(\.\d*)?|\.\d+)$')
+
+# Get the data cells of a sheet along with their value and dimensions
+QUERY_CELLS = """
+PREFIX tablinker: <http://bit.ly/cedar-tablink#>
+SELECT ?cell ?value ?dimension FROM __RAW_DATA__ WHERE {
+    ?cell tablinker:sheet __SHEET__.
+    ?cell a tablinker:DataCell.
+    ?cell tablinker:value ?value.
+    ?cell tablinker:dimension ?dimension.
+}
+"""
+
+# Get the content of the mappings targeting the cells of a sheet
+QUERY_MAPPINGS = """
+PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX tablinker: <http://bit.ly/cedar-tablink#>
+PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
+SELECT ?target ?mapping ?p ?o FROM __RAW_DATA__ FROM __RULES__ WHERE {
+    ?target tablinker:sheet __SHEET__.
+    ?mapping oa:hasTarget ?target.
+    ?mapping oa:hasBody ?body.
+    ?body ?p ?o.
+    FILTER (?p != rdf:type)
+}
+"""
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+def _add_new(values, seen, value):
+    if value not in seen:
+        seen.add(value)
+        values.append(value)
+
+class Harmoniser(object):
+    '''
+    Join the data cells of a sheet with the mappings of their dimensions to
+    turn them into observations. The cells and the mappings are indexed by
+    URI so the cost is linear in the number of cells, dimensions and
+    mappings
+    '''
+    def __init__(self, measure):
+        '''
+        Constructor
+        '''
+        self.measure = URIRef(measure)
+        # Values and dimensions of the data cells
+        self.values = {}
+        self.dimensions = {}
+        # Mappings and (property, value) pairs of their bodies per target
+        self.mappings = {}
+        self.pairs = {}
+
+    def add_value(self, cell, value):
+        self.values.setdefault(cell, [])
+        if value not in self.values[cell]:
+            self.values[cell].append(value)
+
+    def add_dimension(self, cell, dimension):
+        self.dimensions.setdefault(cell, [])
+        if dimension not in self.dimensions[cell]:
+            self.dimensions[cell].append(dimension)
+
+    def add_mapping(self, target, mapping, p, o):
+        self.mappings.setdefault(target, set()).add(mapping)
+        self.pairs.setdefault(target, set()).add((p, o))
+
+    def load_results(self, cells, mappings, sparql):
+        '''
+        Load the bindings of QUERY_CELLS and QUERY_MAPPINGS
+        '''
+        for r in cells:
+            cell = URIRef(r['cell']['value'])
+            self.add_value(cell, sparql.format(r['value']))
+            self.add_dimension(cell, URIRef(r['dimension']['value']))
+        for r in mappings:
+            self.add_mapping(URIRef(r['target']['value']),
+                             sparql.format(r['mapping']),
+                             URIRef(r['p']['value']), sparql.format(r['o']))
+
+    def load_graph(self, graph, sheet):
+        '''
+        Load the data cells and the mappings of a sheet directly from a graph
+        '''
+        for (cell, _, _) in graph.triples((None, TABLINKER.sheet, sheet)):
+            if (cell, RDF.type, TABLINKER.DataCell) in graph:
+                values = list(graph.objects(cell, TABLINKER.value))
+                if len(values) != 0:
+                    for value in values:
+                        self.add_value(cell, value)
+                    for dimension in graph.objects(cell, TABLINKER.dimension):
+                        self.add_dimension(cell, dimension)
+            for mapping in graph.subjects(OA.hasTarget, cell):
+                for body in graph.objects(mapping, OA.hasBody):
+                    for (p, o) in graph.predicate_objects(body):
+                        if p != RDF.type:
+                            self.add_mapping(cell, mapping, p, o)
+
+    def triples(self):
+        '''
+        Generate the triples describing the observations, one per data cell
+        having at least one dimension mapped
+        '''
+        for cell in sorted(self.dimensions.keys()):
+            # Collect all the mappings of the dimensions of the cell
+            mappings = []
+            pairs = []
+            seen_mappings = set()
+            seen_pairs = set()
+            for dimension in self.dimensions[cell]:
+                for mapping in sorted(self.mappings.get(dimension, [])):
+                    _add_new(mappings, seen_mappings, mapping)
+                for pair in sorted(self.pairs.get(dimension, [])):
+                    _add_new(pairs, seen_pairs, pair)
+            if len(mappings) == 0:
+                continue
+
+            # Mint the URIs
+            observation = URIRef(cell + '-h')
+            activity = URIRef(cell + '-activity')
+
+            # Describe the observation
+            yield (observation, RDF.type, QB.Observation)
+            for value in self.values[cell]:
+                if DECIMAL.match(value.strip()):
+                    yield (observation, self.measure,
+                           Literal(value.strip(), datatype=XSD.decimal))
+            for (p, o) in pairs:
+                yield (observation, p, o)
+            yield (observation, PROV.wasDerivedFrom, cell)
+            yield (observation, PROV.wasGeneratedBy, activity)
+
+            # Describe the activity
+            yield (activity, RDF.type, PROV.Activity)
+            yield (activity, RDFS.label, Literal("Harmonise"))
+            for mapping in mappings:
+                yield (activity, PROV.used, mapping)
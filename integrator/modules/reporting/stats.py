@@ -1,5 +1,4 @@
 #!/usr/bin/python2
-import json
 import os
 from jinja2 import Template
 from util.sparql import SPARQLWrap
@@ -20,7 +19,7 @@ log = logging.getLogger(__name__)
 
 class StatsGenerator(object):
     def __init__(self, end_point, raw_graph_name, rules_graph_name,
-                 release_graph_name, use_cache=False):
+                 release_graph_name, use_cache=True):
         '''
         Constructor
         '''
@@ -36,24 +35,16 @@ class StatsGenerator(object):
         '''
         # Run all the queries
         results = {}
-        if self.use_cache and os.path.isfile('/tmp/results.json'):
-            log.info("Load cached data")
-            with open('/tmp/results.json', 'r') as infile:
-                results = json.load(infile)
-        else:
-            sparql = SPARQLWrap(self.end_point)
-            for query_name in QUERIES:
-                query_file = "{}/{}.sparql".format(os.path.dirname(__file__),
-                                                   query_name)
-                log.info("Execute %s" % query_file)
-                query = open(query_file, 'r').read()
-                r = sparql.run_select(query, self.sparql_params)
-                parsed_results = self._parse_results(r)
-                results[query_name] = parsed_results
-                log.info("Results %s" % parsed_results)
-            with open('/tmp/results.json', 'w') as outfile:
-                json.dump(results, outfile)
-        
+        sparql = SPARQLWrap(self.end_point, self.use_cache)
+        for query_name in QUERIES:
+            query_file = "{}/{}.sparql".format(os.path.dirname(__file__),
+                                               query_name)
+            log.info("Execute %s" % query_file)
+            query = open(query_file, 'r').read()
+            r = sparql.run_select(query, self.sparql_params)
+            parsed_results = self._parse_results(r)
+            results[query_name] = parsed_results
+            log.info("Results %s" % parsed_results)
             
         # Prepare the table with the overview for the sources
         table = {}
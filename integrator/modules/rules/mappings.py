@@ -1,18 +1,45 @@
+import math
 import os
+import re
 
 from rdflib.term import URIRef, Literal
-from modules.tablinker.helpers import clean_string
+from modules.tablinker.helpers import clean_strings
+from util.manifest import hash_values
 
 from xlrd import open_workbook
 from xlutils.margins import number_of_good_cols, number_of_good_rows
 
+# Context of the mappings, from the most specific to the least specific
+CONTEXTS = ['cell', 'sheet', 'dataset']
+
+# Literals shorter than this are never matched approximately, too many of
+# them are only a couple of edits away from each other
+MIN_FUZZY_LENGTH = 4
+
+def _canonical(value):
+    '''
+    Turn the dictionaries of a mapping into sorted lists of items, for their
+    representation not to depend on the order of insertion
+    '''
+    if isinstance(value, dict):
+        return sorted([(k, _canonical(v)) for (k, v) in value.iteritems()])
+    return value
+
 class MappingsList(object):
     
     def __init__(self, data):
         self._mappings = {}
+        self._full_signature = None
+        
+        # Threshold of the approximate matching, 0 to disable it
+        self.fuzzy = float(data.get('fuzzy', 0))
+        
+        # Keep the settings of the section, used for the signature
+        self._settings = sorted([(k, v) for (k, v) in data.iteritems() if k != 'path'])
         
         self.excelFileName = data['file']
         predicate = URIRef(data['predicate'])
+        self.predicate = predicate
         mapping_type = data['mapping_type']
         
         # Load the mappings
@@ -20,15 +47,22 @@ class MappingsList(object):
         sheet = wb.sheet_by_index(0)
         colns = number_of_good_cols(sheet)
         rowns = number_of_good_rows(sheet)
+        
+        # Get the strings (force reading the cells as strings) and clean
+        # them all at once
+        literals = []
+        for literal in sheet.col_values(1, 1, rowns):
+            if type(literal) == type(1.0):
+                literal = str(int(literal))
+            literals.append(literal)
+        literals = clean_strings(literals)
+        
         for i in range(1, rowns):
             # Get the context (first column)
             context = sheet.cell(i, 0).value
             
-            # Get the string (force reading the cell as a string)
-            literal = sheet.cell(i, 1).value
-            if type(literal) == type(1.0):
-                literal = str(int(literal))
-            literal = clean_string(literal)
+            # Get the string
+            literal = literals[i - 1]
             
             # Get the values
             values = []
@@ -79,6 +113,36 @@ class MappingsList(object):
     def get_file_name(self):
         return self.excelFileName
     
+    def get_namespace(self):
+        '''
+        Returns the namespace of the predicate of the mappings
+        '''
+        return re.sub(r'[^#/]*$', '', self.predicate)
+    
+    def get_signature(self, literals):
+        '''
+        Returns a signature of the settings of the list and of the mappings
+        of the given literals. It only changes if the mappings for these
+        literals change
+        '''
+        values = [repr(self._settings)]
+        if self.fuzzy > 0:
+            # Any entry may be matched approximately
+            if self._full_signature == None:
+                self._full_signature = hash_values(repr(_canonical(self._mappings)))
+            values.append(self._full_signature)
+        else:
+            for literal in literals:
+                values.append(repr(_canonical(self._mappings.get(literal))))
+        return hash_values(*values)
+    
+    def get_fuzzy_threshold(self):
+        '''
+        Returns the minimum score of the approximate matches, 0 if the
+        approximate matching is disabled for this list
+        '''
+        return self.fuzzy
+    
     def get_mappings_for(self, literal, context_map):
         '''
         Returns a set of pairs for a given string
@@ -104,3 +168,168 @@ class MappingsList(object):
         
         # Exceptions don't match but we have a default mapping
         return self._mappings[literal]['default']
+    
+    def get_entries(self):
+        '''
+        Iterate over the literals mapped with their default pairs and their
+        pairs for specific contexts
+        '''
+        for (literal, entry) in self._mappings.iteritems():
+            yield (literal, entry.get('default'), entry.get('context', {}))
+    
+class MappingIndex(object):
+    '''
+    Index of the mappings of all the sections. A single lookup on a literal
+    returns the pairs of all the sections mapping it, with the exceptions
+    for the context already resolved
+    '''
+    def __init__(self, mappings):
+        '''
+        Compile the index from a dictionary of MappingsList per section
+        '''
+        # For every literal, a list of (section, default pairs, exceptions)
+        # with the exceptions indexed by (context, value)
+        self._index = {}
+        # Trigram index of the literals of the sections matched approximately
+        self._fuzzy = {}
+        for section in sorted(mappings.keys()):
+            literals = []
+            for (literal, default, contexts) in mappings[section].get_entries():
+                exceptions = {}
+                for (context, pairs) in contexts.iteritems():
+                    exceptions[tuple(context.split('=', 1))] = pairs
+                entry = (section, default, exceptions)
+                self._index.setdefault(literal, []).append(entry)
+                literals.append(literal)
+            threshold = mappings[section].get_fuzzy_threshold()
+            if threshold > 0:
+                self._fuzzy[section] = TrigramIndex(literals, threshold)
+    
+    def get_mappings_for(self, literal, context_map):
+        '''
+        Returns a list of (section, pairs) for all the sections mapping a
+        literal in the given context, in the order of the sections
+        '''
+        entries = self._index.get(literal)
+        if entries == None:
+            return []
+        keys = [(key, context_map[key]) for key in CONTEXTS]
+        hits = []
+        for (section, default, exceptions) in entries:
+            pairs = _resolve(default, exceptions, keys)
+            if pairs != None:
+                hits.append((section, pairs))
+        return hits
+    
+    def get_approximate_mappings_for(self, literal, context_map, sections):
+        '''
+        Returns a list of (section, pairs, matched literal, score) for the
+        given sections matching the literal approximately in the given
+        context, in the order of the sections. Only the sections for which
+        the approximate matching is enabled are considered
+        '''
+        keys = [(key, context_map[key]) for key in CONTEXTS]
+        hits = []
+        for section in sorted(set(sections) & set(self._fuzzy.keys())):
+            match = self._fuzzy[section].find(literal)
+            if match == None:
+                continue
+            (matched, score) = match
+            for (s, default, exceptions) in self._index[matched]:
+                if s == section:
+                    pairs = _resolve(default, exceptions, keys)
+                    if pairs != None:
+                        hits.append((section, pairs, matched, score))
+        return hits
+
+def _resolve(default, exceptions, keys):
+    '''
+    Pick the pairs of the most specific context matching, or the default
+    '''
+    for key in keys:
+        if key in exceptions:
+            return exceptions[key]
+    return default
+
+def _trigrams(literal):
+    '''
+    Returns the set of trigrams of a literal, ignoring the case and padded
+    with spaces for the first and last letters to weight as much as others
+    '''
+    padded = u' ' + literal.lower() + u' '
+    return set([padded[i:i + 3] for i in xrange(len(padded) - 2)])
+
+class TrigramIndex(object):
+    '''
+    Inverted index of the trigrams of a list of literals, used to find the
+    literal most similar to a string. The similarity is the Dice coefficient
+    of the sets of trigrams, 1 for equal strings. Only the literals of a
+    compatible length sharing one of the rarest trigrams of the string can
+    score above the threshold so only these are compared. The results are
+    kept, as the same headers are found in many sheets
+    '''
+    def __init__(self, literals, threshold):
+        '''
+        Constructor
+        '''
+        self.threshold = threshold
+        self.literals = []
+        self.trigrams = []
+        self.postings = {}
+        for literal in sorted(set(literals)):
+            if len(literal) < MIN_FUZZY_LENGTH:
+                continue
+            trigrams = _trigrams(literal)
+            for trigram in trigrams:
+                self.postings.setdefault(trigram, []).append(len(self.literals))
+            self.literals.append(literal)
+            self.trigrams.append(trigrams)
+        self.results = {}
+    
+    def find(self, literal):
+        '''
+        Returns the (literal, score) matching best above the threshold, None
+        if there is none or if several literals are equally good
+        '''
+        if literal not in self.results:
+            self.results[literal] = self._find(literal)
+        return self.results[literal]
+        
+    def _find(self, literal):
+        if len(literal) < MIN_FUZZY_LENGTH:
+            return None
+        trigrams = _trigrams(literal)
+        size = len(trigrams)
+        t = self.threshold
+        
+        # Bounds on the number of trigrams of the literals that can match,
+        # and number of trigrams they have to share at least
+        min_size = size * t / (2 - t)
+        max_size = size * (2 - t) / t
+        min_shared = int(math.ceil(t * (size + min_size) / 2 - 1e-9))
+        
+        # A literal sharing that many trigrams shares at least one of the
+        # (size - min_shared + 1) rarest ones
+        rarest = sorted(trigrams, key=lambda g: len(self.postings.get(g, [])))
+        candidates = set()
+        for trigram in rarest[:max(size - min_shared + 1, 1)]:
+            candidates.update(self.postings.get(trigram, []))
+        
+        # Score them
+        best = None
+        best_score = 0
+        ambiguous = False
+        for i in candidates:
+            other = self.trigrams[i]
+            if len(other) < min_size or len(other) > max_size:
+                continue
+            score = 2.0 * len(trigrams & other) / (size + len(other))
+            if score < t:
+                continue
+            if best == None or score > best_score:
+                (best, best_score, ambiguous) = (i, score, False)
+            elif score == best_score:
+                ambiguous = True
+        if best == None or ambiguous:
+            return None
+        return (self.literals[best], round(best_score, 3))
@@ -6,7 +6,7 @@ from odf.table import Table, TableRow
 from odf import office
 from odf.text import P
 from odf.namespaces import TABLENS
-from modules.tablinker.helpers import colName, getColumns
+from modules.tablinker.helpers import parseCellName, getColumnRuns
 from rdflib.term import Literal
 from util.sparql import SPARQLWrap
 
@@ -29,7 +29,7 @@ PREFIX tablinker: <http://bit.ly/cedar-tablink#>
 PREFIX dcat: <http://www.w3.org/ns/dcat#>
 PREFIX dcterms: <http://purl.org/dc/terms/>
 
-SELECT ?cell_name ?p ?o FROM __RULES__ FROM __RAW_DATA__ WHERE {
+SELECT ?sheet ?cell_name ?p ?o FROM __RULES__ FROM __RAW_DATA__ WHERE {
     [] a oa:Annotation ;
         oa:hasBody [?p ?o];
         oa:hasTarget ?cell.
@@ -42,6 +42,9 @@ SELECT ?cell_name ?p ?o FROM __RULES__ FROM __RAW_DATA__ WHERE {
 }
 """
 
+# Index of a sheet at the end of its URI (ex: "http://example.org/book-S0")
+SHEET_INDEX = re.compile(r'-S(\d+)$')
+
 class RulesInjector(object):
     def __init__(self, end_point, rules_graph, raw_data_graph):
         """
@@ -51,6 +54,7 @@ class RulesInjector(object):
         self.end_point = end_point
         self.rules_graph = rules_graph
         self.raw_data_graph = raw_data_graph
+        self.sparql = SPARQLWrap(end_point)
         
     def process_workbook(self, input_file_name, output_file_name):
         """
@@ -67,50 +71,71 @@ class RulesInjector(object):
         log.debug('[{}] Starting RulesInjector'.format(basename))
         sheets = book.getElementsByType(Table)
         
+        # Load the annotations of all the sheets at once
+        annotations = self._load_annotations(basename)
+        
         # Process all the sheets
         log.info('[{}] Found {} sheets to process'.format(basename, len(sheets)))
         for n in range(len(sheets)) :
             log.debug('[{}] Processing sheet {}'.format(basename, n))
             try:
-                self._process_sheet(basename, n, sheets[n])
+                self._process_sheet(basename, sheets[n], annotations.get(n, {}))
             except Exception as detail:
                 log.error("[{}] Error processing sheet {} : {}".format(basename, n, detail))
 
         book.save(unicode(output_file_name))
         
-    def _process_sheet(self, basename, n, sheet):
+    def _load_annotations(self, basename):
+        """
+        Get the annotations of all the sheets of a workbook with one query.
+        Returns the (property, value) pairs of every annotated cell, grouped
+        by index of sheet and name of cell
         """
-        Process a sheet 
-        """        
         log.debug('[{}] Load rules'.format(basename))
-        annotations_map = {}
-        # SPARQL Wrapper
-        self.sparql = SPARQLWrap(self.end_point)
         sparql_params = {'__RULES__': self.rules_graph,
                          '__RAW_DATA__' : self.raw_data_graph,
                          '__FILE_NAME__' : Literal(basename).n3()}
-        results = self.sparql.run_select(QUERY_ANNOTATIONS, sparql_params)
-        for result in results:
-            cell_name = result['cell_name']['value'].split('=')[0]
-            po_pair = '{}={}'.format(result['p']['value'], result['o']['value'])
-            
-            annotations_map.setdefault(cell_name, office.Annotation())
-            annot = annotations_map[cell_name]
-            annot.addElement(P(text=po_pair))
-            
+        results = self.sparql.run_select_iter(QUERY_ANNOTATIONS, sparql_params)
+        annotations = {}
+        for (sheet, cell_name, p, o) in results:
+            match = SHEET_INDEX.search(unicode(sheet))
+            if match == None:
+                log.warning('[{}] Unknown sheet {}'.format(basename, sheet))
+                continue
+            cell_name = unicode(cell_name).split('=')[0]
+            cells = annotations.setdefault(int(match.group(1)), {})
+            cells.setdefault(cell_name, []).append(u'{}={}'.format(p, o))
+        return annotations
+        
+    def _process_sheet(self, basename, sheet, annotations):
+        """
+        Process a sheet, injecting the (property, value) pairs of its cells
+        """        
         log.debug('[{}] Inject the annotations'.format(basename))
+        positions = {}
+        for cell_name in annotations.iterkeys():
+            (rowIndex, colIndex) = parseCellName(cell_name)
+            positions.setdefault(rowIndex, []).append((colIndex, cell_name))
+        
+        # Only look at the rows with annotations, without expanding the
+        # repeated cells. The runs and the annotated cells of a row are both
+        # sorted by column so they are matched in a single pass
         rows = sheet.getElementsByType(TableRow)
-        for rowIndex in range(0, len(rows)):
-            cols = getColumns(rows[rowIndex])
-            for colIndex in range(0, len(cols)):
-                cell_obj = cols[colIndex]
-                if cell_obj == None:
-                    continue
-                        
-                # Get the cell name and the current style
-                cell_name = colName(colIndex) + str(rowIndex + 1)
-                
-                if cell_name in annotations_map:
-                    annot = annotations_map[cell_name]
+        for rowIndex in sorted(positions.keys()):
+            if rowIndex >= len(rows):
+                continue
+            cells = sorted(positions[rowIndex])
+            i = 0
+            for (first, count, cell_obj) in getColumnRuns(rows[rowIndex]):
+                if i == len(cells):
+                    break
+                while i < len(cells) and cells[i][0] < first + count:
+                    (colIndex, cell_name) = cells[i]
+                    i = i + 1
+                    if cell_obj == None:
+                        continue
+                    annot = office.Annotation()
+                    for po_pair in annotations[cell_name]:
+                        annot.addElement(P(text=po_pair))
                     log.debug('[{}] {} => {}'.format(basename, cell_name, annot))
                     cell_obj.addElement(annot)
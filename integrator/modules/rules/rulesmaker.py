@@ -1,15 +1,16 @@
-import bz2
 import datetime
 import pprint
 
-from rdflib import ConjunctiveGraph, RDF, URIRef
+from rdflib import RDF, URIRef
 from util.sparql import SPARQLWrap
-from rdflib.term import Literal, BNode
+from util.writer import TriplesWriter
+from rdflib.term import Literal
 from rdflib.namespace import RDFS, DCTERMS, XSD, Namespace
 from ConfigParser import SafeConfigParser
 
 from modules.tablinker.namespace import PROV, DCAT, OA
-from modules.rules.mappings import MappingsList
+from modules.rules.mappings import MappingsList, MappingIndex
+from util.manifest import hash_values
 
 import sys
 reload(sys)
@@ -35,12 +36,88 @@ WHERE {
 } 
 """
 
+# Same as HEADERS_QUERY for all the sheets at once
+ALL_HEADERS_QUERY = """
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#> 
+PREFIX tablinker: <http://bit.ly/cedar-tablink#>
+PREFIX dcterms: <http://purl.org/dc/terms/>
+
+SELECT DISTINCT ?sheet ?cell ?literal ?header_type ?dataset_name
+FROM __RAW_DATA__
+WHERE {
+    ?cell a ?header_type.
+    ?cell tablinker:value ?literal.
+    ?cell tablinker:sheet ?sheet. 
+    ?dataset dcterms:hasPart ?sheet.
+    ?dataset rdfs:label ?dataset_name.
+    FILTER (?header_type IN (tablinker:RowHeader,tablinker:ColumnHeader))
+    FILTER (?literal != "")
+} 
+"""
+
 INTEGRATOR_URI = URIRef("https://github.com/CEDAR-project/Integrator")
 
+# Terms used to describe the approximate matches
+CEDAR = Namespace("http://bit.ly/cedar#")
+
 import logging
 log = logging.getLogger(__name__)
 
     
+def _header_row(cell, literal, header_type, sheet_name, dataset_name):
+    '''
+    Turn the description of a header into the row used by RuleMaker
+    '''
+    cell_name = unicode(cell).split('/')[-1]
+    return [cell_name, unicode(literal), unicode(header_type), cell_name,
+            sheet_name, unicode(dataset_name)]
+
+def load_all_headers(end_point, graph_name, namespace):
+    '''
+    Fetch the headers of all the sheets at once and split them per sheet.
+    Returns a dictionary with the header rows of every sheet, indexed by
+    the name of the sheet (its URI without the namespace)
+    '''
+    sparql = SPARQLWrap(end_point)
+    sparql_params = {'__RAW_DATA__' : graph_name}
+    headers = {}
+    for page in sparql.run_select_pages(ALL_HEADERS_QUERY, sparql_params, 'cell'):
+        for result in page:
+            name = result['sheet']['value']
+            if name.startswith(namespace):
+                name = name[len(namespace):]
+            row = _header_row(result['cell']['value'],
+                              result['literal']['value'],
+                              result['header_type']['value'],
+                              name.split('/')[-1],
+                              result['dataset_name']['value'])
+            headers.setdefault(name, []).append(row)
+    log.info("Loaded the headers of {} sheets".format(len(headers)))
+    return headers
+    
+def load_mappings(mappingFilesPath, sections=None):
+    '''
+    Loads all the mapping files present in a given directory. The metadata
+    file is used to get the list of the files to load and also the
+    additional information such as the predicate name and the prefix
+    @input sections filter the sections to load
+    Returns a dictionary with the MappingsList of every section
+    '''
+    mappings = {}
+    metadata = SafeConfigParser()
+    metadata.read(mappingFilesPath + "/metadata.txt")
+    for section in metadata.sections():
+        if sections != None and section not in sections:
+            continue
+        try:
+            log.debug("Loading mapping section : {}".format(section))
+            data = dict(metadata.items(section))
+            data['path'] = mappingFilesPath
+            mappings[section] = MappingsList(data)
+        except Exception as e:
+            log.error("Error loading {} : {}".format(section, e))
+    return mappings
+    
 class RuleMaker(object):
     def __init__(self, end_point, dataset, output_file_name):
         """
@@ -49,6 +126,7 @@ class RuleMaker(object):
         self.dataset = dataset
         self.output_file_name = output_file_name
         self.mappings = {}
+        self.index = None
         self.headers = []
         
         # Compress by default
@@ -57,18 +135,18 @@ class RuleMaker(object):
         # The location of the SPARQL end_point
         self.end_point = end_point
 
-        # Create the graph
-        self.graph = ConjunctiveGraph()
-        self.graph.bind('rdf', RDF)
-        self.graph.bind('rdfs', RDFS)
-        self.graph.bind('prov', PROV)
-        self.graph.bind('dcat', DCAT)
-        self.graph.bind('oa', OA)
-        self.graph.bind('dcterms', DCTERMS)
-    
         # Set a default namespace
         self.data_ns = Namespace("http://example.org/")
-        self.graph.bind('data', self.data_ns)
+        
+        # Bindings of the output
+        self.namespaces = {'rdf'        : RDF,
+                           'rdfs'       : RDFS,
+                           'xsd'        : XSD,
+                           'prov'       : PROV,
+                           'dcat'       : DCAT,
+                           'oa'         : OA,
+                           'dcterms'    : DCTERMS,
+                           'cedarterms' : CEDAR}
         
     def set_target_namespace(self, namespace):
         """
@@ -76,8 +154,6 @@ class RuleMaker(object):
         data generated
         """
         self.data_ns = Namespace(namespace)
-        self.graph.namespace_manager.bind('data', self.data_ns, 
-                                          override=True, replace=True)
     
     def set_compress(self, value):
         """
@@ -87,86 +163,206 @@ class RuleMaker(object):
         
     def process(self, dims=None):
         '''
-        Function used to process one of the sheets in the data sets
+        Function used to process one of the sheets in the data sets. The
+        annotations are streamed to the output as they are made
         '''
+        writer = None
         try:
             if dims == None:
                 dims = sorted(self.mappings.keys())
                 
-            # Mint a URI for the activity
+            # Mint a URI for the activity, and for the approximate matching
             activity_URI = URIRef(self.dataset + '-mapping-activity')
+            approximate_URI = URIRef(self.dataset + '-approximate-mapping-activity')
     
-            # Keep the start time
+            # Keep the start time, also used as the time of serialisation of
+            # all the annotations
             startTime = self._now()
+            
+            # Open the output
+            writer = TriplesWriter(self.output_file_name, 'turtle', self.compress_output)
+            for (prefix, namespace) in sorted(self.namespaces.iteritems()):
+                writer.bind(prefix, namespace)
+            writer.bind('data', self.data_ns)
+            # Also bind the namespaces of the predicates of the mappings
+            bound = set([unicode(n) for (_, n) in writer.namespaces()])
+            namespaces = set([self.mappings[dim].get_namespace() for dim in dims])
+            for (n, namespace) in enumerate(sorted(namespaces - bound)):
+                writer.bind('ns{}'.format(n + 1), namespace)
                 
+            # Annotate all the headers in one pass over them
+            (counts, approximate_counts) = self._process_mappings(writer,
+                activity_URI, approximate_URI, dims, startTime)
+            
             for dim in dims:
-                log.debug("[{}] Processing mappings : {}".format(self.dataset, dim))
-                count = self._process_mapping(self.graph, activity_URI, dim)
-                
-                if count != 0:
+                if counts.get(dim, 0) != 0 or approximate_counts.get(dim, 0) != 0:
                     # Describe the file used
                     mappingFileDSURI = activity_URI + '-' + dim 
                     mappingFileDistURI = mappingFileDSURI + '-dist'
-                    self.graph.add((activity_URI, PROV.used, mappingFileDSURI))
-                    self.graph.add((mappingFileDSURI, RDF.type, DCAT.Dataset))
-                    self.graph.add((mappingFileDSURI, RDFS.label, Literal(dim)))
-                    self.graph.add((mappingFileDSURI, DCAT.distribution, mappingFileDistURI))
-                    self.graph.add((mappingFileDistURI, RDF.type, DCAT.Distribution))
-                    self.graph.add((mappingFileDistURI, RDFS.label, Literal(self.mappings[dim].get_file_name())))
-                    self.graph.add((mappingFileDistURI, DCTERMS.accessURL, self.mappings[dim].get_src_URI()))
+                    if counts.get(dim, 0) != 0:
+                        writer.add((activity_URI, PROV.used, mappingFileDSURI))
+                    if approximate_counts.get(dim, 0) != 0:
+                        writer.add((approximate_URI, PROV.used, mappingFileDSURI))
+                    writer.add((mappingFileDSURI, RDF.type, DCAT.Dataset))
+                    writer.add((mappingFileDSURI, RDFS.label, Literal(dim)))
+                    writer.add((mappingFileDSURI, DCAT.distribution, mappingFileDistURI))
+                    writer.add((mappingFileDistURI, RDF.type, DCAT.Distribution))
+                    writer.add((mappingFileDistURI, RDFS.label, Literal(self.mappings[dim].get_file_name())))
+                    writer.add((mappingFileDistURI, DCTERMS.accessURL, self.mappings[dim].get_src_URI()))
                 
             # Keep the end time
             endTime = self._now()
             
             # Finish describing the activity
-            self.graph.add((activity_URI, RDF.type, PROV.Activity))
-            self.graph.add((activity_URI, RDFS.label, Literal("Annotate")))
-            self.graph.add((activity_URI, PROV.startedAtTime, startTime))
-            self.graph.add((activity_URI, PROV.endedAtTime, endTime))
-            self.graph.add((activity_URI, PROV.wasAssociatedWith, INTEGRATOR_URI))
+            writer.add((activity_URI, RDF.type, PROV.Activity))
+            writer.add((activity_URI, RDFS.label, Literal("Annotate")))
+            writer.add((activity_URI, PROV.startedAtTime, startTime))
+            writer.add((activity_URI, PROV.endedAtTime, endTime))
+            writer.add((activity_URI, PROV.wasAssociatedWith, INTEGRATOR_URI))
+            
+            # Describe the approximate matching apart, for its results to
+            # be told from the ones of the mapping files
+            if len(approximate_counts) != 0:
+                log.info("[{}] Matched {} headers approximately".format(self.dataset, sum(approximate_counts.values())))
+                writer.add((approximate_URI, RDF.type, PROV.Activity))
+                writer.add((approximate_URI, RDFS.label, Literal("Annotate approximately")))
+                writer.add((approximate_URI, PROV.startedAtTime, startTime))
+                writer.add((approximate_URI, PROV.endedAtTime, endTime))
+                writer.add((approximate_URI, PROV.wasAssociatedWith, INTEGRATOR_URI))
     
-            # Save the graph
-            log.info("[{}] Saving {} triples.".format(self.dataset, len(self.graph)))
-            try:
-                out = bz2.BZ2File(self.output_file_name + '.bz2', 'wb', compresslevel=9) if self.compress_output else open(self.output_file_name, "w")
-                self.graph.serialize(destination=out, format='n3')
-                out.close()
-            except:
-                log.error("[{}] Whoops! Something went wrong in serialising to output file".format(self.dataset))
+            log.info("[{}] Saved {} triples.".format(self.dataset, len(writer)))
         
         except:
             log.error("[{}] Something bad happened: {}".format(self.dataset, sys.exc_info()[0]))
+        
+        finally:
+            if writer != None:
+                try:
+                    writer.close()
+                except:
+                    log.error("[{}] Whoops! Something went wrong in serialising to output file".format(self.dataset))
+            
+    def get_signature(self):
+        '''
+        Returns a signature of everything the rules depend on: the headers
+        and, for every section of the mappings, its settings and the entries
+        for the literals of the headers
+        '''
+        values = [repr(sorted(self.headers))]
+        literals = sorted(set([header[1] for header in self.headers]))
+        for dim in sorted(self.mappings.keys()):
+            values.append(dim)
+            values.append(self.mappings[dim].get_signature(literals))
+        return hash_values(*values)
             
-    def _process_mapping(self, graph, activity_URI, dimension_name):
-        count = 0
+    def _process_mappings(self, writer, activity_URI, approximate_URI, dims, timestamp):
+        '''
+        Annotate the headers mapped by the given sections, returns the number
+        of headers annotated per section and the number of headers annotated
+        per section from an approximate match
+        '''
+        counts = {}
+        approximate_counts = {}
+        selected = set(dims)
+        index = self._get_index()
         
-        # Process all the headers one by one
-        mappings_list = self.mappings[dimension_name]
+        # The bodies already written, shared by all the annotations having
+        # the same content. Indexed by content and by URI
+        bodies = {}
+        
+        # Process all the headers one by one, once
+        done = set()
         for header in self.headers:
             [_, literal, _, cell_name, sheet_name, dataset_name] = header
+            if (cell_name, literal) in done:
+                continue
+            done.add((cell_name, literal))
             context_map = {'cell' : cell_name,
                            'sheet': sheet_name,
                            'dataset' : dataset_name}
-            pairs = mappings_list.get_mappings_for(literal, context_map)
+            hits = [(section, pairs)
+                    for (section, pairs) in index.get_mappings_for(literal, context_map)
+                    if section in selected]
+            
+            # Try the approximate matching for the sections not mapping it
+            missing = selected - set([section for (section, _) in hits])
+            approximate_hits = index.get_approximate_mappings_for(literal, context_map, missing)
+            if len(approximate_hits) != 0:
+                self._add_approximate(writer, approximate_URI, cell_name,
+                                      approximate_hits, timestamp, bodies)
+                for (section, _, _, _) in approximate_hits:
+                    approximate_counts[section] = approximate_counts.get(section, 0) + 1
+            
+            if len(hits) == 0:
+                continue
+            
+            # Get the bodies first, for the annotation to be written in one go
+            body_URIs = []
+            for (section, pairs) in hits:
+                counts[section] = counts.get(section, 0) + 1
+                body_URIs.append(self._get_body(writer, pairs, bodies))
+            
+            # Mint URIs
             cell_uri = self.data_ns[cell_name]
-            if pairs != None:
-                count = count + 1
-                # Mint URIs
-                annotation_URI = URIRef(cell_uri + "-mapping")
-                annotation_body_URI = BNode()
-                # Add the triples
-                graph.add((annotation_URI, RDF.type, OA.Annotation))
-                graph.add((annotation_URI, RDFS.label, Literal('Mapping')))
-                graph.add((annotation_URI, OA.hasBody, annotation_body_URI))
-                graph.add((annotation_URI, OA.hasTarget, cell_uri))
-                graph.add((annotation_URI, OA.serializedAt, self._now()))
-                graph.add((annotation_URI, OA.serializedBy, INTEGRATOR_URI))
-                graph.add((annotation_URI, PROV.wasGeneratedBy, activity_URI))
-                for pair in pairs:
-                    (p,o) = pair
-                    graph.add((annotation_body_URI, p, o))
+            annotation_URI = URIRef(cell_uri + "-mapping")
+            # Add the triples
+            writer.add((annotation_URI, RDF.type, OA.Annotation))
+            writer.add((annotation_URI, RDFS.label, Literal('Mapping')))
+            writer.add((annotation_URI, OA.hasTarget, cell_uri))
+            writer.add((annotation_URI, OA.serializedAt, timestamp))
+            writer.add((annotation_URI, OA.serializedBy, INTEGRATOR_URI))
+            writer.add((annotation_URI, PROV.wasGeneratedBy, activity_URI))
+            for body_URI in body_URIs:
+                writer.add((annotation_URI, OA.hasBody, body_URI))
                      
-        return count
+        return (counts, approximate_counts)
+    
+    def _get_body(self, writer, pairs, bodies):
+        '''
+        Get the URI of the body made of some pairs, written the first time
+        it is used. The URI is derived from the pairs so the identical
+        bodies of a sheet are only written once. The digest is cut short,
+        unless two bodies of the sheet would then get the same URI
+        '''
+        key = tuple(pairs)
+        if key not in bodies:
+            digest = hash_values(*[p.n3() + o.n3() for (p, o) in pairs])
+            body_URI = self.data_ns[self.dataset + '-m-' + digest[:8]]
+            if body_URI in bodies:
+                body_URI = self.data_ns[self.dataset + '-m-' + digest]
+            for (p, o) in pairs:
+                writer.add((body_URI, p, o))
+            bodies[key] = body_URI
+            bodies[body_URI] = key
+        return bodies[key]
+    
+    def _add_approximate(self, writer, approximate_URI, cell_name, hits, timestamp, bodies):
+        '''
+        Annotate a header with the mappings of the literals it matched
+        approximately, in an annotation per section recording the literal
+        matched and the score of the match
+        '''
+        cell_uri = self.data_ns[cell_name]
+        for (section, pairs, matched, score) in hits:
+            annotation_URI = URIRef(cell_uri + "-approximate-mapping-" + section)
+            body_URI = self._get_body(writer, pairs, bodies)
+            writer.add((annotation_URI, RDF.type, OA.Annotation))
+            writer.add((annotation_URI, RDFS.label, Literal('Approximate mapping')))
+            writer.add((annotation_URI, OA.hasTarget, cell_uri))
+            writer.add((annotation_URI, OA.serializedAt, timestamp))
+            writer.add((annotation_URI, OA.serializedBy, INTEGRATOR_URI))
+            writer.add((annotation_URI, PROV.wasGeneratedBy, approximate_URI))
+            writer.add((annotation_URI, CEDAR.matchedLiteral, Literal(matched)))
+            writer.add((annotation_URI, CEDAR.matchScore, Literal(str(score), datatype=XSD.decimal)))
+            writer.add((annotation_URI, OA.hasBody, body_URI))
+    
+    def _get_index(self):
+        '''
+        Get the index of the mappings, compiled on first use if none was set
+        '''
+        if self.index == None:
+            self.index = MappingIndex(self.mappings)
+        return self.index
                
     def _now(self):
         '''
@@ -184,41 +380,37 @@ class RuleMaker(object):
         sparql = SPARQLWrap(self.end_point)
         sparql_params = {'__DATA_SET__' : self.data_ns[self.dataset].n3(),
                          '__RAW_DATA__' : graph_name}
-        results = sparql.run_select(HEADERS_QUERY, sparql_params)
-        for result in results:
-            # Parse the result
-            cell = result['cell']['value']
-            cell_name = cell.split('/')[-1]
-            header_type = result['header_type']['value']
-            dataset_name = result['dataset_name']['value']
-            sheet_name = self.dataset.split('/')[-1] 
-            literal = result['literal']['value']
-            row = [cell_name, literal, header_type, cell_name, sheet_name, dataset_name]
+        results = sparql.run_select_iter(HEADERS_QUERY, sparql_params)
+        sheet_name = self.dataset.split('/')[-1] 
+        for (cell, literal, header_type, dataset_name) in results:
             # Save to the headers list
+            row = _header_row(cell, literal, header_type, sheet_name, dataset_name)
             self.headers.append(row)
 
         log.info("[{}] Loaded {} headers".format(self.dataset, len(self.headers)))
         
+    def setHeaders(self, headers):
+        '''
+        Set the headers to use instead of loading them, as returned for the
+        sheet by load_all_headers
+        '''
+        self.headers = list(headers)
+        log.info("[{}] Got {} headers".format(self.dataset, len(self.headers)))
+        
     def loadMappings(self, mappingFilesPath, sections=None):
         '''
-        Loads all the mapping files present in a given directory. The metadata
-        file is used to get the list of the files to load and also the
-        additional information such as the predicate name and the prefix
-        @input sections filter the sections to load
+        Loads all the mapping files present in a given directory, see
+        load_mappings
         '''
-        # Read the metadata file
         log.info("[{}] Loading mappings".format(self.dataset))
-        metadata = SafeConfigParser()
-        metadata.read(mappingFilesPath + "/metadata.txt")
-        for section in metadata.sections():
-            if sections != None and section not in sections:
-                continue
-            try:
-                log.debug("[{}] Loading mapping section : {}".format(self.dataset, section))
-                data = dict(metadata.items(section))
-                data['path'] = mappingFilesPath
-                mappingsList = MappingsList(data)
-                self.mappings[section] = mappingsList
-            except Exception as e:
-                log.error("[{}] Error loading {} : {}".format(self.dataset, section, e))
-              
+        self.mappings = load_mappings(mappingFilesPath, sections)
+        self.index = None
+        
+    def setMappings(self, mappings, index=None):
+        '''
+        Set the mappings to use instead of loading them, as returned by
+        load_mappings, and optionally their MappingIndex. They are only read
+        so the same mappings can be shared by several instances
+        '''
+        self.mappings = mappings
+        self.index = index
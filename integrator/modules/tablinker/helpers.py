@@ -3,31 +3,39 @@ import re
 from odf import text, office, dc
 from odf.namespaces import TABLENS, STYLENS
 
-def getColumns(row):
-    columns = []
-    node = row.firstChild
-    end = row.lastChild
-    while node != end:
-        (_, t) = node.qname
-        
+def getColumnRuns(row):
+    """
+    Get the cells of a row as a list of (first column, number of columns,
+    cell) runs. Repeated cells are not expanded, covered cells are None
+    """
+    runs = []
+    first = 0
+    for node in row.childNodes:
         # Focus on (covered) table cells only
+        if node.nodeType != node.ELEMENT_NODE:
+            continue
+        (_, t) = node.qname
         if t != 'covered-table-cell' and t != 'table-cell':
             continue
         
-        # If the cell is covered insert a None, otherwise use the cell
+        # If the cell is covered use None, otherwise use the cell
         n = node if t == 'table-cell' else None
-        columns.append(n)
         
         # Shall we repeat this ?
         repeat = node.getAttrNS(TABLENS, 'number-columns-repeated')
-        if repeat != None:
-            repeat = int(repeat) - 1
-            while repeat != 0:
-                columns.append(n)
-                repeat = repeat - 1
+        count = int(repeat) if repeat != None else 1
         
-        # Move to next node
-        node = node.nextSibling
+        runs.append((first, count, n))
+        first = first + count
+    return runs
+
+def getColumns(row):
+    """
+    Get the cells of a row with one entry per column, covered cells are None
+    """
+    columns = []
+    for (_, count, n) in getColumnRuns(row):
+        columns.extend([n] * count)
     return columns
 
 def colName(number):
@@ -39,6 +47,30 @@ def colName(number):
         number = number // length - 1
     return output
 
+# Names of the first columns, computed once
+COLUMN_NAMES = [colName(number) for number in range(1024)]
+
+def getColName(number):
+    if number < len(COLUMN_NAMES):
+        return COLUMN_NAMES[number]
+    return colName(number)
+
+def colIndex(name):
+    """
+    Get the index of a column from its name, the inverse of colName
+    """
+    number = 0
+    for c in name:
+        number = number * 26 + ord(c) - ord('A') + 1
+    return number - 1
+
+def parseCellName(name):
+    """
+    Get the (row, column) indexes of a cell from its name (ex: "AB12")
+    """
+    split = len(name.rstrip('0123456789'))
+    return (int(name[split:]) - 1, colIndex(name[:split]))
+
 
 def getText(cell_obj):
     val = []
@@ -47,15 +79,46 @@ def getText(cell_obj):
             val.append(str(c))
     return ' '.join(val)
 
+# White spaces turned into a single space by clean_string
+SPACES = re.compile(r'\s+')
+
+# Unicode white spaces not matched by SPACES, in their presence the fast way
+# of cleaning would give a different result
+OTHER_SPACES = re.compile(u'[%s]' % u''.join([unichr(c) for c in xrange(128, 0x10000)
+                                              if unichr(c).isspace()] + [u'\x1c-\x1f']))
+
+# Strings already cleaned, per type. Emptied when they get too large
+MAX_CLEANED = 100000
+_cleaned = {str : {}, unicode : {}}
+
+def _clean_string(text):
+    text_clean = text.lower()
+    if isinstance(text_clean, unicode):
+        if OTHER_SPACES.search(text_clean) != None:
+            # Shrink the spaces, remove the lead and trailing ones
+            return SPACES.sub(u' ', text_clean).strip()
+        # Same as above when the spaces split on are the ones of SPACES
+        return u' '.join(text_clean.split())
+    return ' '.join(text_clean.split())
+
 def clean_string(text):
     """
-    Utility function to clean a string
-    TODO speed this up
+    Utility function to clean a string: lower it and shrink its white spaces
+    """
+    cleaned = _cleaned.get(type(text))
+    if cleaned == None:
+        return _clean_string(text)
+    try:
+        return cleaned[text]
+    except KeyError:
+        if len(cleaned) >= MAX_CLEANED:
+            cleaned.clear()
+        text_clean = _clean_string(text)
+        cleaned[text] = text_clean
+        return text_clean
+
+def clean_strings(texts):
+    """
+    Clean a list (or any iterable) of strings, see clean_string
     """
-    # Lower and remove new lines
-    text_clean = text.lower().replace('\n', ' ').replace('\r', ' ')
-    # Shrink spaces
-    text_clean = re.sub(r'\s+', ' ', text_clean)
-    # Remove lead and trailing whitespace
-    text_clean = text_clean.strip()
-    return text_clean
+    return [clean_string(text) for text in texts]
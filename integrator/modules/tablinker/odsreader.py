@@ -0,0 +1,356 @@
+"""
+Streaming reader for ODS workbooks. The content of the workbook is read
+straight from the "content.xml" entry of the archive with a SAX parser and
+handed over one row at a time, so the memory used only depends on the width
+of the rows and not on the size of the workbook.
+"""
+import re
+import zipfile
+import xml.sax
+from collections import deque
+from xml.sax.handler import ContentHandler, feature_namespaces
+
+from odf.namespaces import TABLENS, STYLENS, TEXTNS, OFFICENS, DCNS
+
+# Amount of uncompressed XML fed to the parser at once
+READ_SIZE = 64 * 1024
+
+# Declaration of the prefix of the table namespace in the content
+TABLE_PREFIX = re.compile(r'xmlns:([\w.-]+)="' + re.escape(TABLENS) + '"')
+
+import logging
+log = logging.getLogger(__name__)
+
+class ODSAnnotation(object):
+    """
+    An annotation (comment) attached to a cell
+    """
+    def __init__(self):
+        self.text = ''
+        self.author = None
+        self.date = None
+
+class ODSCell(object):
+    """
+    A non covered cell of a sheet
+    """
+    def __init__(self, style, rows_spanned, columns_spanned):
+        # The name of the style as found in the document (ex: "ce12")
+        self.style = style
+        # The span of the cell, None if the attribute is not set
+        self.rows_spanned = rows_spanned
+        self.columns_spanned = columns_spanned
+        # The paragraphs of the cell joined by a space
+        self.text = ''
+        # The first annotation, if any
+        self.annotation = None
+
+class ODSSheet(object):
+    """
+    A sheet of the workbook. The rows can only be iterated over once.
+    """
+    def __init__(self, name, events):
+        self.name = name
+        self._events = events
+        self._done = False
+
+    def rows(self):
+        """
+        Iterate over all the rows of the sheet as (index, runs) pairs. The
+        runs are (first column, number of columns, cell) tuples for the cells
+        of the row, repeated cells are not expanded. Covered cells are left
+        out
+        """
+        while not self._done:
+            event = next(self._events)
+            if event[0] == 'row':
+                yield (event[1], event[2])
+            elif event[0] == 'end':
+                self._done = True
+
+    def skip(self):
+        """
+        Consume all the remaining rows of the sheet
+        """
+        for _ in self.rows():
+            pass
+
+def _int_attr(attrs, name):
+    value = attrs.get((TABLENS, name))
+    if value != None:
+        value = int(value)
+    return value
+
+class _Handler(ContentHandler):
+    """
+    SAX handler turning the XML content into a list of events
+    """
+    def __init__(self, styles, events, text_filter):
+        ContentHandler.__init__(self)
+        self.styles = styles
+        self.events = events
+        self.text_filter = text_filter
+        # Depth of the current element
+        self.depth = 0
+        # Index of the current row and column
+        self.row_index = -1
+        self.col = 0
+        # Depth of the table, the cell and the annotation we are in
+        self.table_depth = None
+        self.cell_depth = None
+        self.annotation_depth = None
+        # Runs of the current row, current cell and if we want its text
+        self.row = None
+        self.cell = None
+        self.cell_text = False
+        # Where the current text goes, and the paragraphs of the cell
+        self.buffer = None
+        self.buffer_depth = None
+        self.target = None
+        self.paragraphs = None
+        self.annotation_paragraphs = None
+
+    def startElementNS(self, name, qname, attrs):
+        self.depth = self.depth + 1
+        (ns, tag) = name
+
+        if ns == STYLENS and tag == 'style':
+            parent = attrs.get((STYLENS, 'parent-style-name'))
+            if parent != None:
+                self.styles[attrs.get((STYLENS, 'name'))] = parent
+
+        elif ns == TABLENS and tag == 'table' and self.table_depth == None:
+            self.table_depth = self.depth
+            self.row_index = -1
+            self.events.append(('sheet', attrs.get((TABLENS, 'name'))))
+
+        elif ns == TABLENS and tag == 'table-row' and self.table_depth != None:
+            self.row_index = self.row_index + 1
+            self.row = []
+            self.col = 0
+
+        elif ns == TABLENS and tag in ('table-cell', 'covered-table-cell') and self.row != None and self.cell_depth == None:
+            first = self.col
+            self.col = self.col + (_int_attr(attrs, 'number-columns-repeated') or 1)
+            if tag == 'table-cell':
+                style = attrs.get((TABLENS, 'style-name'))
+                self.cell = ODSCell(style,
+                                    _int_attr(attrs, 'number-rows-spanned'),
+                                    _int_attr(attrs, 'number-columns-spanned'))
+                self.cell_depth = self.depth
+                self.cell_text = self.text_filter == None or self.text_filter(style)
+                self.paragraphs = []
+                self.row.append((first, self.col - first, self.cell))
+
+        elif self.cell_depth != None:
+            if ns == OFFICENS and tag == 'annotation' and self.depth == self.cell_depth + 1 and self.cell.annotation == None:
+                self.cell.annotation = ODSAnnotation()
+                self.annotation_depth = self.depth
+                self.annotation_paragraphs = []
+            elif self.buffer == None:
+                if self.annotation_depth != None and self.depth == self.annotation_depth + 1:
+                    # Direct children of the annotation
+                    if ns == TEXTNS and tag == 'p':
+                        self._start_text('p')
+                    elif ns == DCNS and tag == 'creator' and self.cell.annotation.author == None:
+                        self._start_text('author')
+                    elif ns == DCNS and tag == 'date' and self.cell.annotation.date == None:
+                        self._start_text('date')
+                elif self.cell_text and self.depth == self.cell_depth + 1 and ns == TEXTNS and tag == 'p':
+                    # Paragraph of the cell
+                    self._start_text('p')
+
+    def endElementNS(self, name, qname):
+        (ns, tag) = name
+        if self.buffer != None and self.depth == self.buffer_depth:
+            self._end_text()
+
+        if self.depth == self.annotation_depth:
+            self.cell.annotation.text = ' '.join(self.annotation_paragraphs)
+            self.annotation_depth = None
+        elif self.depth == self.cell_depth:
+            self.cell.text = ' '.join(self.paragraphs)
+            self.cell_depth = None
+            self.cell = None
+        elif ns == TABLENS and tag == 'table-row' and self.row != None:
+            self.events.append(('row', self.row_index, self.row))
+            self.row = None
+        elif self.depth == self.table_depth:
+            self.events.append(('end',))
+            self.table_depth = None
+
+        self.depth = self.depth - 1
+
+    def characters(self, content):
+        if self.buffer != None:
+            self.buffer.append(content)
+
+    def _start_text(self, target):
+        self.buffer = []
+        self.buffer_depth = self.depth
+        self.target = target
+
+    def _end_text(self):
+        value = u''.join(self.buffer)
+        if self.target == 'author':
+            self.cell.annotation.author = value
+        elif self.target == 'date':
+            self.cell.annotation.date = value
+        elif self.annotation_depth != None:
+            self.annotation_paragraphs.append(value)
+        else:
+            self.paragraphs.append(value)
+        self.buffer = None
+        self.target = None
+
+class ODSReader(object):
+    def __init__(self, file_name):
+        """
+        Constructor
+        """
+        self.file_name = file_name
+
+        # Get the text of all the cells by default
+        self.text_filter = None
+        
+        # Read the content from the archive by default
+        self.content_file = None
+        
+        # Parent of all the styles, the automatic styles from the content
+        # are added when the content is read
+        self.styles = {}
+        self._parse('styles.xml', deque())
+        
+    def set_text_filter(self, text_filter):
+        """
+        Set a function called with the style name of every cell to decide
+        if its text has to be extracted. The annotations are always extracted
+        """
+        self.text_filter = text_filter
+        
+    def set_content_file(self, content_file):
+        """
+        Read the content from an XML file, as written by split(), instead of
+        the "content.xml" entry of the archive
+        """
+        self.content_file = content_file
+        
+    def split(self, file_names):
+        """
+        Split the content of the workbook into as many XML files as there are
+        file names, without parsing it. The sheets are dealt in turn to the
+        files and left empty in the others so that they keep their index.
+        Returns the number of sheets
+        """
+        outputs = [open(file_name, 'wb') for file_name in file_names]
+        try:
+            with zipfile.ZipFile(self.file_name) as archive:
+                content = archive.open('content.xml')
+                data = content.read(READ_SIZE)
+                match = TABLE_PREFIX.search(data)
+                prefix = match.group(1) if match != None else 'table'
+                start = re.compile(r'<{}:table[\s>/]'.format(re.escape(prefix)))
+                end = '</{}:table>'.format(prefix)
+                owner = None
+                nb_sheets = 0
+                while True:
+                    if owner == None:
+                        # Copy everything up to the next sheet to all the
+                        # files, along with its start tag
+                        match = start.search(data)
+                        tag_end = -1
+                        if match != None:
+                            tag_end = data.find('>', match.start())
+                        if tag_end != -1:
+                            for output in outputs:
+                                output.write(data[:tag_end + 1])
+                            if data[tag_end - 1] != '/':
+                                owner = outputs[nb_sheets % len(outputs)]
+                            nb_sheets = nb_sheets + 1
+                            data = data[tag_end + 1:]
+                            continue
+                        keep = len(end) if match == None else len(data) - match.start()
+                    else:
+                        # Copy the sheet to its file and end it everywhere
+                        index = data.find(end)
+                        if index != -1:
+                            owner.write(data[:index])
+                            for output in outputs:
+                                output.write(end)
+                            owner = None
+                            data = data[index + len(end):]
+                            continue
+                        keep = len(end)
+                    more = content.read(READ_SIZE)
+                    if not more:
+                        if owner != None:
+                            raise ValueError('Unterminated sheet in {}'.format(self.file_name))
+                        for output in outputs:
+                            output.write(data)
+                        break
+                    # Keep what could be the beginning of a tag
+                    keep = min(keep, len(data))
+                    for output in ([owner] if owner != None else outputs):
+                        output.write(data[:len(data) - keep])
+                    data = data[len(data) - keep:] + more
+        finally:
+            for output in outputs:
+                output.close()
+        return nb_sheets
+
+    def sheets(self):
+        """
+        Iterate over all the sheets of the workbook
+        """
+        events = self._events('content.xml')
+        for event in events:
+            if event[0] == 'sheet':
+                sheet = ODSSheet(event[1], events)
+                yield sheet
+                sheet.skip()
+
+    def _parse(self, entry, events):
+        """
+        Parse a complete entry of the archive
+        """
+        for _ in self._events(entry, events):
+            pass
+
+    def _events(self, entry, events=None):
+        """
+        Stream an entry of the archive through the SAX handler and yield the
+        events it produces
+        """
+        if events == None:
+            events = deque()
+        handler = _Handler(self.styles, events, self.text_filter)
+        return self._feed(entry, handler, events)
+
+    def _feed(self, entry, handler, events):
+        """
+        Feed an entry of the archive to a SAX handler, yielding the events
+        put in the queue as they come
+        """
+        parser = xml.sax.make_parser()
+        parser.setFeature(feature_namespaces, True)
+        parser.setContentHandler(handler)
+        with zipfile.ZipFile(self.file_name) as archive:
+            if entry == 'content.xml' and self.content_file != None:
+                content = open(self.content_file, 'rb')
+            elif entry in archive.namelist():
+                content = archive.open(entry)
+            else:
+                log.debug('No {} in {}'.format(entry, self.file_name))
+                return
+            try:
+                data = content.read(READ_SIZE)
+                while data:
+                    parser.feed(data)
+                    while events:
+                        yield events.popleft()
+                    data = content.read(READ_SIZE)
+            finally:
+                content.close()
+            parser.close()
+            while events:
+                yield events.popleft()
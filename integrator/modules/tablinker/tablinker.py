@@ -10,22 +10,63 @@ sys.setdefaultencoding("utf8")  # @UndefinedVariable
 import bz2
 import os.path
 import datetime
+import shutil
+import tempfile
+import multiprocessing
 
 from namespace import TABLINKER, DCAT, PROV, OA
-from helpers import getColumns, colName, getText, clean_string
+from helpers import getColName, clean_string
+from odsreader import ODSReader
+from util.writer import TriplesWriter
 
 from rdflib import ConjunctiveGraph, Literal, URIRef, Namespace
 from rdflib.namespace import RDF, RDFS, XSD, DCTERMS
 
-from odf import text, office, dc
-from odf.opendocument import load
-from odf.table import Table, TableRow
-from odf.namespaces import TABLENS, STYLENS
-from odf.style import Style
-
 import logging
 logger = logging.getLogger(__name__)
 
+# Codes for the types of cells
+(UNMARKED, DATA, ROW_HEADER, HROW_HEADER, COL_HEADER, ROW_PROPERTY,
+ TITLE) = range(7)
+
+# Code associated to every style used to mark the cells
+CELL_TYPES = {'TL Data'        : DATA,
+              'TL RowHeader'   : ROW_HEADER,
+              'TL HRowHeader'  : HROW_HEADER,
+              'TL ColHeader'   : COL_HEADER,
+              'TL RowProperty' : ROW_PROPERTY,
+              'TL Title'       : TITLE}
+
+# Cells marked with these types make a sheet worth being described
+MARKED_TYPES = frozenset([DATA, ROW_HEADER, HROW_HEADER, COL_HEADER,
+                          ROW_PROPERTY])
+
+class Cell(object):
+    """
+    A cell being parsed
+    """
+    __slots__ = ['i', 'j', 'cell', 'name', 'type', 'value', 'isEmpty', 'URI',
+                 'sheetURI']
+    
+    def __init__(self, i, j, cell, name, cell_type, value, URI, sheetURI):
+        # Coordinates
+        self.i = i
+        self.j = j
+        # The cell itself
+        self.cell = cell
+        # The name of the cell
+        self.name = name
+        # The type of the cell
+        self.type = cell_type
+        # The (cleaned) value of the cell
+        self.value = value
+        # Is empty ?
+        self.isEmpty = value == ''
+        # Compose a resource name for the cell
+        self.URI = URI
+        # Pass on the URI of the data set
+        self.sheetURI = sheetURI
+
 class TabLinker(object):
     def __init__(self, input_file_name, output_file_name, processAnnotations=False):
         """
@@ -51,16 +92,21 @@ class TabLinker(object):
         # Compress by default
         self.set_compress(True)
         
+        # Serialise the graph in memory by default
+        self.set_output_format('n3')
+        
+        # Process the sheets one after the other by default
+        self.set_processes(1)
+        
         self.basename = os.path.basename(input_file_name).split('.')[0]
                 
         logger.info('[{}] Loading {}'.format(self.basename, input_file_name))
-        self.book = load(unicode(input_file_name))
-        self.stylesnames = {}
-        for style in self.book.getElementsByType(Style):
-            parentname = style.getAttrNS(STYLENS, 'parent-style-name')
-            name = style.getAttrNS(STYLENS, 'name')
-            if parentname != None:
-                self.stylesnames[name] = parentname
+        self.book = ODSReader(unicode(input_file_name))
+        self.stylesnames = self.book.styles
+        self.cell_types = {}
+        
+        # Only get the text of the cells that are going to be parsed
+        self.book.set_text_filter(self._isParsed)
             
     def set_target_namespace(self, namespace):
         """
@@ -77,6 +123,20 @@ class TabLinker(object):
         """
         self.compress_output = value
         
+    def set_output_format(self, value):
+        """
+        Set the format of the output. With 'n3' all the triples are kept in a
+        graph and serialised at the end, with 'nt' and 'turtle' they are
+        streamed to the output file as soon as they are produced
+        """
+        self.output_format = value
+        
+    def set_processes(self, value):
+        """
+        Set the number of processes the sheets of the workbook are split over
+        """
+        self.processes = value
+        
     def doLink(self):
         """
         Start processing all the sheets in workbook
@@ -86,26 +146,24 @@ class TabLinker(object):
         startTime = Literal(datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
                             datatype=XSD.dateTime)
 
-        sheets = self.book.getElementsByType(Table)
-        
-        # Process all the sheets
-        logger.info('[{}] Found {} sheets to process'.format(self.basename,len(sheets)))
-        sheetURIs = []
-        for n in range(len(sheets)) :
-            logger.debug('Processing sheet {0}'.format(n))
-            try:
-                (sheetURI, marked_count) = self.parseSheet(n, sheets[n])
-                if marked_count != 0:
-                    # Describe the sheet
-                    self.graph.add((sheetURI, RDF.type, TABLINKER.Sheet))
-                    self.graph.add((sheetURI, RDFS.label, Literal(sheetURI.replace(self.data_ns, ''))))
-                    self.graph.add((sheetURI, TABLINKER.value, Literal(sheets[n].getAttrNS(TABLENS, 'name'))))
-                    # Add it to the dataset
+        # Stream the triples to the output instead of keeping them around
+        if self.output_format != 'n3':
+            self.graph = self._open_writer(self.output_file_name,
+                                           self.output_format,
+                                           self.compress_output)
+
+        # Process all the sheets, they are streamed from the workbook
+        if self.processes > 1:
+            (nb_sheets, sheetURIs) = self._link_parallel()
+        else:
+            sheetURIs = []
+            nb_sheets = 0
+            for (n, sheet) in enumerate(self.book.sheets()):
+                nb_sheets = n + 1
+                sheetURI = self._link_sheet(n, sheet)
+                if sheetURI != None:
                     sheetURIs.append(sheetURI)
-            except Exception as detail:
-                logger.error("Error processing sheet %d of %s" % (n, self.basename))
-                logger.error(sys.exc_info()[0])
-                logger.error(detail)
+        logger.info('[{}] Processed {} sheets'.format(self.basename, nb_sheets))
             
         # end time for the conversion process
         endTime = Literal(datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
@@ -144,7 +202,7 @@ class TabLinker(object):
         self.graph.add((srcURI, RDF.type, DCAT.DataSet))
         self.graph.add((srcURI, RDFS.label, Literal(os.path.basename(self.input_file_name))))
         self.graph.add((srcURI, DCAT.distribution, srcdistURI))
-        self.graph.add((srcURI, TABLINKER.sheets, Literal(len(sheets))))
+        self.graph.add((srcURI, TABLINKER.sheets, Literal(nb_sheets)))
         
         # Describe the distribution of the source of the dataset
         self.graph.add((srcdistURI, RDF.type, DCAT.Distribution))
@@ -161,94 +219,173 @@ class TabLinker(object):
         # Save the graph
         logger.info('[{}] Saving {} triples'.format(self.basename,len(self.graph)))
         try :
-            out = bz2.BZ2File(self.output_file_name + '.bz2', 'wb', compresslevel=9) if self.compress_output else open(self.output_file_name, "w")
-            self.graph.serialize(destination=out, format='n3')
-            out.close()
+            if self.output_format == 'n3':
+                out = bz2.BZ2File(self.output_file_name + '.bz2', 'wb', compresslevel=9) if self.compress_output else open(self.output_file_name, "w")
+                self.graph.serialize(destination=out, format='n3')
+                out.close()
+            else:
+                self.graph.close()
         except :
             logging.error(self.basename + "Whoops! Something went wrong in serialising to output file")
             logging.info(sys.exc_info())
             traceback.print_exc(file=sys.stdout)
         
+    def link_part(self, index, parts_dir, output_format):
+        """
+        Process the share of sheets of one of the workers of _link_parallel,
+        the content of the book being the one split for it. Every sheet is
+        saved in its own uncompressed file in parts_dir.
+        Returns the number of sheets in the workbook and a list of
+        (index, sheet URI, part file, number of triples) for the sheets
+        processed
+        """
+        parts = []
+        nb_sheets = 0
+        for (n, sheet) in enumerate(self.book.sheets()):
+            nb_sheets = n + 1
+            if n % self.processes != index:
+                continue
+            part_file = os.path.join(parts_dir, 'S{}.part'.format(n))
+            self.graph = self._open_writer(part_file, output_format, False,
+                                           header=False)
+            sheetURI = self._link_sheet(n, sheet)
+            self.graph.close()
+            parts.append((n, sheetURI, part_file, len(self.graph)))
+        return (nb_sheets, parts)
+    
+    def _link_parallel(self):
+        """
+        Split the sheets of the workbook over several processes and merge
+        the outputs in the order of the sheets. The content of the workbook
+        is split beforehand for every process to only parse its own sheets
+        """
+        # The parts are hidden not to be pushed along with the outputs if
+        # they are left behind
+        parts_dir = tempfile.mkdtemp(prefix='.' + self.basename + '-',
+                                     dir=os.path.dirname(os.path.abspath(self.output_file_name)))
+        try:
+            contents = [os.path.join(parts_dir, 'content-{}.xml'.format(index))
+                        for index in range(self.processes)]
+            self.book.split(contents)
+            
+            part_format = 'nt' if self.output_format == 'n3' else self.output_format
+            tasks = []
+            for index in range(self.processes):
+                task = {'input_file'  : self.input_file_name,
+                        'output_file' : self.output_file_name,
+                        'annotations' : self.processAnnotations,
+                        'target'      : unicode(self.data_ns),
+                        'processes'   : self.processes,
+                        'index'       : index,
+                        'content'     : contents[index],
+                        'parts_dir'   : parts_dir,
+                        'format'      : part_format}
+                tasks.append(task)
+            
+            logger.info('[{}] Splitting the sheets over {} processes'.format(self.basename, self.processes))
+            pool = multiprocessing.Pool(processes=self.processes)
+            results = pool.map(link_part_thread, tasks)
+            pool.close()
+            pool.join()
+            
+            # Merge all the parts
+            nb_sheets = max([r[0] for r in results])
+            sheetURIs = []
+            for (_, sheetURI, part_file, count) in sorted([p for r in results for p in r[1]]):
+                if self.output_format == 'n3':
+                    self.graph.default_context.parse(part_file, format='nt')
+                else:
+                    self.graph.append(part_file, count)
+                if sheetURI != None:
+                    sheetURIs.append(sheetURI)
+        finally:
+            shutil.rmtree(parts_dir)
+        
+        return (nb_sheets, sheetURIs)
+    
+    def _link_sheet(self, n, sheet):
+        """
+        Process and describe one sheet. Returns the URI of the sheet or None
+        if it has no marked cell
+        """
+        logger.debug('Processing sheet {0}'.format(n))
+        try:
+            (sheetURI, marked_count) = self.parseSheet(n, sheet)
+            if marked_count != 0:
+                # Describe the sheet
+                self.graph.add((sheetURI, RDF.type, TABLINKER.Sheet))
+                self.graph.add((sheetURI, RDFS.label, Literal(sheetURI.replace(self.data_ns, ''))))
+                self.graph.add((sheetURI, TABLINKER.value, Literal(sheet.name)))
+                return sheetURI
+        except Exception as detail:
+            logger.error("Error processing sheet %d of %s" % (n, self.basename))
+            logger.error(sys.exc_info()[0])
+            logger.error(detail)
+        return None
+    
+    def _open_writer(self, file_name, output_format, compress, header=True):
+        """
+        Open a TriplesWriter using the same bindings as the current graph
+        """
+        writer = TriplesWriter(file_name, output_format, compress, header)
+        for (prefix, namespace) in self.graph.namespaces():
+            writer.bind(prefix, namespace)
+        return writer
+        
     def parseSheet(self, n, sheet):
         """
         Parses the currently selected sheet in the workbook, takes no arguments. Iterates over all cells in the Excel sheet and produces relevant RDF Triples. 
         """        
         # Define a sheetURI for the current sheet
         sheetURI = self.data_ns["{0}-S{1}".format(self.basename, n)]       
+        cellPrefix = unicode(sheetURI) + u'-'
         
         columnDimensions = {}
         row_dims = {}
         rowProperties = {}
         marked_count = 0
         
-        rows = sheet.getElementsByType(TableRow)
-        for rowIndex in range(0, len(rows)):
-            cols = getColumns(rows[rowIndex])
-            for colIndex in range(0, len(cols)):
-                cell_obj = cols[colIndex]
-                
-                if cell_obj == None:
+        for (rowIndex, runs) in sheet.rows():
+            rowName = str(rowIndex + 1)
+            for (first, count, cell_obj) in runs:
+                # Skip the cells we have nothing to do with
+                cellType = self.getType(cell_obj.style)
+                if cellType == UNMARKED and cell_obj.annotation == None:
                     continue
-                        
-                # Get the cell name and the current style
-                cellName = colName(colIndex) + str(rowIndex + 1)
                 
-                if len(cell_obj.getElementsByType(text.P)) == 0:
-                    literal = ''
-                else:
-                    literal = getText(cell_obj)
-                    if type(literal) == type(1.0):
-                        if literal.is_integer():
-                            literal = str(int(literal))
-                        else:
-                            literal = str(float(literal))
-                
-                cell = {
-                    # Coordinates
-                    'i' : rowIndex,
-                    'j' : colIndex,
-                    # The cell itself
-                    'cell' : cell_obj,
-                    # The sheet
-                    'sheet' : sheet,
-                    # The name of the cell
-                    'name' : cellName,
-                    # The type of the cell
-                    'type' : self.getStyle(cell_obj),
-                    # The (cleaned) value of the cell
-                    'value' : str(literal),
-                    # Is empty ?
-                    'isEmpty' : str(literal) == '',
-                    # Compose a resource name for the cell
-                    'URI' : URIRef("{0}-{1}".format(sheetURI, cellName)),
-                    # Pass on the URI of the data set
-                    'sheetURI' : sheetURI
-                }
+                literal = str(cell_obj.text)
                 
-                # logger.debug("({},{}) {}/{}: \"{}\"". format(i, j, cellType, cellName, cellValue))
-
-                # Increase the counter of marked cells
-                if cell['type'] in ['TL Data', 'TL RowHeader', 'TL HRowHeader', 'TL ColHeader', 'TL RowProperty']:
-                    marked_count = marked_count + 1
+                # Repeated cells are parsed once per column they cover
+                for colIndex in xrange(first, first + count):
+                    # Get the cell name and the current style
+                    cellName = getColName(colIndex) + rowName
                     
-                # Parse cell content
-                if cell['type'] == 'TL Data':
-                    self.handleData(cell, columnDimensions, row_dims)
-                elif cell['type'] == 'TL RowHeader' :
-                    self.handleRowHeader(cell, row_dims, rowProperties)
-                elif cell['type'] == 'TL HRowHeader' :
-                    self.handleHRowHeader(cell, row_dims, rowProperties)
-                elif cell['type'] == 'TL ColHeader' :
-                    self.handleColHeader(cell, columnDimensions)
-                elif cell['type'] == 'TL RowProperty' :
-                    self.handleRowProperty(cell, rowProperties)
-                elif cell['type'] == 'TL Title' :
-                    self.handleTitle(cell)
-
-                # Parse annotation if any and if their processing is enabled
-                annotations = cell_obj.getElementsByType(office.Annotation)
-                if len(annotations) != 0:
-                    self.handleAnnotation(cell, annotations[0])
+                    cell = Cell(rowIndex, colIndex, cell_obj, cellName, cellType,
+                                literal, URIRef(cellPrefix + cellName), sheetURI)
+                    
+                    # logger.debug("({},{}) {}/{}: \"{}\"". format(i, j, cellType, cellName, cellValue))
+    
+                    # Increase the counter of marked cells
+                    if cellType in MARKED_TYPES:
+                        marked_count = marked_count + 1
+                        
+                    # Parse cell content
+                    if cellType == DATA:
+                        self.handleData(cell, columnDimensions, row_dims)
+                    elif cellType == ROW_HEADER :
+                        self.handleRowHeader(cell, row_dims, rowProperties)
+                    elif cellType == HROW_HEADER :
+                        self.handleHRowHeader(cell, row_dims, rowProperties)
+                    elif cellType == COL_HEADER :
+                        self.handleColHeader(cell, columnDimensions)
+                    elif cellType == ROW_PROPERTY :
+                        self.handleRowProperty(cell, rowProperties)
+                    elif cellType == TITLE :
+                        self.handleTitle(cell)
+    
+                    # Parse annotation if any and if their processing is enabled
+                    if cell_obj.annotation != None:
+                        self.handleAnnotation(cell, cell_obj.annotation)
                 
         # Relate all the row properties to their row headers
         for rowDimension in row_dims:
@@ -269,56 +406,77 @@ class TabLinker(object):
         return (sheetURI, marked_count)
         
     def getStyle(self, cell):
-        stylename = cell.getAttrNS(TABLENS, 'style-name')
-        if stylename != None:
-            if stylename.startswith('ce'):
-                stylename = self.stylesnames[stylename]
-            stylename = stylename.replace('_20_', ' ') 
-        return stylename
+        return self._resolveStyle(cell.style)
+    
+    def getType(self, stylename):
+        """
+        Get the code of the type of cell marked with a style, the result is
+        cached
+        """
+        try:
+            return self.cell_types[stylename]
+        except KeyError:
+            cell_type = CELL_TYPES.get(self._resolveStyle(stylename), UNMARKED)
+            self.cell_types[stylename] = cell_type
+            return cell_type
+    
+    def _isParsed(self, stylename):
+        return self.getType(stylename) != UNMARKED
+    
+    def _resolveStyle(self, stylename):
+        """
+        Get the name of the (parent) style
+        """
+        resolved = stylename
+        if resolved != None:
+            if resolved.startswith('ce'):
+                resolved = self.stylesnames[resolved]
+            resolved = resolved.replace('_20_', ' ')
+        return resolved
     
     def handleData(self, cell, columnDimensions, row_dims) :
         """
         Create relevant triples for the cell marked as Data
         """
-        if cell['isEmpty']:
+        if cell.isEmpty:
             return
         
-        logger.debug("({},{}) Handle data cell".format(cell['i'], cell['j']))
+        logger.debug("({},{}) Handle data cell".format(cell.i, cell.j))
                 
         # Add the cell to the graph
         self._create_cell(cell, TABLINKER.DataCell)
             
         # Bind all the row dimensions
         try :
-            for dims in row_dims[cell['i']].itervalues():
+            for dims in row_dims[cell.i].itervalues():
                 for dim in dims:
-                    self.graph.add((cell['URI'], TABLINKER.dimension, dim))
+                    self.graph.add((cell.URI, TABLINKER.dimension, dim))
         except KeyError :
-            logger.debug("({},{}) No row dimension for cell".format(cell['i'], cell['j']))
+            logger.debug("({},{}) No row dimension for cell".format(cell.i, cell.j))
         
         # Bind all the column dimensions
         try :
-            for dim in columnDimensions[cell['j']]:
-                self.graph.add((cell['URI'], TABLINKER.dimension, dim))
+            for dim in columnDimensions[cell.j]:
+                self.graph.add((cell.URI, TABLINKER.dimension, dim))
         except KeyError :
-            logger.debug("({},{}) No column dimension for cell".format(cell['i'], cell['j']))
+            logger.debug("({},{}) No column dimension for cell".format(cell.i, cell.j))
         
     def handleRowHeader(self, cell, row_dims, rowProperties) :
         """
         Create relevant triples for the cell marked as RowHeader
         """
-        if cell['isEmpty']:
+        if cell.isEmpty:
             return
 
-        logger.debug("({},{}) Handle row header : {}".format(cell['i'], cell['j'], cell['value']))
+        logger.debug("({},{}) Handle row header : {}".format(cell.i, cell.j, cell.value))
         
         # Add the cell to the graph
         self._create_cell(cell, TABLINKER.RowHeader)
         
         # Get the row        
-        i = cell['i']
+        i = cell.i
         # Get the property for the column
-        j = cell['j']
+        j = cell.j
         try:
             prop = rowProperties[j]
         except exceptions.KeyError:
@@ -326,18 +484,17 @@ class TabLinker(object):
         
         row_dims.setdefault(i, {})
         row_dims[i].setdefault(prop, [])
-        row_dims[i][prop].append(cell['URI'])
+        row_dims[i][prop].append(cell.URI)
         
         # Look if we cover other cells verticaly 
-        rows_spanned = cell['cell'].getAttrNS(TABLENS, 'number-rows-spanned')
+        rows_spanned = cell.cell.rows_spanned
         if rows_spanned != None:
-            rows_spanned = int(rows_spanned)
             for extra in range(1, rows_spanned):
-                spanned_row = cell['i'] + extra
-                logger.debug("Span over ({},{})".format(spanned_row, cell['j']))
+                spanned_row = cell.i + extra
+                logger.debug("Span over ({},{})".format(spanned_row, cell.j))
                 row_dims.setdefault(spanned_row, {})
                 row_dims[spanned_row].setdefault(prop, [])
-                row_dims[spanned_row][prop].append(cell['URI'])
+                row_dims[spanned_row][prop].append(cell.URI)
  
     
     def handleHRowHeader(self, cell, row_dims, rowProperties) :
@@ -347,14 +504,14 @@ class TabLinker(object):
         that their intended value is stored somewhere else in the Excel sheet.
         """
         # Get the row        
-        i = cell['i']
+        i = cell.i
         # Get the property for the column
-        j = cell['j']
+        j = cell.j
         prop = rowProperties[j]
         
-        logger.debug("({},{}) Handle HRow header".format(cell['i'], cell['j']))
+        logger.debug("({},{}) Handle HRow header".format(cell.i, cell.j))
         
-        if (cell['isEmpty'] or cell['value'].lower() == 'id.' or cell['value'].lower() == 'id ') :
+        if (cell.isEmpty or cell.value.lower() == 'id.' or cell.value.lower() == 'id ') :
             # If the cell is empty, and a HierarchicalRowHeader, add the value of the row header above it.
             # If the cell is exactly 'id.', add the value of the row header above it.
             try:
@@ -364,48 +521,46 @@ class TabLinker(object):
             except:
                 pass
             # logger.debug("({},{}) Copied from above\nRow hierarchy: {}".format(i, j, rowValues[i]))
-        elif not cell['isEmpty']:
+        elif not cell.isEmpty:
             # Add the cell to the graph
             self._create_cell(cell, TABLINKER.RowHeader)
             row_dims.setdefault(i, {})
             row_dims[i].setdefault(prop, [])
-            row_dims[i][prop].append(cell['URI'])
+            row_dims[i][prop].append(cell.URI)
             # logger.debug("({},{}) Added value\nRow hierarchy {}".format(i, j, rowValues[i]))
 
         # Look if we cover other cells verticaly 
-        rows_spanned = cell['cell'].getAttrNS(TABLENS, 'number-rows-spanned')
+        rows_spanned = cell.cell.rows_spanned
         if rows_spanned != None:
-            rows_spanned = int(rows_spanned)
             for extra in range(1, rows_spanned):
-                spanned_row = cell['i'] + extra
-                logger.debug("Span over ({},{})".format(spanned_row, cell['j']))
+                spanned_row = cell.i + extra
+                logger.debug("Span over ({},{})".format(spanned_row, cell.j))
                 row_dims.setdefault(spanned_row, {})
                 row_dims[spanned_row].setdefault(prop, [])
-                row_dims[spanned_row][prop].append(cell['URI'])
+                row_dims[spanned_row][prop].append(cell.URI)
     
     def handleColHeader(self, cell, columnDimensions) :
         """
         Create relevant triples for the cell marked as Header
         """
         # Add the col header to the graph
-        logger.debug("({},{}) Add column header \"{}\"".format(cell['i'], cell['j'], cell['value']))
+        logger.debug("({},{}) Add column header \"{}\"".format(cell.i, cell.j, cell.value))
         self._create_cell(cell, TABLINKER.ColumnHeader)
         
         # If there is already a parent dimension, connect to it
-        if cell['j'] in columnDimensions:
-            self.graph.add((cell['URI'], TABLINKER.parentCell, columnDimensions[cell['j']][-1]))    
-        dimension = cell['URI']
+        if cell.j in columnDimensions:
+            self.graph.add((cell.URI, TABLINKER.parentCell, columnDimensions[cell.j][-1]))    
+        dimension = cell.URI
             
         # Add the dimension to the dimensions list for that column
-        columnDimensions.setdefault(cell['j'], []).append(dimension)
+        columnDimensions.setdefault(cell.j, []).append(dimension)
         
         # Look if we cover other cells
-        columns_spanned = cell['cell'].getAttrNS(TABLENS, 'number-columns-spanned')
+        columns_spanned = cell.cell.columns_spanned
         if columns_spanned != None:
-            columns_spanned = int(columns_spanned)
             for extra in range(1, columns_spanned):
-                spanned_col = cell['j'] + extra
-                logger.debug("Span over ({},{})".format(cell['i'], spanned_col))
+                spanned_col = cell.j + extra
+                logger.debug("Span over ({},{})".format(cell.i, spanned_col))
                 columnDimensions.setdefault(spanned_col, []).append(dimension)
         
         
@@ -415,26 +570,25 @@ class TabLinker(object):
         """
         
         # Add the cell to the graph
-        logger.debug("({},{}) Add property dimension \"{}\"".format(cell['i'], cell['j'], cell['value']))
+        logger.debug("({},{}) Add property dimension \"{}\"".format(cell.i, cell.j, cell.value))
         self._create_cell(cell, TABLINKER.RowProperty)
-        rowProperties[cell['j']] = cell['URI']        
+        rowProperties[cell.j] = cell.URI        
         
         # Look if we cover other cells
-        columns_spanned = cell['cell'].getAttrNS(TABLENS, 'number-columns-spanned')
+        columns_spanned = cell.cell.columns_spanned
         if columns_spanned != None:
-            columns_spanned = int(columns_spanned)
             for extra in range(1, columns_spanned):
-                logger.debug("Span over ({},{})".format(cell['i'], cell['j'] + extra))
-                rowProperties[cell['j'] + extra] = cell['URI']
+                logger.debug("Span over ({},{})".format(cell.i, cell.j + extra))
+                rowProperties[cell.j + extra] = cell.URI
             
     
     def handleTitle(self, cell) :
         """
         Create relevant triples for the cell marked as Title 
         """
-        self.graph.add((cell['sheetURI'],
+        self.graph.add((cell.sheetURI,
                         RDFS.comment,
-                        Literal(clean_string(cell['value']))))        
+                        Literal(clean_string(cell.value))))        
     
     def handleAnnotation(self, cell, annotation) :
         """
@@ -442,28 +596,26 @@ class TabLinker(object):
         """
         
         # Create triples according to Open Annotation model
-        annotation_URI = cell['URI'] + "-oa"
+        annotation_URI = cell.URI + "-oa"
         annotation_body_URI = annotation_URI + '-body'
 
         self.graph.add((annotation_URI, RDF.type, OA.Annotation))
-        self.graph.add((annotation_URI, OA.hasTarget, cell['URI']))
+        self.graph.add((annotation_URI, OA.hasTarget, cell.URI))
         self.graph.add((annotation_URI, OA.hasBody, annotation_body_URI))
         
         self.graph.add((annotation_body_URI, RDF.type, RDFS.Resource))
         self.graph.add((annotation_body_URI,
                         TABLINKER.value,
-                        Literal(clean_string(getText(annotation)))))
+                        Literal(clean_string(annotation.text))))
         
         # Extract author
-        author = annotation.getElementsByType(dc.Creator)
-        if len(author) > 0:
-            author = clean_string(str(author[0]))
+        if annotation.author != None:
+            author = clean_string(annotation.author)
             self.graph.add((annotation_body_URI, OA.annotatedBy, Literal(author)))
             
         # Extract date
-        creation_date = annotation.getElementsByType(dc.Date)
-        if len(creation_date) > 0:
-            creation_date = str(creation_date[0])
+        if annotation.date != None:
+            creation_date = str(annotation.date)
             self.graph.add((annotation_body_URI, OA.serializedAt, Literal(creation_date, datatype=XSD.date)))
             
     def _create_cell(self, cell, cell_type):
@@ -472,17 +624,29 @@ class TabLinker(object):
         """
         
         # Set the value
-        value = Literal(clean_string(cell['value']))
+        value = Literal(clean_string(cell.value))
             
         # It's a cell
-        self.graph.add((cell['URI'], RDF.type, cell_type))
+        self.graph.add((cell.URI, RDF.type, cell_type))
         
         # It's in the data set defined by the current sheet
-        self.graph.add((cell['URI'], TABLINKER.sheet, cell['sheetURI']))
+        self.graph.add((cell.URI, TABLINKER.sheet, cell.sheetURI))
         
         # Add its value (removed the datatype=XSD.decimal because we can't be sure)
-        self.graph.add((cell['URI'], TABLINKER.value, value))
+        self.graph.add((cell.URI, TABLINKER.value, value))
         
         # Add a cell label
-        label = "%s=%s" % (cell['name'], cell['value'])
-        self.graph.add((cell['URI'], RDFS.label, Literal(label)))
+        label = "%s=%s" % (cell.name, cell.value)
+        self.graph.add((cell.URI, RDFS.label, Literal(label)))
+
+def link_part_thread(parameters):
+    '''
+    Worker thread for TabLinker._link_parallel
+    '''
+    tLinker = TabLinker(parameters['input_file'], parameters['output_file'],
+                        processAnnotations=parameters['annotations'])
+    tLinker.set_target_namespace(parameters['target'])
+    tLinker.set_processes(parameters['processes'])
+    tLinker.book.set_content_file(parameters['content'])
+    return tLinker.link_part(parameters['index'], parameters['parts_dir'],
+                             parameters['format'])
@@ -0,0 +1,4 @@
+import logging
+
+# Keep the output of the tests quiet
+logging.getLogger().addHandler(logging.NullHandler())
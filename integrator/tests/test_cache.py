@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util.cache import QueryCache
+
+END_POINT = 'http://example.org/sparql'
+QUERY_A = 'SELECT * FROM <urn:graph:a> WHERE { ?s ?p ?o }'
+QUERY_B = 'SELECT * WHERE { GRAPH <urn:graph:b> { ?s ?p ?o } }'
+QUERY_ANY = 'SELECT * WHERE { ?s ?p ?o }'
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = QueryCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        self.assertEqual(self.cache.get(END_POINT, QUERY_A), None)
+        self.cache.put(END_POINT, QUERY_A, [{'s' : {'type' : 'uri', 'value' : 'a'}}])
+        self.assertEqual(self.cache.get(END_POINT, QUERY_A),
+                         [{'s' : {'type' : 'uri', 'value' : 'a'}}])
+        # Same query with other spaces, other end point
+        self.assertEqual(self.cache.get(END_POINT, QUERY_A.replace(' ', '\n  ')),
+                         [{'s' : {'type' : 'uri', 'value' : 'a'}}])
+        self.assertEqual(self.cache.get('http://example.org/other', QUERY_A), None)
+
+    def test_invalidate(self):
+        for query in (QUERY_A, QUERY_B, QUERY_ANY):
+            self.cache.put(END_POINT, query, query)
+        self.cache.invalidate('<urn:graph:a>')
+        self.assertEqual(self.cache.get(END_POINT, QUERY_A), None)
+        self.assertEqual(self.cache.get(END_POINT, QUERY_B), QUERY_B)
+        # The queries naming no graph may depend on any of them
+        self.assertEqual(self.cache.get(END_POINT, QUERY_ANY), None)
+
+    def test_least_recently_used_evicted(self):
+        results = [str(n) * 1000 for n in range(10)]
+        for (n, query) in enumerate((QUERY_A, QUERY_B, QUERY_ANY)):
+            self.cache.put(END_POINT, query, results)
+            os.utime(self.cache._file_name(END_POINT, query), (n, n))
+        # Using the oldest one makes it the most recent
+        self.cache.get(END_POINT, QUERY_A)
+        size = os.path.getsize(self.cache._file_name(END_POINT, QUERY_A))
+        self.cache.max_size = 3 * size
+        self.cache.put(END_POINT, 'SELECT ?s WHERE { ?s ?p ?o }', results)
+        self.assertEqual(self.cache.get(END_POINT, QUERY_B), None)
+        self.assertEqual(self.cache.get(END_POINT, QUERY_A), results)
+        self.assertTrue(self.cache.size <= 0.9 * self.cache.max_size)
+
+if __name__ == '__main__':
+    unittest.main()
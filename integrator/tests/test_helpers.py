@@ -0,0 +1,46 @@
+import random
+import re
+import unittest
+
+from modules.tablinker import helpers
+from modules.tablinker.helpers import clean_string, clean_strings
+
+def _reference(text):
+    # The original implementation of clean_string
+    text_clean = text.lower().replace('\n', ' ').replace('\r', ' ')
+    text_clean = re.sub(r'\s+', ' ', text_clean)
+    return text_clean.strip()
+
+class CleanStringTest(unittest.TestCase):
+    def test_examples(self):
+        self.assertEqual(clean_string(u'  Wijk B.\tSpijkerboor\r\nHuizen  '),
+                         u'wijk b. spijkerboor huizen')
+        self.assertEqual(clean_string('A  b'), 'a b')
+        self.assertEqual(clean_string(u''), u'')
+        self.assertEqual(type(clean_string(u'')), unicode)
+        self.assertEqual(type(clean_string('')), str)
+
+    def test_same_as_reference(self):
+        chars = u'aB \t\n\r\x0b\x0c\x1c\x1f\x85\xa0\u3000\u2003x\xe9.'
+        rand = random.Random(0)
+        for _ in xrange(5000):
+            text = u''.join(rand.choice(chars) for _ in xrange(rand.randrange(12)))
+            for value in (text, text.encode('utf-8')):
+                expected = _reference(value)
+                for cleaned in (clean_string(value), clean_string(value),
+                                clean_strings([value])[0]):
+                    self.assertEqual(cleaned, expected)
+                    self.assertEqual(type(cleaned), type(expected))
+
+    def test_memo_bounded(self):
+        max_cleaned = helpers.MAX_CLEANED
+        try:
+            helpers.MAX_CLEANED = 10
+            clean_strings([u'Text {}'.format(n) for n in xrange(25)])
+            self.assertTrue(len(helpers._cleaned[unicode]) <= 10)
+            self.assertEqual(clean_string(u'Text 3'), u'text 3')
+        finally:
+            helpers.MAX_CLEANED = max_cleaned
+
+if __name__ == '__main__':
+    unittest.main()
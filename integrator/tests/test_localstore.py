@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util.localstore import LocalStore
+
+TURTLE = '''@prefix ex: <http://example.org/> .
+ex:a ex:label "A"@en ; ex:value 1 ; ex:link ex:b .
+'''
+
+NTRIPLES = '''<http://example.org/b> <http://example.org/label> "B" .
+'''
+
+class LocalStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = LocalStore()
+        self.turtle = self._write('a.ttl', TURTLE)
+        self.ntriples = self._write('b.nt', NTRIPLES)
+        self.store.upload_file('<urn:graph:a>', self.turtle)
+        self.store.upload_file('<urn:graph:b>', self.ntriples)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'wb') as f:
+            f.write(content)
+        return file_name
+
+    def test_select_over_all_graphs(self):
+        # The dataset clause is ignored
+        results = self.store.select('''SELECT ?l FROM <urn:graph:b> WHERE {
+            <http://example.org/a> <http://example.org/link> ?o . ?o <http://example.org/label> ?l }''')
+        self.assertEqual(results, [{'l' : {'type' : 'literal', 'value' : 'B'}}])
+
+    def test_bindings(self):
+        results = self.store.select('''SELECT ?p ?o WHERE {
+            <http://example.org/a> ?p ?o } ORDER BY ?p''')
+        self.assertEqual([r['o'] for r in results],
+                         [{'type' : 'literal', 'value' : 'A', 'xml:lang' : 'en'},
+                          {'type' : 'uri', 'value' : 'http://example.org/b'},
+                          {'type' : 'typed-literal', 'value' : '1',
+                           'datatype' : 'http://www.w3.org/2001/XMLSchema#integer'}])
+
+    def test_delete_and_clean(self):
+        self.store.delete_file('<urn:graph:a>', self.turtle)
+        self.assertEqual(len(self.store), 1)
+        self.store.upload_file('<urn:graph:a>', self.turtle)
+        self.store.clean_graph('<urn:graph:b>')
+        self.assertEqual(len(self.store), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rdflib.term import URIRef
+
+import integrat
+from util.manifest import Manifest, hash_file, hash_values, hash_dependencies, set_aside
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, '.manifest.json')
+        self.output = self._write('out.nt', 'content')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'wb') as f:
+            f.write(content)
+        return file_name
+
+    def test_saved_and_loaded(self):
+        manifest = Manifest(self.file_name)
+        self.assertTrue(manifest.is_new())
+        manifest.update('source', 'signature', [self.output])
+        manifest.save()
+        manifest = Manifest(self.file_name)
+        self.assertFalse(manifest.is_new())
+        self.assertEqual(manifest.get_sources(), ['source'])
+        self.assertEqual(manifest.get_signature('source'), 'signature')
+        self.assertEqual(manifest.get_outputs('source'), [self.output])
+        self.assertEqual(manifest.get_outputs('unknown'), [])
+
+    def test_up_to_date(self):
+        manifest = Manifest(self.file_name)
+        manifest.update('source', 'signature', [self.output])
+        self.assertTrue(manifest.is_up_to_date('source', 'signature'))
+        self.assertFalse(manifest.is_up_to_date('source', 'other'))
+        self.assertFalse(manifest.is_up_to_date('source', None))
+        self.assertFalse(manifest.is_up_to_date('unknown', 'signature'))
+        os.remove(self.output)
+        self.assertFalse(manifest.is_up_to_date('source', 'signature'))
+
+    def test_invalid_manifest_ignored(self):
+        self._write('.manifest.json', '{"sources": ')
+        manifest = Manifest(self.file_name)
+        self.assertTrue(manifest.is_new())
+        self.assertEqual(manifest.get_sources(), [])
+
+    def test_hashes(self):
+        self.assertEqual(hash_file(self.output), hash_file(self._write('copy', 'content')))
+        self.assertNotEqual(hash_file(self.output), hash_file(self._write('other', 'Content')))
+        self.assertEqual(hash_values('a', 1, u'\xe9'), hash_values('a', '1', u'\xe9'))
+        # The values are delimited
+        self.assertNotEqual(hash_values('ab', 'c'), hash_values('a', 'bc'))
+
+class SetAsideTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'out.ttl')
+        self.hidden = os.path.join(self.directory, '.out.ttl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, file_name, content):
+        with open(file_name, 'wb') as f:
+            f.write(content)
+
+    def _read(self, file_name):
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+    def test_set_aside(self):
+        self.assertEqual(set_aside(self.file_name), None)
+        self._write(self.file_name, 'first')
+        self.assertEqual(set_aside(self.file_name), self.hidden)
+        self.assertFalse(os.path.exists(self.file_name))
+        # The first version set aside is the one still in the store
+        self._write(self.file_name, 'second')
+        self.assertEqual(set_aside(self.file_name), self.hidden)
+        self.assertEqual(self._read(self.hidden), 'first')
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_hash_dependencies(self):
+        self.assertEqual(hash_dependencies('a', None), None)
+        self.assertEqual(hash_dependencies('a', 'b'), hash_values('a', 'b'))
+
+    def test_rules_kept_aside_on_error(self):
+        class FailingRuleMaker(object):
+            def __init__(self, end_point, dataset, output):
+                self.output = output
+            def set_target_namespace(self, namespace):
+                pass
+            def set_compress(self, compress):
+                pass
+            def loadMappings(self, mappings):
+                pass
+            def setHeaders(self, headers):
+                pass
+            def get_signature(self):
+                return 'rules'
+            def process(self):
+                with open(self.output, 'wb') as f:
+                    f.write('partial')
+                raise IOError('store down')
+        self._write(self.file_name, 'previous')
+        parameters = {'dataset' : URIRef('http://example.org/dataset'),
+                      'output' : self.file_name,
+                      'endpoint' : None, 'target' : None, 'compress' : False,
+                      'mappings' : None, 'headers' : None, 'settings' : None,
+                      'previous' : 'old', 'incremental' : True,
+                      'dump' : self.file_name}
+        rule_maker = integrat.RuleMaker
+        try:
+            integrat.RuleMaker = FailingRuleMaker
+            result = integrat.generate_harmonization_rules_thread(parameters)
+        finally:
+            integrat.RuleMaker = rule_maker
+        # The previous rules are returned to be removed from the store, the
+        # partial output is not kept
+        self.assertEqual(result, (None, self.hidden))
+        self.assertEqual(self._read(self.hidden), 'previous')
+        self.assertFalse(os.path.exists(self.file_name))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import random
+import unittest
+
+from modules.rules.mappings import MappingIndex, TrigramIndex, _trigrams
+from modules.rules.rulesmaker import load_mappings
+
+MAPPINGS = os.path.join(os.path.dirname(__file__), '..', '..', 'data',
+                        'cedar-micro', 'mapping')
+
+def _dice(a, b):
+    (ta, tb) = (_trigrams(a), _trigrams(b))
+    return 2.0 * len(ta & tb) / (len(ta) + len(tb))
+
+class TrigramIndexTest(unittest.TestCase):
+    def test_exact_and_close(self):
+        index = TrigramIndex([u'amsterdam', u'rotterdam', u'utrecht'], 0.7)
+        self.assertEqual(index.find(u'amsterdam'), (u'amsterdam', 1.0))
+        self.assertEqual(index.find(u'Amsterdam')[0], u'amsterdam')
+        self.assertEqual(index.find(u'amsterdamm')[0], u'amsterdam')
+        self.assertEqual(index.find(u'groningen'), None)
+
+    def test_threshold_is_inclusive(self):
+        score = _dice(u'amsterdam', u'amsterdamm')
+        self.assertEqual(TrigramIndex([u'amsterdam'], score).find(u'amsterdamm'),
+                         (u'amsterdam', round(score, 3)))
+        self.assertEqual(TrigramIndex([u'amsterdam'], score + 0.001).find(u'amsterdamm'),
+                         None)
+
+    def test_ties_are_ambiguous(self):
+        # As close to one as to the other
+        index = TrigramIndex([u'abcdx', u'abcdy'], 0.5)
+        self.assertEqual(_dice(u'abcd', u'abcdx'), _dice(u'abcd', u'abcdy'))
+        self.assertEqual(index.find(u'abcd'), None)
+        self.assertEqual(index.find(u'abcdx'), (u'abcdx', 1.0))
+
+    def test_short_literals_ignored(self):
+        index = TrigramIndex([u'abc', u'abcd'], 0.5)
+        self.assertEqual(index.find(u'abc'), None)
+        self.assertEqual(index.find(u'abcd'), (u'abcd', 1.0))
+
+    def test_same_as_brute_force(self):
+        rand = random.Random(42)
+        def word():
+            return u''.join(rand.choice(u'abcdef ') for _ in xrange(rand.randint(3, 12)))
+        literals = sorted(set(word() for _ in xrange(300)))
+        for threshold in (0.5, 0.75, 0.9):
+            index = TrigramIndex(literals, threshold)
+            for _ in xrange(200):
+                literal = word()
+                scores = sorted([(_dice(literal, l), l) for l in literals
+                                 if len(l) >= 4], reverse=True)
+                expected = None
+                if len(literal) >= 4 and scores and scores[0][0] >= threshold:
+                    if len(scores) == 1 or scores[1][0] != scores[0][0]:
+                        expected = (scores[0][1], round(scores[0][0], 3))
+                self.assertEqual(index.find(literal), expected)
+
+class FuzzyList(object):
+    '''
+    Stand-in for a MappingsList matched approximately
+    '''
+    def __init__(self, entries, threshold):
+        self.entries = entries
+        self.threshold = threshold
+
+    def get_entries(self):
+        return iter(self.entries)
+
+    def get_fuzzy_threshold(self):
+        return self.threshold
+
+class MappingIndexTest(unittest.TestCase):
+    def test_same_as_the_lists(self):
+        mappings = load_mappings(MAPPINGS)
+        self.assertTrue(len(mappings) > 0)
+        index = MappingIndex(mappings)
+        none = {'cell': 'none', 'sheet': 'none', 'dataset': 'none'}
+        for section in mappings.values():
+            for (literal, _, contexts) in section.get_entries():
+                # The contexts of the exceptions plus one matching none
+                context_maps = [none]
+                for context in contexts.keys():
+                    (key, value) = context.split('=', 1)
+                    context_map = dict(none)
+                    context_map[key] = value
+                    context_maps.append(context_map)
+                for context_map in context_maps:
+                    expected = []
+                    for name in sorted(mappings.keys()):
+                        pairs = mappings[name].get_mappings_for(literal, context_map)
+                        if pairs != None:
+                            expected.append((name, pairs))
+                    self.assertTrue(index.get_mappings_for(literal, context_map) == expected)
+        self.assertEqual(index.get_mappings_for(u'not a mapped literal', none), [])
+
+    def test_approximate(self):
+        default = [('p', 'default')]
+        special = [('p', 'special')]
+        index = MappingIndex({
+            'fuzzy': FuzzyList([(u'amsterdam', default, {'sheet=S1': special}),
+                                (u'rotterdam', default, {})], 0.7),
+            'exact': FuzzyList([(u'amsterdam', default, {})], 0)})
+        context_map = {'cell': 'C1', 'sheet': 'S0', 'dataset': 'D'}
+        score = round(_dice(u'amsterdam', u'amsterdamm'), 3)
+        self.assertEqual(index.get_approximate_mappings_for(u'amsterdamm', context_map,
+                                                            ['fuzzy', 'exact']),
+                         [('fuzzy', default, u'amsterdam', score)])
+        context_map['sheet'] = 'S1'
+        self.assertEqual(index.get_approximate_mappings_for(u'amsterdamm', context_map,
+                                                            ['fuzzy']),
+                         [('fuzzy', special, u'amsterdam', score)])
+        self.assertEqual(index.get_approximate_mappings_for(u'amsterdamm', context_map,
+                                                            ['exact']), [])
+        self.assertEqual(index.get_approximate_mappings_for(u'groningen', context_map,
+                                                            ['fuzzy']), [])
+
+if __name__ == '__main__':
+    unittest.main()
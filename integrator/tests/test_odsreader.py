@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from odf import text, office
+from odf.namespaces import TABLENS
+from odf.opendocument import load
+from odf.table import Table, TableRow
+
+from modules.tablinker import odsreader
+from modules.tablinker.odsreader import ODSReader
+
+DATA = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+WORKBOOK = os.path.join(DATA, 'data-test', 'source-data', 'simple.ods')
+# Has cells with several annotations, of which only the first is read
+ENRICHED = os.path.join(DATA, 'cedar-micro', 'enriched-source', 'VT_1889_05_H1.ods')
+
+def _paragraphs(node):
+    return u' '.join(unicode(child) for child in node.childNodes
+                     if child.isInstanceOf(text.P))
+
+def _cells_odfpy(file_name):
+    '''
+    Get all the non covered cells of a workbook read with odfpy, as (sheet,
+    row, column, style, text, annotation) tuples
+    '''
+    cells = []
+    for (n, sheet) in enumerate(load(file_name).getElementsByType(Table)):
+        for (i, row) in enumerate(sheet.getElementsByType(TableRow)):
+            j = 0
+            for node in row.childNodes:
+                if node.qname[1] not in ('table-cell', 'covered-table-cell'):
+                    continue
+                repeat = int(node.getAttrNS(TABLENS, 'number-columns-repeated') or 1)
+                if node.qname[1] == 'table-cell':
+                    annotations = node.getElementsByType(office.Annotation)
+                    annotation = _paragraphs(annotations[0]) if annotations else None
+                    for column in range(j, j + repeat):
+                        cells.append((n, i, column,
+                                      node.getAttrNS(TABLENS, 'style-name'),
+                                      _paragraphs(node), annotation))
+                j = j + repeat
+    return cells
+
+def _cells(file_name):
+    '''
+    Get all the non covered cells of a workbook read with ODSReader, in the
+    same format as _cells_odfpy
+    '''
+    cells = []
+    for (n, sheet) in enumerate(ODSReader(file_name).sheets()):
+        for (i, runs) in sheet.rows():
+            for (first, count, cell) in runs:
+                annotation = cell.annotation.text if cell.annotation != None else None
+                for column in range(first, first + count):
+                    cells.append((n, i, column, cell.style, cell.text, annotation))
+    return cells
+
+def _content(book, keep=lambda n: True):
+    '''
+    Get the content of the sheets of a book, as a list of (index, name,
+    rows) with the cells as (first column, columns, style, text, annotation)
+    '''
+    sheets = []
+    for (n, sheet) in enumerate(book.sheets()):
+        if not keep(n):
+            continue
+        rows = []
+        for (index, runs) in sheet.rows():
+            cells = [(first, count, cell.style, cell.text,
+                      cell.annotation.text if cell.annotation != None else None)
+                     for (first, count, cell) in runs]
+            rows.append((index, cells))
+        sheets.append((n, sheet.name, rows))
+    return sheets
+
+class ODSReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_as_odfpy(self):
+        for file_name in (WORKBOOK, ENRICHED):
+            self.assertTrue(_cells(file_name) == _cells_odfpy(file_name))
+
+    def test_sheet_names(self):
+        self.assertEqual([s.name for s in ODSReader(WORKBOOK).sheets()],
+                         [t.getAttrNS(TABLENS, 'name')
+                          for t in load(WORKBOOK).getElementsByType(Table)])
+
+    def test_text_filter(self):
+        book = ODSReader(WORKBOOK)
+        book.set_text_filter(lambda style: False)
+        for sheet in book.sheets():
+            for (_, runs) in sheet.rows():
+                self.assertEqual([c.text for (_, _, c) in runs], [''] * len(runs))
+
+    def test_split(self):
+        expected = _content(ODSReader(WORKBOOK))
+        self.assertEqual(len(expected), 3)
+        for parts in (1, 2, 4):
+            self._check_split(parts, expected)
+
+    def test_split_tags_cut_by_reads(self):
+        expected = _content(ODSReader(WORKBOOK))
+        read_size = odsreader.READ_SIZE
+        try:
+            for size in (5, 13, 64):
+                odsreader.READ_SIZE = size
+                self._check_split(2, expected)
+        finally:
+            odsreader.READ_SIZE = read_size
+
+    def _check_split(self, parts, expected):
+        file_names = [os.path.join(self.directory, 'content-{}.xml'.format(i))
+                      for i in range(parts)]
+        self.assertEqual(ODSReader(WORKBOOK).split(file_names), 3)
+        found = []
+        for (index, file_name) in enumerate(file_names):
+            book = ODSReader(WORKBOOK)
+            book.set_content_file(file_name)
+            found.extend(_content(book, lambda n: n % parts == index))
+        self.assertEqual(sorted(found), expected)
+
+if __name__ == '__main__':
+    unittest.main()
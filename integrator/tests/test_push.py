@@ -0,0 +1,132 @@
+import bz2
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from util import transport
+from util.push import Pusher, _statements
+
+TURTLE = '''@prefix ex: <http://example.org/> .
+ex:dsd ex:component [ ex:dimension ex:sex ; ex:order 1 ] .
+_:x ex:label "not _:a blank node" , "_:y" .
+ex:s ex:p <relative> .
+'''
+
+NTRIPLES = '''_:x <http://example.org/p> _:y .
+<http://example.org/s> <http://example.org/p> "_:z" .
+
+# Comment
+'''
+
+class StatementsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with bz2.BZ2File(file_name, 'wb') as out:
+            out.write(content)
+        return file_name
+
+    def test_blank_nodes_skolemized(self):
+        statements = list(_statements(self._write('rules.ttl.bz2', TURTLE)))
+        self.assertEqual(len(statements), 6)
+        self.assertIn('<urn:genid:rules.ttl:a1> <http://example.org/order> '
+                      '"1"^^<http://www.w3.org/2001/XMLSchema#integer> .\n', statements)
+        self.assertIn('<http://example.org/dsd> <http://example.org/component> '
+                      '<urn:genid:rules.ttl:a1> .\n', statements)
+        self.assertIn('<urn:genid:rules.ttl:lx> <http://example.org/label> '
+                      '"not _:a blank node" .\n', statements)
+        self.assertIn('<urn:genid:rules.ttl:lx> <http://example.org/label> '
+                      '"_:y" .\n', statements)
+
+    def test_same_statements_once_set_aside(self):
+        content = self._write('rules.ttl.bz2', TURTLE)
+        statements = list(_statements(content))
+        hidden = os.path.join(self.directory, '.rules.ttl.bz2')
+        os.rename(content, hidden)
+        self.assertEqual(list(_statements(hidden)), statements)
+
+    def test_ntriples(self):
+        statements = list(_statements(self._write('raw.nt.bz2', NTRIPLES)))
+        self.assertEqual(statements,
+            ['<urn:genid:raw.nt:x> <http://example.org/p> <urn:genid:raw.nt:y> .\n',
+             '<http://example.org/s> <http://example.org/p> "_:z" .\n'])
+
+class StoreHandler(BaseHTTPRequestHandler):
+    '''
+    Stand-in for the graph store and the SPARQL end point of Virtuoso, with
+    a digest challenge for the requests without authentication
+    '''
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        path = urlparse.urlparse(self.path).path
+        self.server.requests.append((path, 'Authorization' in self.headers, body))
+        if 'Authorization' not in self.headers:
+            self.send_response(401)
+            self.send_header('WWW-Authenticate',
+                             'Digest realm="test", nonce="0123", qop="auth"')
+        elif path in self.server.broken:
+            self.send_response(500)
+        else:
+            self.send_response(201 if path == '/graph-store' else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class PusherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StoreHandler)
+        self.server.requests = []
+        self.server.broken = set()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.settings = dict(transport._settings)
+        transport.configure(digest=True, retries=0)
+        self.directory = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.directory, 'raw.nt')
+        with open(self.input_file, 'wb') as out:
+            out.write(NTRIPLES)
+        self.pusher = Pusher(self.url + '/sparql', 'dba', 'secret')
+        self.pusher.set_graph_store(self.url + '/graph-store')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        transport.configure(**self.settings)
+        shutil.rmtree(self.directory)
+
+    def test_body_sent_again_after_challenge(self):
+        self.pusher.set_method('graph-store')
+        self.pusher.upload_file('<urn:graph:test>', self.input_file)
+        expected = ''.join(_statements(self.input_file))
+        self.assertEqual([(p, a) for (p, a, _) in self.server.requests],
+                         [('/graph-store', False), ('/graph-store', True)])
+        self.assertEqual(self.server.requests[-1][2], expected)
+
+    def test_falls_back_to_sparul(self):
+        self.server.broken.add('/graph-store')
+        self.pusher.upload_file('<urn:graph:test>', self.input_file)
+        self.assertEqual(self.pusher.get_methods(), ['sparul'])
+        self.assertEqual(self.server.requests[-1][0], '/sparql')
+
+    def test_raises_when_all_methods_fail(self):
+        self.server.broken.update(['/graph-store', '/sparql'])
+        for _ in xrange(2):
+            self.assertRaises(Exception, self.pusher.upload_file,
+                              '<urn:graph:test>', self.input_file)
+        self.assertEqual(self.pusher.get_methods(), ['sparul'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import threading
+import unittest
+
+from util.scheduler import AdaptiveScheduler
+
+class AdaptiveSchedulerTest(unittest.TestCase):
+    def _scheduler(self):
+        return AdaptiveScheduler(min_concurrency=1, max_concurrency=4,
+                                 min_chunk=1, max_chunk=10)
+
+    def test_sends_everything(self):
+        scheduler = self._scheduler()
+        received = []
+        lock = threading.Lock()
+        def send(items):
+            with lock:
+                received.extend(items)
+        for n in xrange(20):
+            scheduler.submit(send, [n, n + 100])
+        scheduler.join()
+        self.assertEqual(sorted(received),
+                         sorted(range(20) + range(100, 120)))
+        self.assertEqual(scheduler.get_metrics()['items'], 40)
+
+    def test_failures_raised_by_join(self):
+        scheduler = self._scheduler()
+        calls = []
+        def send(items):
+            calls.append(items)
+            if items[0] % 2 == 0:
+                raise IOError("store down")
+        for n in xrange(6):
+            scheduler.submit(send, [n] * 3)
+        self.assertRaises(Exception, scheduler.join)
+
+        # Not retried, and the failures are only reported once
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(scheduler.get_metrics()['errors'], 3)
+        scheduler.join()
+
+    def test_failure_reports_items(self):
+        scheduler = self._scheduler()
+        def send(items):
+            raise IOError("store down")
+        scheduler.submit(send, range(7))
+        try:
+            scheduler.join()
+            self.fail("join() did not raise")
+        except Exception as e:
+            self.assertIn("7 items", str(e))
+            self.assertIn("store down", str(e))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import re
+import unittest
+
+from util.sparql import PAGE_SIZE, SPARQLWrap, _decode_bindings
+
+RESULTS = {'head' : {'link' : [], 'vars' : ['s', 'label']},
+           'results' : {'distinct' : False, 'ordered' : True,
+                        'bindings' : [
+    {'s' : {'type' : 'uri', 'value' : 'http://example.org/a'},
+     'label' : {'type' : 'literal', 'xml:lang' : 'nl', 'value' : u'b\xe9 "quoted" ]}, {'}},
+    {'s' : {'type' : 'uri', 'value' : 'http://example.org/b'}},
+    {'s' : {'type' : 'uri', 'value' : 'http://example.org/c'},
+     'label' : {'type' : 'literal', 'value' : u'€'}}]}}
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+class DecodeBindingsTest(unittest.TestCase):
+    def test_split_chunks(self):
+        data = json.dumps(RESULTS, indent=1, ensure_ascii=False).encode('utf-8')
+        expected = [RESULTS['head']['vars']] + RESULTS['results']['bindings']
+        # Chunks cutting through the tokens and the utf-8 characters
+        for size in (1, 2, 3, 7, 64, len(data)):
+            self.assertEqual(list(_decode_bindings(_split(data, size))), expected)
+
+    def test_empty_chunks_ignored(self):
+        data = json.dumps(RESULTS)
+        chunks = [''] + [c for chunk in _split(data, 5) for c in (chunk, '')]
+        self.assertEqual(len(list(_decode_bindings(chunks))), 4)
+
+    def test_no_results(self):
+        data = '{"head": {"vars": ["s"]}, "results": {"bindings": [ ]}}'
+        self.assertEqual(list(_decode_bindings(_split(data, 4))), [['s']])
+
+    def test_truncated(self):
+        data = json.dumps(RESULTS)
+        self.assertRaises(ValueError, list, _decode_bindings([data[:-30]]))
+
+class FakeEndPoint(SPARQLWrap):
+    '''
+    End point answering the paged queries over rows of a ?key and an ?id
+    numbering them. Like Virtuoso it returns at most max_rows results, and
+    in no particular order if none is asked for
+    '''
+    def __init__(self, values, max_rows=None):
+        SPARQLWrap.__init__(self, 'http://example.org/sparql', use_cache=False)
+        self.rows = [(v, '%05d' % i) for (i, v) in enumerate(values)]
+        self.max_rows = max_rows
+        self.queries = []
+
+    def _query(self, query):
+        self.queries.append(query)
+        rows = sorted(self.rows)
+        if 'ORDER BY' not in query:
+            random.Random(len(self.queries)).shuffle(rows)
+        for (operator, value) in re.findall(r'FILTER \(STR\(\?key\) (>=|>|=) "([^"]*)"\)', query):
+            test = {'>=' : lambda k: k >= value,
+                    '>'  : lambda k: k > value,
+                    '='  : lambda k: k == value}[operator]
+            rows = [r for r in rows if test(r[0])]
+        offset = re.search(r'OFFSET (\d+)', query)
+        if offset != None:
+            rows = rows[int(offset.group(1)):]
+        rows = rows[:int(re.search(r'LIMIT (\d+)', query).group(1))]
+        if self.max_rows != None:
+            rows = rows[:self.max_rows]
+        return {'results' : {'bindings' : [{'key' : {'type' : 'literal', 'value' : k},
+                                            'id' : {'type' : 'literal', 'value' : i}}
+                                           for (k, i) in rows]}}
+
+QUERY = '''SELECT ?key ?id WHERE {
+?s ?key ?id .
+}'''
+
+class PagesTest(unittest.TestCase):
+    def _pages(self, values, key, page_size):
+        end_point = FakeEndPoint(values)
+        pages = list(end_point.run_select_pages(QUERY, key=key,
+                                                page_size=page_size,
+                                                prefetch=False))
+        return (end_point, [[r['key']['value'] for r in page] for page in pages])
+
+    def test_keyset_same_key_kept_together(self):
+        values = ['a', 'b', 'b', 'b', 'c', 'd', 'd', 'e']
+        (_, pages) = self._pages(values, 'key', 3)
+        self.assertEqual(sum(pages, []), values)
+        for page in pages[1:]:
+            # No key is split over two pages
+            self.assertNotIn(page[0], pages[pages.index(page) - 1])
+
+    def test_keyset_one_key_fills_page(self):
+        values = ['a'] + ['b'] * 7 + ['c']
+        (end_point, pages) = self._pages(values, 'key', 2)
+        self.assertEqual(sum(pages, []), values)
+        # The pages never grow past the page size
+        self.assertEqual(max([int(re.search(r'LIMIT (\d+)', q).group(1))
+                              for q in end_point.queries]), 2)
+        self.assertTrue(max([len(page) for page in pages]) <= 2)
+
+    def test_keyset_store_capping_rows(self):
+        # More results for a key than the store returns at once
+        end_point = FakeEndPoint(['a'] * 12000 + ['b'] * 5, max_rows=PAGE_SIZE)
+        rows = [(r['key']['value'], r['id']['value'])
+                for r in end_point.run_select_paginated(QUERY, key='key')]
+        self.assertTrue(rows == sorted(end_point.rows))
+
+    def test_keyset_exact_pages(self):
+        values = ['a', 'b', 'c', 'd']
+        (_, pages) = self._pages(values, 'key', 2)
+        self.assertEqual(sum(pages, []), values)
+
+    def test_offset(self):
+        values = [str(n) for n in range(10)]
+        (end_point, pages) = self._pages(values, None, 5)
+        self.assertEqual(pages, [values[:5], values[5:], []])
+        for query in end_point.queries:
+            self.assertIn('ORDER BY ?key ?id LIMIT 5', query)
+
+    def test_offset_needs_variables(self):
+        end_point = FakeEndPoint(['a'])
+        self.assertRaises(ValueError, list,
+                          end_point.run_select_pages('SELECT * WHERE { ?s ?key ?id }',
+                                                     prefetch=False))
+
+class SelectManyTest(unittest.TestCase):
+    def test_results_in_order(self):
+        end_point = FakeEndPoint([str(n) for n in range(20)])
+        queries = [(QUERY + ' LIMIT __N__', {'__N__' : str(n)}) for n in range(12)]
+        results = end_point.run_select_many(queries, concurrency=4)
+        self.assertEqual([len(r) for r in results], range(12))
+        self.assertEqual(len(end_point.queries), 12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from requests.auth import HTTPDigestAuth
+
+from util import transport
+
+class OverloadedHandler(BaseHTTPRequestHandler):
+    '''
+    Server answering 503 to the first requests it gets
+    '''
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self.server.requests = self.server.requests + 1
+        if self.server.requests <= self.server.overloaded:
+            self.send_response(503)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict(transport._settings)
+
+    def tearDown(self):
+        transport.configure(**self.settings)
+
+    def _serve(self, overloaded):
+        server = HTTPServer(('127.0.0.1', 0), OverloadedHandler)
+        server.requests = 0
+        server.overloaded = overloaded
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_unknown_setting(self):
+        self.assertRaises(ValueError, transport.configure, retry=2)
+
+    def test_session_dropped_by_configure(self):
+        session = transport.get_session()
+        self.assertIs(transport.get_session(), session)
+        transport.configure(pool_size=4)
+        self.assertIsNot(transport.get_session(), session)
+
+    def test_auth(self):
+        self.assertEqual(transport.get_auth(None, None), None)
+        transport.configure(digest=False)
+        self.assertEqual(transport.get_auth('dba', 'secret'), ('dba', 'secret'))
+        transport.configure(digest=True)
+        auth = transport.get_auth('dba', 'secret')
+        self.assertIsInstance(auth, HTTPDigestAuth)
+        self.assertIs(transport.get_auth('dba', 'secret'), auth)
+        self.assertIsNot(transport.get_auth('dba', 'other'), auth)
+        transport.configure(digest=True)
+        self.assertIsNot(transport.get_auth('dba', 'secret'), auth)
+
+    def test_retries_overloaded_server(self):
+        server = self._serve(2)
+        transport.configure(retries=3, backoff=0)
+        url = 'http://127.0.0.1:{}/sparql'.format(server.server_port)
+        self.assertEqual(transport.post(url, data='query').status_code, 200)
+        self.assertEqual(server.requests, 3)
+
+    def test_gives_up_after_retries(self):
+        server = self._serve(10)
+        transport.configure(retries=1, backoff=0)
+        url = 'http://127.0.0.1:{}/sparql'.format(server.server_port)
+        self.assertEqual(transport.post(url, data='query').status_code, 503)
+        self.assertEqual(server.requests, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import unittest
+from StringIO import StringIO
+
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from util import turtle
+from util.turtle import TurtleReader
+
+DOCUMENT = u'''@prefix ex: <http://example.org/> .
+@base <http://example.org/base/> .
+PREFIX s: <http://schema.org/>
+# A comment
+ex:a a ex:Thing ;
+    ex:name "Caf\\u00e9 \\"quoted\\"", 'single'@en-GB ;
+    ex:text """multi
+line "with" quotes""" , \'\'\'more\'\'\' ;
+    ex:typed "12"^^<http://www.w3.org/2001/XMLSchema#int> ;
+    ex:numbers 12, -3.5, 1.0e3, .5 ;
+    ex:flag true ;
+    s:rel <relative> ;
+    ex:unicode "été" ;
+    ex:local ex:with\\.dot ;
+    ex:blank [ ex:p _:b1 ; ex:q [] ] ;
+    ex:list ( 1 "two" ex:three ), () ;
+.
+_:b1 ex:p ex:c.
+[ ex:p 1 ] .
+( ex:x ex:y ) ex:p ex:z .
+ex:end ex:p 2.
+'''
+
+class TurtleReaderTest(unittest.TestCase):
+    def _parse(self):
+        source = StringIO(DOCUMENT.encode('utf-8'))
+        graph = Graph()
+        graph.parse(data=''.join(TurtleReader(source).statements()), format='nt')
+        return graph
+
+    def test_same_as_rdflib(self):
+        expected = Graph()
+        expected.parse(data=DOCUMENT.encode('utf-8'), format='turtle')
+        self.assertTrue(isomorphic(self._parse(), expected))
+
+    def test_tokens_cut_by_reads(self):
+        # Every token ends up cut in between two reads
+        read_size = turtle.READ_SIZE
+        try:
+            expected = self._parse()
+            for size in (1, 2, 3, 7):
+                turtle.READ_SIZE = size
+                self.assertTrue(isomorphic(self._parse(), expected))
+        finally:
+            turtle.READ_SIZE = read_size
+
+    def test_blank_nodes_labels_are_stable(self):
+        first = list(TurtleReader(StringIO(DOCUMENT.encode('utf-8'))).statements())
+        second = list(TurtleReader(StringIO(DOCUMENT.encode('utf-8'))).statements())
+        self.assertEqual(first, second)
+
+    def test_invalid(self):
+        for document in ('ex:a ex:b ex:c .', '<a> <b> "open .', '<a> <b> .'):
+            reader = TurtleReader(StringIO(document))
+            self.assertRaises(SyntaxError, list, reader.statements())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from rdflib import Graph, Namespace
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, XSD
+from rdflib.term import Literal, BNode
+
+from util.writer import TriplesWriter
+
+EX = Namespace('http://example.org/')
+EX_SUB = Namespace('http://example.org/sub/')
+
+class TriplesWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, output_format, triples, name='out'):
+        file_name = os.path.join(self.directory, name)
+        writer = TriplesWriter(file_name, output_format, compress=False)
+        writer.bind('ex', EX)
+        writer.bind('sub', EX_SUB)
+        for triple in triples:
+            writer.add(triple)
+        writer.close()
+        return (file_name, writer)
+
+    def _read(self, file_name, output_format):
+        graph = Graph()
+        graph.parse(file_name, format='nt' if output_format == 'nt' else 'turtle')
+        return graph
+
+    def test_escaping(self):
+        node = BNode()
+        triples = [(EX.a, EX.p, Literal(u'quote " backslash \\ tab \t\nnew line\r')),
+                   (EX.a, EX.p, Literal(u'café', lang='fr')),
+                   (EX.a, EX.p, Literal('1', datatype=XSD.integer)),
+                   (EX.a, EX.q, node),
+                   (node, RDF.type, EX.Thing)]
+        expected = Graph()
+        for triple in triples:
+            expected.add(triple)
+        for output_format in ('nt', 'turtle'):
+            (file_name, writer) = self._write(output_format, triples, output_format)
+            self.assertEqual(len(writer), 5)
+            self.assertTrue(isomorphic(self._read(file_name, output_format), expected))
+
+    def test_prefix_choice(self):
+        (file_name, _) = self._write('turtle', [
+            (EX_SUB.a, EX.p, EX['with space']),
+            (EX.b, EX['p.q'], EX_SUB['c-d'])])
+        content = open(file_name).read()
+        # The longest namespace wins, local names which are not safe in
+        # Turtle are written in full
+        self.assertIn('sub:a ex:p <http://example.org/with space>', content)
+        self.assertIn('ex:b <http://example.org/p.q> sub:c-d', content)
+        self.assertIn('@prefix sub: <http://example.org/sub/> .', content)
+
+    def test_same_subject_grouped(self):
+        (file_name, _) = self._write('turtle', [(EX.a, RDF.type, EX.Thing),
+                                                (EX.a, EX.p, EX.b),
+                                                (EX.b, EX.p, EX.a)])
+        content = open(file_name).read()
+        self.assertIn('ex:a a ex:Thing ;\n    ex:p ex:b .\nex:b ex:p ex:a .\n', content)
+
+    def test_append_counts_statements(self):
+        part_file = os.path.join(self.directory, 'part')
+        part = TriplesWriter(part_file, 'turtle', compress=False, header=False)
+        part.bind('ex', EX)
+        part.add((EX.a, EX.p, EX.b))
+        part.add((EX.a, EX.q, EX.c))
+        part.close()
+        file_name = os.path.join(self.directory, 'out')
+        writer = TriplesWriter(file_name, 'turtle', compress=False)
+        writer.bind('ex', EX)
+        writer.add((EX.z, EX.p, EX.y))
+        writer.append(part_file, len(part))
+        writer.close()
+        self.assertEqual(len(writer), 3)
+        self.assertEqual(len(self._read(file_name, 'turtle')), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import uuid
+
+# Maximum size of the cache by default, in bytes
+MAX_SIZE = 256 * 1024 * 1024
+
+# Name of the file recording the version of the graphs
+VERSIONS = 'versions.json'
+
+# Extension of the cached results
+EXTENSION = '.json.gz'
+
+# Graphs named in the dataset clauses or in the GRAPH patterns of a query
+GRAPHS = re.compile(r'\b(?:FROM\s+(?:NAMED\s+)?|GRAPH\s+)<([^>]*)>', re.IGNORECASE)
+
+# Version of the queries not naming any graph, changed with every graph
+ANY_GRAPH = '*'
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+# The cache of the current process, None if the cache is disabled
+_cache = None
+
+def configure(directory, max_size=MAX_SIZE):
+    '''
+    Enable the cache in a directory, or disable it if directory is None
+    '''
+    global _cache
+    _cache = None if directory == None else QueryCache(directory, max_size)
+
+def get_cache():
+    '''
+    Get the query cache, None if it is not enabled
+    '''
+    return _cache
+
+def invalidate(graph_name):
+    '''
+    Invalidate all the results depending on the content of a graph, does
+    nothing if the cache is not enabled
+    '''
+    if _cache != None:
+        _cache.invalidate(graph_name)
+
+def normalise(query):
+    '''
+    Normalise the white spaces of a query
+    '''
+    return ' '.join(query.split())
+
+class QueryCache(object):
+    '''
+    Cache of the results of the queries, saved as compressed JSON files in a
+    directory. Every result is keyed by the end point, the text of the query
+    and the version of the graphs it names. The version of a graph changes
+    when it is modified by the pipeline so the results computed before can
+    not be found any more. The least recently used results are deleted when
+    the cache grows larger than its maximum size
+    '''
+    def __init__(self, directory, max_size=MAX_SIZE):
+        '''
+        Constructor
+        '''
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # Size of the cache, computed on first write
+        self.size = None
+
+    def get(self, end_point, query):
+        '''
+        Get the results of a query, None if they are not in the cache
+        '''
+        file_name = self._file_name(end_point, query)
+        try:
+            with gzip.open(file_name, 'rb') as f:
+                results = json.load(f)
+        except IOError:
+            return None
+        except ValueError:
+            log.warning("Ignoring invalid cache entry {}".format(file_name))
+            return None
+        # Mark as recently used
+        os.utime(file_name, None)
+        return results
+
+    def put(self, end_point, query, results):
+        '''
+        Save the results of a query
+        '''
+        file_name = self._file_name(end_point, query)
+        tmp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        with gzip.open(tmp_file_name, 'wb') as f:
+            json.dump(results, f, separators=(',', ':'))
+        os.rename(tmp_file_name, file_name)
+
+        if self.size == None:
+            self.size = sum([os.path.getsize(f) for f in self._entries()])
+        else:
+            self.size = self.size + os.path.getsize(file_name)
+        if self.size > self.max_size:
+            self._evict()
+
+    def invalidate(self, graph_name):
+        '''
+        Give a new version to a graph, and to the queries naming no graph
+        '''
+        versions = self._versions()
+        versions[graph_name.strip('<>')] = uuid.uuid4().hex
+        versions[ANY_GRAPH] = uuid.uuid4().hex
+        file_name = os.path.join(self.directory, VERSIONS)
+        tmp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        with open(tmp_file_name, 'wb') as f:
+            json.dump(versions, f, indent=1, sort_keys=True)
+        os.rename(tmp_file_name, file_name)
+
+    def _versions(self):
+        file_name = os.path.join(self.directory, VERSIONS)
+        if not os.path.isfile(file_name):
+            return {}
+        try:
+            with open(file_name, 'rb') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _file_name(self, end_point, query):
+        query = normalise(query)
+        versions = self._versions()
+        graphs = sorted(set(GRAPHS.findall(query))) or [ANY_GRAPH]
+        sha = hashlib.sha1()
+        for value in [end_point, query] + [versions.get(g, '') for g in graphs]:
+            sha.update(value.encode('utf-8'))
+            sha.update('\0')
+        return os.path.join(self.directory, sha.hexdigest() + EXTENSION)
+
+    def _entries(self):
+        return glob.glob(os.path.join(self.directory, '*' + EXTENSION))
+
+    def _evict(self):
+        '''
+        Delete the least recently used results until the cache is back under
+        90% of its maximum size
+        '''
+        entries = []
+        for file_name in self._entries():
+            try:
+                stat = os.stat(file_name)
+                entries.append((stat.st_mtime, stat.st_size, file_name))
+            except OSError:
+                pass
+        entries.sort()
+        self.size = sum([e[1] for e in entries])
+        while entries and self.size > 0.9 * self.max_size:
+            (_, size, file_name) = entries.pop(0)
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+            self.size = self.size - size
+        log.debug("Cache reduced to {} bytes".format(self.size))
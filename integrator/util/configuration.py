@@ -1,8 +1,10 @@
 import glob
+import multiprocessing
 import os
 import sys
 from ConfigParser import SafeConfigParser
 from rdflib.term import URIRef
+from util.localstore import LOCAL
 
 import logging
 log = logging.getLogger(__name__)
@@ -26,6 +28,29 @@ class Configuration(object):
     def verbose(self):
         return self.config.get('debug', 'verbose') == '1';
     
+    def isOffline(self):
+        '''
+        In offline mode all the steps query a local store loaded with the
+        files produced instead of the SPARQL end point
+        '''
+        if self.config.has_option('general', 'offline'):
+            return self.config.get('general', 'offline') == '1'
+        return False
+    
+    def isPush(self):
+        '''
+        Push all the files produced to the triple store at the end of an
+        offline run
+        '''
+        if self.config.has_option('general', 'push'):
+            return self.config.get('general', 'push') == '1'
+        return False
+    
+    def get_output_format(self):
+        if self.config.has_option('debug', 'format'):
+            return self.config.get('debug', 'format')
+        return 'n3'
+    
     def get_graph_name(self, name):
         return URIRef(self.config.get('graphs', name)).n3()
 
@@ -33,11 +58,100 @@ class Configuration(object):
         return self.config.get('paths', path)
         
     def get_SPARQL(self):
+        if self.isOffline():
+            return LOCAL
         return self.config.get('general', 'sparql_endpoint')
     
     def get_SPARUL(self):
         return self.config.get('general', 'sparul_endpoint')
     
+    def get_push_method(self):
+        '''
+        Method used to load the files in the triple store: auto, bulk,
+        graph-store or sparul
+        '''
+        if self.config.has_option('general', 'push_method'):
+            return self.config.get('general', 'push_method')
+        return 'auto'
+    
+    def get_graph_store(self):
+        '''
+        End point of the Graph Store HTTP Protocol, None if not set
+        '''
+        if self.config.has_option('general', 'graph_store_endpoint'):
+            return self.config.get('general', 'graph_store_endpoint') or None
+        return None
+    
+    def get_bulk_loader(self):
+        '''
+        Directory and isql command line used by the Virtuoso bulk loader,
+        None if they are not both set
+        '''
+        options = ['bulk_directory', 'bulk_isql']
+        if all([self.config.has_option('general', o) for o in options]):
+            (directory, isql) = [self.config.get('general', o) for o in options]
+            if directory and isql:
+                return (directory, isql)
+        return None
+    
+    def get_http_settings(self):
+        '''
+        Settings of the HTTP transport used to talk to the triple store, as
+        found in the optional [http] section
+        '''
+        settings = {}
+        if self.config.has_section('http'):
+            for (key, get) in [('connect_timeout', self.config.getfloat),
+                               ('timeout', self.config.getfloat),
+                               ('retries', self.config.getint),
+                               ('backoff', self.config.getfloat),
+                               ('pool_size', self.config.getint)]:
+                if self.config.has_option('http', key):
+                    settings[key] = get('http', key)
+            if self.config.has_option('http', 'auth'):
+                settings['digest'] = self.config.get('http', 'auth') == 'digest'
+        return settings
+    
+    def get_processes(self, step, default):
+        '''
+        Number of processes querying the store during a step, as set in the
+        optional [concurrency] section. 0 means one per CPU
+        '''
+        if self.config.has_option('concurrency', step):
+            processes = self.config.getint('concurrency', step)
+            return processes if processes > 0 else multiprocessing.cpu_count()
+        return default
+    
+    def get_scheduler_settings(self):
+        '''
+        Bounds within which the load put on the store by the pushes is
+        adapted, as found in the optional [concurrency] section
+        '''
+        settings = {}
+        for (key, get) in [('min_concurrency', self.config.getint),
+                           ('max_concurrency', self.config.getint),
+                           ('min_chunk', self.config.getint),
+                           ('max_chunk', self.config.getint),
+                           ('target_latency', self.config.getfloat)]:
+            if self.config.has_option('concurrency', key):
+                settings[key] = get('concurrency', key)
+        return settings
+    
+    def get_cache(self):
+        '''
+        Directory and maximum size in bytes of the query cache, as set in
+        the optional [cache] section. None if there is no cache
+        '''
+        if not self.config.has_option('cache', 'directory'):
+            return None
+        directory = self.config.get('cache', 'directory')
+        if not directory:
+            return None
+        max_size = 256
+        if self.config.has_option('cache', 'max_size'):
+            max_size = self.config.getint('cache', 'max_size')
+        return (directory, max_size * 1024 * 1024)
+    
     def get_user(self):
         return self.config.get('general', 'sparul_user')
     
@@ -0,0 +1,126 @@
+import bz2
+import re
+
+import rdflib.plugins.sparql
+from rdflib import ConjunctiveGraph, Graph
+from rdflib.term import URIRef, BNode
+
+# End point name used to run the queries on the local store
+LOCAL = 'local:'
+
+# Dataset clauses of the queries, all the graphs of the store are queried
+DATASET_CLAUSE = re.compile(r'\bFROM\s+(NAMED\s+)?<[^>]*>', re.IGNORECASE)
+
+# Never fetch the graphs named in the queries
+rdflib.plugins.sparql.SPARQL_LOAD_GRAPHS = False
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+# The store of the current process, inherited by the workers
+_store = None
+
+def get_store():
+    '''
+    Get the local store, created on first use
+    '''
+    global _store
+    if _store == None:
+        _store = LocalStore()
+    return _store
+
+def _graph_uri(graph_name):
+    return URIRef(graph_name.strip('<>'))
+
+def _binding(term):
+    '''
+    Turn a term into a binding as found in SPARQL JSON results
+    '''
+    if isinstance(term, URIRef):
+        return {'type' : 'uri', 'value' : unicode(term)}
+    if isinstance(term, BNode):
+        return {'type' : 'bnode', 'value' : unicode(term)}
+    binding = {'type' : 'literal', 'value' : unicode(term)}
+    if term.language != None:
+        binding['xml:lang'] = term.language
+    elif term.datatype != None:
+        binding['type'] = 'typed-literal'
+        binding['datatype'] = unicode(term.datatype)
+    return binding
+
+class LocalStore(object):
+    '''
+    Indexed in-memory store holding the files produced by the pipeline in
+    named graphs. The queries are run over the union of all the graphs, the
+    dataset clauses they contain are ignored. Files are loaded with the same
+    methods as the Pusher uses to send them to a remote store
+    '''
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.graph = ConjunctiveGraph()
+
+    def upload_file(self, graph_name, input_file):
+        '''
+        Add the content of a (compressed) N-Triples or Turtle file to a graph
+        '''
+        fmt = 'nt' if '.nt' in input_file else 'n3'
+        source = bz2.BZ2File(input_file) if input_file.endswith('.bz2') else open(input_file, 'rb')
+        try:
+            self.graph.get_context(_graph_uri(graph_name)).parse(source, format=fmt)
+        finally:
+            source.close()
+
+    def delete_file(self, graph_name, input_file):
+        '''
+        Remove the content of a file from a graph
+        '''
+        content = Graph()
+        fmt = 'nt' if '.nt' in input_file else 'n3'
+        source = bz2.BZ2File(input_file) if input_file.endswith('.bz2') else open(input_file, 'rb')
+        try:
+            content.parse(source, format=fmt)
+        finally:
+            source.close()
+        context = self.graph.get_context(_graph_uri(graph_name))
+        for triple in content:
+            context.remove(triple)
+
+    def clean_graph(self, graph_name):
+        '''
+        Remove all the content of a graph
+        '''
+        self.graph.remove_context(self.graph.get_context(_graph_uri(graph_name)))
+
+    def select(self, query):
+        '''
+        Run a SELECT query, the results are returned as the bindings of
+        SPARQL JSON results
+        '''
+        results = self.graph.query(DATASET_CLAUSE.sub('', query))
+        bindings = []
+        for row in results:
+            binding = {}
+            for (name, term) in zip(results.vars, row):
+                if term != None:
+                    binding[unicode(name)] = _binding(term)
+            bindings.append(binding)
+        return bindings
+
+    def select_tuples(self, query):
+        '''
+        Run a SELECT query and iterate over the results as tuples of terms
+        '''
+        for row in self.graph.query(DATASET_CLAUSE.sub('', query)):
+            yield tuple(row)
+            
+    def construct(self, query):
+        '''
+        Run a CONSTRUCT query and return the graph produced
+        '''
+        return self.graph.query(DATASET_CLAUSE.sub('', query)).graph
+
+    def __len__(self):
+        return len(self.graph)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+
+# Amount of data hashed at once
+READ_SIZE = 1024 * 1024
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+def hash_file(file_name):
+    '''
+    Get the SHA-1 of the content of a file
+    '''
+    sha = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        data = f.read(READ_SIZE)
+        while data:
+            sha.update(data)
+            data = f.read(READ_SIZE)
+    return sha.hexdigest()
+
+def hash_values(*values):
+    '''
+    Get the SHA-1 of a list of values, used to sign the configuration a
+    file is processed with
+    '''
+    sha = hashlib.sha1()
+    for value in values:
+        sha.update(unicode(value).encode('utf-8'))
+        sha.update('\0')
+    return sha.hexdigest()
+
+def hash_dependencies(*signatures):
+    '''
+    Combine the signatures of everything an output depends on. The result is
+    None if any of them is unknown
+    '''
+    if None in signatures:
+        return None
+    return hash_values(*signatures)
+
+def set_aside(file_name):
+    '''
+    Rename an output as an hidden file, for it not to be overwritten nor
+    pushed with the others. If a previous version was already set aside, and
+    thus never removed from the store, it is kept instead. Returns the name
+    of the hidden file or None if there is none
+    '''
+    hidden_file_name = os.path.join(os.path.dirname(file_name),
+                                    '.' + os.path.basename(file_name))
+    if os.path.exists(file_name):
+        if os.path.exists(hidden_file_name):
+            os.remove(file_name)
+        else:
+            os.rename(file_name, hidden_file_name)
+    if os.path.exists(hidden_file_name):
+        return hidden_file_name
+    return None
+
+class Manifest(object):
+    '''
+    Record the signature of the sources processed by a step of the pipeline
+    and the outputs generated from them. The manifest is saved as JSON, by
+    default next to the outputs. Deleting it forces a complete rebuild
+    '''
+    def __init__(self, file_name):
+        '''
+        Constructor
+        '''
+        self.file_name = file_name
+        self.sources = {}
+        self.found = os.path.isfile(file_name)
+        if self.found:
+            try:
+                with open(file_name, 'rb') as f:
+                    self.sources = json.load(f)['sources']
+            except Exception as e:
+                log.warning("Ignoring invalid manifest {} : {}".format(file_name, e))
+                self.found = False
+
+    def is_new(self):
+        '''
+        True if there was no previous manifest, in which case nothing is
+        known about what has been processed before
+        '''
+        return not self.found
+
+    def is_up_to_date(self, source, signature):
+        '''
+        Check if a source has been processed with the same signature and if
+        all its outputs are still there
+        '''
+        entry = self.sources.get(source)
+        if signature == None or entry == None or entry['signature'] != signature:
+            return False
+        return all([os.path.exists(o) for o in entry['outputs']])
+
+    def get_sources(self):
+        '''
+        Get the list of sources recorded
+        '''
+        return sorted(self.sources.keys())
+
+    def get_signature(self, source):
+        '''
+        Get the signature of a source, None if it is unknown
+        '''
+        entry = self.sources.get(source)
+        return None if entry == None else entry['signature']
+
+    def get_outputs(self, source):
+        '''
+        Get the outputs generated from a source
+        '''
+        entry = self.sources.get(source)
+        return [] if entry == None else entry['outputs']
+
+    def update(self, source, signature, outputs):
+        '''
+        Record the signature and the outputs of a source
+        '''
+        self.sources[source] = {'signature' : signature,
+                                'outputs'   : outputs}
+
+    def remove(self, source):
+        '''
+        Forget about a source
+        '''
+        self.sources.pop(source, None)
+
+    def save(self):
+        '''
+        Save the manifest, the previous version is replaced only once the new
+        one is completely written
+        '''
+        tmp_file_name = self.file_name + '.tmp'
+        with open(tmp_file_name, 'wb') as f:
+            json.dump({'sources' : self.sources}, f, indent=1, sort_keys=True)
+        os.rename(tmp_file_name, self.file_name)
+        self.found = True
@@ -1,12 +1,43 @@
 import bz2
 import os
-import requests
-import multiprocessing
-from subprocess import check_call
+import re
+import shlex
+import shutil
+import tempfile
+import urllib
+import urlparse
+from functools import partial
+from subprocess import Popen, PIPE, STDOUT
+
+from util import transport, cache
+from util.turtle import TurtleReader
+from util.scheduler import AdaptiveScheduler
 
-BUFFER = "/tmp/buffer.txt"
 MAX_NT = 1000  # hard max apparently for Virtuoso
 
+# Prefix of the IRIs replacing the blank nodes of the files pushed, and blank
+# nodes in the subject and in the object of a line of N-Triples
+GENID = 'urn:genid:'
+SUBJECT_BNODE = re.compile(r'^_:([^\s"<>]+)')
+OBJECT_BNODE = re.compile(r'(\s)_:([^\s"<>@]+)(\s*\.\s*)$')
+
+# The methods to load files, from the fastest to the slowest. SPARUL is
+# always available
+BULK = 'bulk'
+GRAPH_STORE = 'graph-store'
+SPARUL = 'sparul'
+METHODS = [BULK, GRAPH_STORE, SPARUL]
+
+# Script given to isql to run the Virtuoso bulk loader on a directory
+BULK_SCRIPT = """
+ld_dir('__DIRECTORY__', '*', '__GRAPH__');
+rdf_loader_run();
+SELECT concat('LOAD', '_ERROR'), ll_file, ll_error FROM DB.DBA.load_list
+    WHERE ll_file LIKE '__DIRECTORY__/%' AND ll_error IS NOT NULL;
+DELETE FROM DB.DBA.load_list WHERE ll_file LIKE '__DIRECTORY__/%';
+checkpoint;
+"""
+
 # Define the logger
 import logging
 log = logging.getLogger(__name__)
@@ -17,20 +48,80 @@ log = logging.getLogger(__name__)
 
 logging.getLogger("requests").setLevel(logging.WARNING)
 
-def _push_chunk_thread(parameters):
-    graph_uri = parameters['graph_uri']
-    chunk = parameters['chunk']
-    sparql = parameters['sparql']
-    user = parameters['user']
-    secret = parameters['secret']
-    query = """
-    DEFINE sql:log-enable 3 
-    INSERT INTO %s {
-    """ % graph_uri
-    query = query + chunk + "}"
-    r = requests.post(sparql, auth=(user, secret), data={'query' : query})
-    if r.status_code != 200:
-        log.error("{} : {}".format(r.status_code, r.text.replace('\n', '')))
+def _open(input_file):
+    '''
+    Open a file for reading, decompressing it on the fly if needed
+    '''
+    if input_file.endswith('.bz2'):
+        return bz2.BZ2File(input_file, 'rb')
+    return open(input_file, 'rb')
+
+def _base(input_file):
+    '''
+    Base against which the relative IRIs of a file are resolved, its location
+    under the name it was written with and not the one of the file set aside
+    '''
+    (directory, name) = os.path.split(os.path.abspath(input_file))
+    return urlparse.urljoin('file:', urllib.pathname2url(
+                            os.path.join(directory, name.lstrip('.'))))
+
+def _skolemize(statements, input_file):
+    '''
+    Replace the blank nodes of lines of N-Triples by IRIs specific to the file
+    they come from. SPARUL never matches blank nodes, the triples with an IRI
+    instead can be deleted along with the rest of the file
+    '''
+    name = os.path.basename(input_file).lstrip('.')
+    if name.endswith('.bz2'):
+        name = name[:-len('.bz2')]
+    genid = '<{}{}:'.format(GENID, urllib.quote(name))
+    for line in statements:
+        if '_:' in line:
+            line = SUBJECT_BNODE.sub(genid + r'\1>', line)
+            line = OBJECT_BNODE.sub(r'\1' + genid + r'\2>\3', line)
+        yield line
+
+def _statements(input_file):
+    '''
+    Iterate over the statements of a (compressed) N-Triples or Turtle file as
+    lines of N-Triples, with the blank nodes skolemized. Both are streamed,
+    Turtle files are parsed as they are read
+    '''
+    source = _open(input_file)
+    try:
+        if '.nt' in input_file:
+            lines = _lines(source)
+        else:
+            lines = TurtleReader(source, _base(input_file)).statements()
+        for line in _skolemize(lines, input_file):
+            yield line
+    finally:
+        source.close()
+
+def _lines(source):
+    '''
+    Iterate over the statements of a N-Triples file
+    '''
+    for line in source:
+        line = line.strip()
+        if line != '' and not line.startswith('#'):
+            yield line + '\n'
+
+def _chunks(statements, get_size):
+    '''
+    Group the statements into chunks, the maximum size of the next chunk is
+    given by get_size()
+    '''
+    chunk = []
+    size = get_size()
+    for statement in statements:
+        chunk.append(statement)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+            size = get_size()
+    if len(chunk) != 0:
+        yield chunk
     
 class Pusher(object):
     def __init__(self, sparql, user, secret):
@@ -38,67 +129,186 @@ class Pusher(object):
         self.secret = secret
         self.sparql = sparql
         
+        # Pick the fastest method available by default
+        self.method = 'auto'
+        
+        # End point of the SPARQL 1.1 Graph Store HTTP Protocol, if any
+        self.graph_store = None
+        
+        # Directory shared with Virtuoso and isql command line used to run
+        # the bulk loader, if any
+        self.bulk_directory = None
+        self.bulk_isql = None
+        
+        # Methods found not to work
+        self.failed = set()
+        
+        # Adapt the load to the store when sending updates
+        self.scheduler = AdaptiveScheduler(max_chunk=MAX_NT)
+        
+    def set_scheduler(self, scheduler):
+        """
+        Set the scheduler used to send the updates
+        """
+        self.scheduler = scheduler
+        
+    def set_method(self, method):
+        """
+        Set the method used to load the files: 'auto' to use the fastest
+        method configured, or one of 'bulk', 'graph-store' and 'sparul'
+        """
+        if method != 'auto' and method not in METHODS:
+            raise ValueError('Unknown push method {}'.format(method))
+        self.method = method
+        
+    def set_graph_store(self, graph_store):
+        """
+        Set the end point of the Graph Store HTTP Protocol used to POST
+        complete files
+        """
+        self.graph_store = graph_store
+        
+    def set_bulk_loader(self, directory, isql):
+        """
+        Set the directory from which Virtuoso can load files (it must be in
+        its DirsAllowed and have the same path on both sides) and the isql
+        command line used to run the bulk loader
+        """
+        self.bulk_directory = directory
+        self.bulk_isql = isql
+        
+    def get_methods(self):
+        """
+        Get the methods that will be tried to load a file, in order
+        """
+        if self.method != 'auto':
+            return [self.method]
+        methods = []
+        if self.bulk_directory != None and self.bulk_isql != None:
+            methods.append(BULK)
+        if self.graph_store != None:
+            methods.append(GRAPH_STORE)
+        methods.append(SPARUL)
+        return [m for m in methods if m not in self.failed]
+        
     def clean_graph(self, uri):
         # Clear the previous graph
+        cache.invalidate(uri)
         query = """
         DEFINE sql:log-enable 3 
         CLEAR GRAPH %s
         """ % uri
-        r = requests.post(self.sparql, 
-                          auth=(self.user, self.secret),
-                          data={'query' : query})
+        r = transport.post(self.sparql, 
+                           auth=transport.get_auth(self.user, self.secret),
+                           data={'query' : query})
         if r.status_code != 200:
             log.error("{} : {}".format(r.status_code, r.text.replace('\n', '')))
     
     def upload_file(self, graph_uri, input_file):
-        # First remove the last BUFFER        
-        if os.path.isfile(BUFFER):
-            os.unlink(BUFFER)
+        '''
+        Insert all the triples of a file into a graph, with the first method
+        that works. A method failing is not tried again for the next files,
+        the error of the last one is raised
+        '''
+        cache.invalidate(graph_uri)
+        methods = self.get_methods()
+        if len(methods) == 0:
+            raise Exception("No method left to load {}".format(input_file))
+        for method in methods:
+            try:
+                if method == BULK:
+                    self._bulk_load(graph_uri, input_file)
+                elif method == GRAPH_STORE:
+                    self._post_file(graph_uri, input_file)
+                else:
+                    self._send_file(graph_uri, input_file, 'INSERT INTO')
+                return
+            except Exception as e:
+                if self.method != 'auto' or method == methods[-1]:
+                    raise
+                log.warning("Can not use {} to load {} : {}".format(method, input_file, e))
+                self.failed.add(method)
+        
+    def delete_file(self, graph_uri, input_file):
+        '''
+        Delete from a graph all the triples of a file, used to replace
+        the content of a file pushed previously. This is always done with
+        SPARUL, the blank nodes being skolemized the same way by all the
+        methods
+        '''
+        cache.invalidate(graph_uri)
+        self._send_file(graph_uri, input_file, 'DELETE FROM')
+        
+    def _post_file(self, graph_uri, input_file):
+        '''
+        Send the statements of a file to the graph store in a single
+        request, N-Triples being valid Turtle. They are written to a
+        temporary file first for the body to be sent again after a digest
+        challenge or a retry
+        '''
+        with tempfile.TemporaryFile() as body:
+            body.writelines(_statements(input_file))
+            body.seek(0)
+            r = transport.post(self.graph_store,
+                               params={'graph' : graph_uri.strip('<>')},
+                               headers={'Content-Type' : 'text/turtle'},
+                               auth=transport.get_auth(self.user, self.secret),
+                               data=body)
+        if r.status_code not in (200, 201, 204):
+            raise Exception("{} : {}".format(r.status_code, r.text.replace('\n', '')))
         
-        # Serialise the triples as ntriples in BUFFER
-        DEVNULL = open(os.devnull, 'wb')
+    def _bulk_load(self, graph_uri, input_file):
+        '''
+        Write the statements of a file to the bulk directory and have
+        Virtuoso load it
+        '''
+        directory = tempfile.mkdtemp(dir=self.bulk_directory)
         try:
-            if input_file.endswith('.bz2'):
-                f = open(BUFFER + '-unzip', 'wb')
-                f.write(bz2.BZ2File(input_file).read())
-                f.close()
-                check_call("rapper -i turtle -o ntriples " + BUFFER + '-unzip > ' + BUFFER, stderr=DEVNULL, shell=True)
-            else:
-                check_call("rapper -i turtle -o ntriples " + input_file + ' > ' + BUFFER, stderr=DEVNULL, shell=True) 
+            os.chmod(directory, 0755)
+            # Write N-Triples uncompressed as not all versions of the loader
+            # can read bz2 files
+            name = os.path.basename(input_file).lstrip('.').split('.')[0] + '.nt'
+            with open(os.path.join(directory, name), 'wb') as target:
+                target.writelines(_statements(input_file))
+            script = BULK_SCRIPT.replace('__DIRECTORY__', directory)
+            script = script.replace('__GRAPH__', graph_uri.strip('<>'))
+            isql = Popen(shlex.split(self.bulk_isql), 
+                         stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+            output = isql.communicate(script)[0]
+            if isql.returncode != 0 or '*** Error' in output or 'LOAD_ERROR' in output:
+                raise Exception(output.replace('\n', ' '))
         finally:
-            DEVNULL.close()              
-        
-        # Load all the data into chunks
-        tasks = []
-        chunk = ""
-        input_file = open(BUFFER, 'rb')            
-        count = 0
-        for triple in input_file.readlines():
-            chunk = chunk + triple
-            count = count + 1
-            # If we reach the max, store the chunk
-            if count == MAX_NT:
-                tasks.append({"chunk": chunk,
-                              "graph_uri":graph_uri,
-                              "sparql": self.sparql,
-                              "user": self.user,
-                              "secret": self.secret})
-                count = 0
-                chunk = ""
-        # Store the last chunk
-        tasks.append({"chunk": chunk, 
-                      "graph_uri":graph_uri,
-                      "sparql": self.sparql,
-                      "user": self.user,
-                      "secret": self.secret})
-        input_file.close()
-                    
-        # Send everything !
-        pool_size = 8  # Try to still not hammer Virtuoso too much
-        pool = multiprocessing.Pool(processes=pool_size)
-        pool.map(_push_chunk_thread, tasks)
-        pool.close()
-        pool.join()
+            shutil.rmtree(directory)
+        
+    def _send_file(self, graph_uri, input_file, operation):
+        # Send the chunks as they are read, the scheduler blocks when the
+        # store can not keep up
+        self.scheduler.reset_metrics()
+        send = partial(self._send_chunk, graph_uri, operation)
+        try:
+            for chunk in _chunks(_statements(input_file),
+                                 self.scheduler.get_chunk_size):
+                self.scheduler.submit(send, chunk)
+        finally:
+            self.scheduler.join()
+        metrics = self.scheduler.get_metrics()
+        log.info("[{}] {} statements in {} requests ({} errors), {:.0f} statements/s, "
+                 "latency {:.2f}s, {} requests of {} statements".format(
+                 input_file, metrics['items'], metrics['requests'],
+                 metrics['errors'], metrics['throughput'], metrics['latency'],
+                 metrics['concurrency'], metrics['chunk_size']))
+        
+    def _send_chunk(self, graph_uri, operation, chunk):
+        query = """
+        DEFINE sql:log-enable 3 
+        %s %s {
+        """ % (operation, graph_uri)
+        query = query + ''.join(chunk) + "}"
+        r = transport.post(self.sparql,
+                           auth=transport.get_auth(self.user, self.secret),
+                           data={'query' : query})
+        if r.status_code != 200:
+            raise Exception("{} : {}".format(r.status_code, r.text.replace('\n', '')))
                         
         
 if __name__ == '__main__':
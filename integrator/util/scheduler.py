@@ -0,0 +1,195 @@
+import threading
+import time
+from Queue import Queue
+
+# Bounds of the number of requests in flight
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+
+# Bounds of the number of items (statements) sent per request
+MIN_CHUNK = 100
+MAX_CHUNK = 1000
+
+# Response time above which the store is considered overloaded, in seconds
+TARGET_LATENCY = 5.0
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+class AdaptiveScheduler(object):
+    '''
+    Send requests to the store with threads, adapting the number of requests
+    in flight and the amount of items per request to the way the store
+    responds. Both are increased additively as long as the requests succeed
+    within the target latency and are halved as soon as a request fails or
+    is too slow (AIMD). Submitting blocks when enough requests are waiting
+    so the producer can not run ahead of the store. The requests are not
+    retried here, the transport already does it, and the ones that failed
+    are reported by join()
+    '''
+    def __init__(self, min_concurrency=MIN_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, min_chunk=MIN_CHUNK,
+                 max_chunk=MAX_CHUNK, target_latency=TARGET_LATENCY):
+        '''
+        Constructor
+        '''
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.target_latency = target_latency
+
+        # Start low and let the store tell us how much it can take
+        self.window = float(min(max_concurrency, max(min_concurrency, 2)))
+        self.chunk_size = float(max(min_chunk, max_chunk / 4))
+        self.last_decrease = 0
+
+        # Requests in flight and threads sending them
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.queue = None
+        self.threads = []
+
+        # (number of items, error) of the requests that failed
+        self.failures = []
+
+        # Throughput metrics
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        '''
+        Reset all the metrics
+        '''
+        self.start_time = time.time()
+        self.requests = 0
+        self.items = 0
+        self.errors = 0
+        self.latency = 0.0
+
+    def get_metrics(self):
+        '''
+        Get the metrics since the last reset: number of requests, items sent,
+        errors, average latency, throughput in items per second as well as
+        the current concurrency and chunk size
+        '''
+        with self.condition:
+            elapsed = max(time.time() - self.start_time, 1e-6)
+            return {'requests'    : self.requests,
+                    'items'       : self.items,
+                    'errors'      : self.errors,
+                    'latency'     : self.latency / max(self.requests, 1),
+                    'throughput'  : self.items / elapsed,
+                    'concurrency' : self.get_concurrency(),
+                    'chunk_size'  : self.get_chunk_size()}
+
+    def get_concurrency(self):
+        '''
+        Get the number of requests currently allowed in flight
+        '''
+        return int(self.window)
+
+    def get_chunk_size(self):
+        '''
+        Get the number of items to put in the next request
+        '''
+        return int(self.chunk_size)
+
+    def submit(self, function, items):
+        '''
+        Call function(items) in a thread. Blocks while
+        the threads are all busy and some requests are already waiting
+        '''
+        if self.queue == None:
+            self.queue = Queue(self.max_concurrency)
+            for _ in xrange(self.max_concurrency):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        self.queue.put((function, items))
+
+    def join(self):
+        '''
+        Wait for all the requests submitted to be done and stop the threads.
+        Raises an exception if any of them failed
+        '''
+        if self.queue == None:
+            return
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.queue = None
+        self.threads = []
+        (failures, self.failures) = (self.failures, [])
+        if len(failures) > 0:
+            raise Exception("{} requests failed, {} items were not sent : {}".format(
+                            len(failures), sum(n for (n, _) in failures),
+                            failures[-1][1]))
+
+    def _work(self):
+        while True:
+            task = self.queue.get()
+            if task == None:
+                return
+            (function, items) = task
+
+            # Wait for our turn
+            with self.condition:
+                while self.in_flight >= self.get_concurrency():
+                    self.condition.wait()
+                self.in_flight = self.in_flight + 1
+
+            try:
+                self._send(function, items)
+            finally:
+                with self.condition:
+                    self.in_flight = self.in_flight - 1
+                    self.condition.notify_all()
+
+    def _send(self, function, items):
+        start = time.time()
+        try:
+            function(items)
+            self._success(len(items), time.time() - start)
+        except Exception as e:
+            log.error("Request of {} items failed : {}".format(len(items), e))
+            self._failure(len(items), e, time.time() - start)
+
+    def _success(self, nb_items, latency):
+        with self.condition:
+            self.requests = self.requests + 1
+            self.items = self.items + nb_items
+            self.latency = self.latency + latency
+            if latency > self.target_latency:
+                self._decrease()
+            else:
+                # Additive increase, of about one request and one tenth of
+                # the chunk bounds per round trip
+                self.window = min(self.max_concurrency,
+                                  self.window + 1.0 / self.window)
+                step = (self.max_chunk - self.min_chunk) / 10.0
+                self.chunk_size = min(self.max_chunk,
+                                      self.chunk_size + step / self.window)
+                self.condition.notify_all()
+
+    def _failure(self, nb_items, error, latency):
+        with self.condition:
+            self.failures.append((nb_items, error))
+            self.requests = self.requests + 1
+            self.errors = self.errors + 1
+            self.latency = self.latency + latency
+            self._decrease()
+
+    def _decrease(self):
+        # Multiplicative decrease, at most once per target latency for the
+        # requests that were already in flight not to collapse the window
+        now = time.time()
+        if now - self.last_decrease < self.target_latency:
+            return
+        self.last_decrease = now
+        self.window = max(self.min_concurrency, self.window / 2)
+        self.chunk_size = max(self.min_chunk, self.chunk_size / 2)
+        log.info("Store under pressure, down to {} requests of {} items".format(
+                 self.get_concurrency(), self.get_chunk_size()))
@@ -1,63 +1,329 @@
-from SPARQLWrapper import SPARQLWrapper, JSON
+import codecs
+import json
+import re
+from multiprocessing.pool import ThreadPool
+from rdflib import Graph
 from rdflib.term import URIRef, Literal
+from util.localstore import LOCAL, get_store
+from util.cache import get_cache
+from util import transport
 
 PAGE_SIZE = 10000
 
+# Maximum number of queries sent at the same time by run_select_many
+CONCURRENCY = 8
+
+# Format asked for the results of the queries
+JSON_RESULTS = 'application/sparql-results+json'
+NTRIPLES = 'text/plain'
+
+# Amount of the results read at once when streaming them
+READ_SIZE = 64 * 1024
+
+# Start of the list of the variables and of the list of the bindings in the
+# JSON results
+VARS = re.compile(r'"vars"\s*:\s*')
+BINDINGS = re.compile(r'"bindings"\s*:\s*\[')
+
+# Separators between the bindings
+SEPARATORS = re.compile(r'[\s,]*')
+
+# Projection of a select and the expressions bound to a variable in it
+PROJECTION = re.compile(r'SELECT\s+(?:DISTINCT\s+|REDUCED\s+)?(.*?)\s*(?:FROM\b|WHERE\b|\{)',
+                        re.I | re.S)
+EXPRESSION = re.compile(r'\(.*?\bAS\s+(\?\w+)\s*\)', re.I | re.S)
+
 # Define the logger
 import logging
 log = logging.getLogger(__name__)
 
+def _decode_bindings(chunks):
+    '''
+    Incrementally decode SPARQL JSON results read by chunks. The list of
+    variables is yielded first and then the bindings one at a time
+    '''
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = u''
+    
+    def more():
+        for chunk in chunks:
+            if chunk:
+                return text_decoder.decode(chunk)
+        raise ValueError('Truncated SPARQL results')
+    
+    # Get the variables from the head, then move to the bindings
+    while BINDINGS.search(buf) == None:
+        buf = buf + more()
+    start = BINDINGS.search(buf).end()
+    head = VARS.search(buf, 0, start)
+    if head == None:
+        raise ValueError('No variables in the SPARQL results')
+    yield decoder.raw_decode(buf, head.end())[0]
+    
+    # Decode the bindings one at a time
+    pos = start
+    while True:
+        pos = SEPARATORS.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            (binding, pos) = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # The binding is not complete yet
+            buf = buf[pos:] + more()
+            pos = 0
+            continue
+        yield binding
+    
+def _variables(query):
+    '''
+    Returns the names of the variables projected by a select, used to give
+    its results a stable order
+    '''
+    match = PROJECTION.search(query)
+    if match == None or match.group(1).strip() == '*':
+        raise ValueError('The variables of the select must be listed to page it')
+    return re.findall(r'\?(\w+)', EXPRESSION.sub(r'\1', match.group(1)))
+
+def _restrict(query, key, operator, value):
+    '''
+    Insert a condition on the value of the key at the end of the WHERE
+    clause of a select
+    '''
+    end = query.rindex('}')
+    condition = "FILTER (STR(?%s) %s %s)\n" % (key, operator, Literal(value).n3())
+    return query[:end] + condition + query[end:]
+
+def _prefetch(pages):
+    '''
+    Iterate over pages fetching the next one in a thread while the current
+    one is being processed
+    '''
+    pool = ThreadPool(processes=1)
+    try:
+        pending = pool.apply_async(next, [pages])
+        while True:
+            try:
+                page = pending.get()
+            except StopIteration:
+                return
+            pending = pool.apply_async(next, [pages])
+            yield page
+    finally:
+        pool.close()
+        pool.join()
+
 class SPARQLWrap(object):
-    def __init__(self, end_point):
+    def __init__(self, end_point, use_cache=True):
         '''
         Constructor
         '''
         # Set the end point
         self.end_point = end_point
         
+        # Use the query cache, if it is enabled
+        self.use_cache = use_cache
+        
     def run_select(self, query, params = None):
         '''
         Execute a SPARQL select
         '''
-        sparql = SPARQLWrapper(self.end_point)
-        sparql.setReturnFormat(JSON)
-        
         if params != None:
             for (k,v) in params.iteritems():
                 query = query.replace(k,v)
-        sparql.setQuery(query)
+        
+        if self.end_point == LOCAL:
+            log.debug("Running query on the local store : {}".format(query))
+            return get_store().select(query)
+        
+        cache = get_cache() if self.use_cache else None
+        if cache != None:
+            results = cache.get(self.end_point, query)
+            if results != None:
+                log.debug("Got cached results for {}".format(query))
+                return results
         
         log.debug("Sending query to {} : {}".format(self.end_point, query))
-        results = sparql.query().convert()
+        results = self._query(query)["results"]["bindings"]
         
-        return results["results"]["bindings"]
+        if cache != None:
+            cache.put(self.end_point, query, results)
+        return results
     
-    def run_select_paginated(self, query, params = None):
+    def run_construct(self, query, params = None):
         '''
-        Execute a SPARQL select
+        Execute a SPARQL construct and return the graph produced
         '''
-        total_results = []
-        offset = 0
-        sparql = SPARQLWrapper(self.end_point)
-        sparql.setReturnFormat(JSON)
         if params != None:
             for (k,v) in params.iteritems():
                 query = query.replace(k,v)
-        query = self.prefixes + query
         
-        # Run the query page per page
-        next_page = True
-        while next_page:
-            page_query = "%s LIMIT %d OFFSET %d" % (query, PAGE_SIZE, offset)
-            sparql.setQuery(page_query)
-            page_results = sparql.query().convert()
-            total_results = total_results + page_results["results"]["bindings"]
-            nb_results = len(page_results["results"]["bindings"])
-            next_page = (nb_results == PAGE_SIZE)
-            offset = offset + PAGE_SIZE
+        if self.end_point == LOCAL:
+            log.debug("Running query on the local store : {}".format(query))
+            return get_store().construct(query)
+        
+        cache = get_cache() if self.use_cache else None
+        ntriples = None
+        if cache != None:
+            ntriples = cache.get(self.end_point, query)
+        if ntriples == None:
+            log.debug("Sending query to {} : {}".format(self.end_point, query))
+            r = transport.post(self.end_point, data={'query' : query},
+                               headers={'Accept' : NTRIPLES})
+            r.raise_for_status()
+            ntriples = r.text
+            if cache != None:
+                cache.put(self.end_point, query, ntriples)
+        
+        graph = Graph()
+        graph.parse(data=ntriples.encode('utf-8'), format='nt')
+        return graph
+    
+    def run_select_iter(self, query, params = None):
+        '''
+        Execute a SPARQL select and iterate over the results as they are
+        received. Every result is a tuple with the values of the variables,
+        in the order of the query, as rdflib terms or None when unbound.
+        Only one result at a time is decoded so the memory used does not
+        depend on the number of results
+        '''
+        if params != None:
+            for (k,v) in params.iteritems():
+                query = query.replace(k,v)
         
+        if self.end_point == LOCAL:
+            log.debug("Running query on the local store : {}".format(query))
+            return get_store().select_tuples(query)
+        
+        log.debug("Streaming query from {} : {}".format(self.end_point, query))
+        return self._query_iter(query)
+    
+    def run_select_many(self, queries, concurrency = CONCURRENCY):
+        '''
+        Execute several SPARQL selects given as (query, params) pairs, with
+        at most concurrency of them waiting for the end point at the same
+        time. The results are returned in the same order as the queries
+        '''
+        if self.end_point == LOCAL or len(queries) < 2:
+            return [self.run_select(query, params) for (query, params) in queries]
+        
+        pool = ThreadPool(processes=min(concurrency, len(queries)))
+        try:
+            return pool.map(lambda (query, params): self.run_select(query, params),
+                            queries)
+        finally:
+            pool.close()
+            pool.join()
+    
+    def run_select_paginated(self, query, params = None, key = None):
+        '''
+        Execute a SPARQL select page per page and return all the results.
+        See run_select_pages for the use of key
+        '''
+        total_results = []
+        for page in self.run_select_pages(query, params, key):
+            total_results.extend(page)
         return total_results
     
+    def run_select_pages(self, query, params = None, key = None,
+                         page_size = PAGE_SIZE, prefetch = True):
+        '''
+        Execute a SPARQL select page per page and iterate over the pages of
+        results. If key is the name of a variable always bound, the pages
+        are ordered by it and the next one starts after the last value of
+        the previous one (keyset pagination), the query must then end with
+        its WHERE clause. Otherwise the pages are fetched with an OFFSET,
+        ordered by all the variables of the select which must be listed.
+        The results of a key filling a whole page are paged the same way.
+        With prefetch the next page is fetched while the current one is
+        being processed
+        '''
+        if params != None:
+            for (k,v) in params.iteritems():
+                query = query.replace(k,v)
+        
+        if self.end_point == LOCAL:
+            log.debug("Running query on the local store : {}".format(query))
+            return iter([get_store().select(query)])
+        
+        if key == None:
+            pages = self._offset_pages(query, page_size)
+        else:
+            pages = self._keyset_pages(query, key, page_size)
+        if prefetch:
+            pages = _prefetch(pages)
+        return pages
+    
+    def _offset_pages(self, query, page_size):
+        # Without an order the store may return overlapping pages
+        order = ' '.join(['?' + v for v in _variables(query)])
+        offset = 0
+        while True:
+            page_query = "%s ORDER BY %s LIMIT %d OFFSET %d" % (query, order, page_size, offset)
+            page = self._query(page_query)["results"]["bindings"]
+            yield page
+            if len(page) < page_size:
+                return
+            offset = offset + page_size
+    
+    def _keyset_pages(self, query, key, page_size):
+        page_query = query
+        while True:
+            results = self._query(page_query + " ORDER BY STR(?%s) LIMIT %d" % (key, page_size))
+            results = results["results"]["bindings"]
+            if len(results) < page_size:
+                yield results
+                return
+            
+            # The results for the last key may continue on the next page,
+            # they are sent with it
+            last = results[-1][key]['value']
+            page = [r for r in results if r[key]['value'] != last]
+            if len(page) > 0:
+                yield page
+                page_query = _restrict(query, key, '>=', last)
+                continue
+            
+            # A single key fills the page. The pages are never made larger
+            # as the store would cut them to its maximum number of rows, the
+            # results of this key are paged with an OFFSET instead
+            for page in self._offset_pages(_restrict(query, key, '=', last), page_size):
+                if len(page) > 0:
+                    yield page
+            page_query = _restrict(query, key, '>', last)
+    
+    def _query(self, query):
+        '''
+        Send a query through the shared transport and decode the JSON
+        results
+        '''
+        r = transport.post(self.end_point, data={'query' : query},
+                           headers={'Accept' : JSON_RESULTS})
+        r.raise_for_status()
+        return r.json()
+    
+    def _query_iter(self, query):
+        '''
+        Send a query and decode the JSON results one binding at a time
+        '''
+        r = transport.post(self.end_point, data={'query' : query},
+                           headers={'Accept' : JSON_RESULTS}, stream=True)
+        try:
+            r.raise_for_status()
+            chunks = r.iter_content(READ_SIZE)
+            variables = None
+            for binding in _decode_bindings(chunks):
+                if variables == None:
+                    # The first item is the list of variables
+                    variables = binding
+                    continue
+                yield tuple([self.format(binding[v]) if v in binding else None
+                             for v in variables])
+        finally:
+            r.close()
+    
     def format(self, entry):
         v = None
         if entry['type'] == 'uri':
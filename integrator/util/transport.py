@@ -0,0 +1,121 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+from requests.packages.urllib3.util.retry import Retry
+
+# Seconds to wait for a connection and for a response
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 600
+
+# Number of attempts for requests failing because of the network or of
+# an overloaded server, and factor of the exponential delay between them
+RETRIES = 3
+BACKOFF = 0.5
+
+# Status codes worth trying again
+RETRY_STATUS = [502, 503, 504]
+
+# Number of connections kept alive per host
+POOL_SIZE = 16
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+# Settings of the sessions, set by configure()
+_settings = {'connect_timeout' : CONNECT_TIMEOUT,
+             'timeout'         : READ_TIMEOUT,
+             'retries'         : RETRIES,
+             'backoff'         : BACKOFF,
+             'pool_size'       : POOL_SIZE,
+             'digest'          : False}
+
+# The session of the current process and the process it belongs to. The
+# workers create their own session instead of sharing the sockets of the
+# one inherited from the parent
+_session = None
+_session_pid = None
+_auths = {}
+_lock = threading.Lock()
+
+def configure(**settings):
+    '''
+    Change the settings of the transport (connect_timeout, timeout, retries,
+    backoff, pool_size and digest), the current session is dropped
+    '''
+    global _session
+    for (key, value) in settings.iteritems():
+        if key not in _settings:
+            raise ValueError('Unknown transport setting {}'.format(key))
+        _settings[key] = value
+    _session = None
+    _auths.clear()
+
+def _retry():
+    '''
+    Retry policy, also applied to POST requests as all the queries and
+    updates sent can safely be sent again
+    '''
+    params = {'total'            : _settings['retries'],
+              'backoff_factor'   : _settings['backoff'],
+              'status_forcelist' : RETRY_STATUS,
+              'raise_on_status'  : False}
+    try:
+        return Retry(allowed_methods=False, **params)
+    except TypeError:
+        return Retry(method_whitelist=False, **params)
+
+def _timeout():
+    return (_settings['connect_timeout'], _settings['timeout'])
+
+def get_session():
+    '''
+    Get the session of the current process, created on first use
+    '''
+    global _session, _session_pid
+    with _lock:
+        if _session == None or _session_pid != os.getpid():
+            _session = _new_session()
+            _session_pid = os.getpid()
+            _auths.clear()
+        return _session
+
+def _new_session():
+    adapter = HTTPAdapter(pool_connections=_settings['pool_size'],
+                          pool_maxsize=_settings['pool_size'],
+                          max_retries=_retry())
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+def get_auth(user, secret):
+    '''
+    Get the authentication for a user. Digest authentications are kept to
+    re-use the nonce of the server instead of doing a challenge per request
+    '''
+    if user == None:
+        return None
+    if not _settings['digest']:
+        return (user, secret)
+    get_session()
+    if (user, secret) not in _auths:
+        _auths[(user, secret)] = HTTPDigestAuth(user, secret)
+    return _auths[(user, secret)]
+
+def post(url, **kwargs):
+    '''
+    Send a POST request through the session of the process
+    '''
+    kwargs.setdefault('timeout', _timeout())
+    return get_session().post(url, **kwargs)
+
+def get(url, **kwargs):
+    '''
+    Send a GET request through the session of the process
+    '''
+    kwargs.setdefault('timeout', _timeout())
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,260 @@
+import codecs
+import re
+import urlparse
+
+from util.writer import escape
+
+# Amount of data read at once from the source
+READ_SIZE = 1024 * 1024
+
+RDF = u'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XSD = u'http://www.w3.org/2001/XMLSchema#'
+
+# Characters allowed at the end of a local name, and in its middle
+_LOCAL_END = ur"(?:[\w\-:]|%[0-9A-Fa-f]{2}|\\[_~.\-!$&'()*+,;=/?#@%])"
+_LOCAL_MIDDLE = ur"(?:[\w.\-:]|%[0-9A-Fa-f]{2}|\\[_~.\-!$&'()*+,;=/?#@%])"
+
+# The tokens of Turtle. The long strings are tried first for an opening """
+# not to be read as an empty string
+_TOKEN = re.compile(u'|'.join([
+    ur'(?P<long>"""(?:(?:"|"")?(?:[^"\\]|\\.))*"""'
+    ur"|'''(?:(?:'|'')?(?:[^'\\]|\\.))*''')",
+    ur'(?P<string>"(?:[^"\\\n\r]|\\.)*"' ur"|'(?:[^'\\\n\r]|\\.)*')",
+    ur'(?P<iri><[^<>"{}|^`\\\x00-\x20]*(?:\\[uU][0-9A-Fa-f]+[^<>"{}|^`\\\x00-\x20]*)*>)',
+    ur'(?P<langtag>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)',
+    ur'(?P<datatype>\^\^)',
+    ur'(?P<bnode>_:\w(?:[\w.\-]*[\w\-])?)',
+    ur'(?P<double>[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+)[eE][+-]?[0-9]+)',
+    ur'(?P<decimal>[+-]?[0-9]*\.[0-9]+)',
+    ur'(?P<integer>[+-]?[0-9]+)',
+    ur'(?P<pname>(?:[^\W\d_](?:[\w.\-]*[\w\-])?)?:'
+    ur'(?:' + _LOCAL_END + '(?:' + _LOCAL_MIDDLE + '*' + _LOCAL_END + ')?)?)',
+    ur'(?P<keyword>[A-Za-z]+)',
+    ur'(?P<punct>[.;,\[\]()])']), re.U | re.S)
+
+# White spaces and comments between the tokens
+_SKIP = re.compile(ur'(?:\s+|#[^\n]*)*', re.U)
+
+# Escape sequences in strings and in local names
+_ESCAPE = re.compile(ur'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.S)
+_ECHAR = {u't': u'\t', u'b': u'\b', u'n': u'\n', u'r': u'\r', u'f': u'\f',
+          u'"': u'"', u"'": u"'", u'\\': u'\\'}
+_LOCAL_ESCAPE = re.compile(ur'\\(.)')
+
+# Scheme at the beginning of an absolute IRI
+_ABSOLUTE = re.compile(ur'^[A-Za-z][A-Za-z0-9+.\-]*:')
+
+_EOF = (None, None)
+
+def _unescape_character(match):
+    if match.group(1) != None:
+        return unichr(int(match.group(1), 16))
+    if match.group(2) != None:
+        return ('\\U' + str(match.group(2))).decode('unicode-escape')
+    if match.group(3) in _ECHAR:
+        return _ECHAR[match.group(3)]
+    raise SyntaxError('Invalid escape sequence \\{}'.format(match.group(3)))
+
+class TurtleReader(object):
+    '''
+    Parse a Turtle file as it is read and iterate over its statements as
+    lines of N-Triples, without keeping the triples in memory. The blank
+    nodes are labelled in order of appearance, so reading the same file
+    always gives the same labels
+    '''
+    def __init__(self, source, base=None):
+        '''
+        Constructor
+        '''
+        self.source = source
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.position = 0
+        self.eof = False
+        self.base = base
+        self.namespaces = {}
+        self.anonymous = 0
+        self.token = _EOF
+        self.triples = []
+
+    def statements(self):
+        '''
+        Iterate over the statements, as utf-8 encoded lines of N-Triples
+        '''
+        for (s, p, o) in self.read():
+            yield u'{} {} {} .\n'.format(s, p, o).encode('utf-8')
+
+    def read(self):
+        '''
+        Iterate over the triples, as tuples of terms in N-Triples
+        '''
+        self._advance()
+        while self.token != _EOF:
+            self._statement()
+            for triple in self.triples:
+                yield triple
+            self.triples = []
+
+    def _fill(self):
+        data = self.source.read(READ_SIZE)
+        self.eof = not data
+        self.buffer = (self.buffer[self.position:] +
+                       self.decoder.decode(data, final=self.eof))
+        self.position = 0
+
+    def _advance(self):
+        # Read more until the token found can not be longer, the start of a
+        # long string or a number followed by a dot being cut off
+        while True:
+            start = _SKIP.match(self.buffer, self.position).end()
+            match = _TOKEN.match(self.buffer, start)
+            if self.eof:
+                break
+            if (match != None and match.end() < len(self.buffer) - 1 and
+                (match.lastgroup == 'long' or
+                 not self.buffer.startswith(('"""', "'''"), start))):
+                break
+            self._fill()
+        if match == None:
+            if start == len(self.buffer):
+                self.token = _EOF
+                return
+            raise SyntaxError('Invalid Turtle near "{}"'.format(
+                              self.buffer[start:start + 40].encode('utf-8')))
+        self.position = match.end()
+        self.token = (match.lastgroup, match.group())
+
+    def _expect(self, kind, value=None):
+        (token_kind, token_value) = self.token
+        if token_kind != kind or (value != None and token_value != value):
+            raise SyntaxError('Expected {} but got "{}"'.format(
+                              value or kind, (token_value or 'EOF').encode('utf-8')))
+        self._advance()
+        return token_value
+
+    def _statement(self):
+        (kind, value) = self.token
+        if ((kind == 'langtag' and value in ('@prefix', '@base')) or
+            (kind == 'keyword' and value.upper() in ('PREFIX', 'BASE'))):
+            self._advance()
+            if value.lower().endswith('prefix'):
+                prefix = self._expect('pname')
+                if not prefix.endswith(':'):
+                    raise SyntaxError('Invalid prefix {}'.format(prefix.encode('utf-8')))
+                self.namespaces[prefix[:-1]] = self._resolve(self._expect('iri'))
+            else:
+                self.base = self._resolve(self._expect('iri'))
+            if kind == 'langtag':
+                self._expect('punct', '.')
+            return
+        if self.token == ('punct', '['):
+            subject = self._blank_node_property_list()
+            if self.token != ('punct', '.'):
+                self._predicate_object_list(subject)
+        else:
+            subject = self._subject()
+            self._predicate_object_list(subject)
+        self._expect('punct', '.')
+
+    def _subject(self):
+        (kind, value) = self.token
+        if kind in ('iri', 'pname'):
+            return self._iri()
+        if kind == 'bnode':
+            self._advance()
+            return u'_:l' + value[2:]
+        if self.token == ('punct', '('):
+            return self._collection()
+        raise SyntaxError('Invalid subject "{}"'.format((value or 'EOF').encode('utf-8')))
+
+    def _predicate_object_list(self, subject):
+        while True:
+            if self.token == ('keyword', 'a'):
+                self._advance()
+                predicate = u'<' + RDF + u'type>'
+            else:
+                predicate = self._iri()
+            self.triples.append((subject, predicate, self._object()))
+            while self.token == ('punct', ','):
+                self._advance()
+                self.triples.append((subject, predicate, self._object()))
+            if self.token != ('punct', ';'):
+                return
+            while self.token == ('punct', ';'):
+                self._advance()
+            if self.token in (('punct', '.'), ('punct', ']')):
+                return
+
+    def _object(self):
+        (kind, value) = self.token
+        if kind in ('string', 'long'):
+            self._advance()
+            quotes = 3 if kind == 'long' else 1
+            literal = u'"' + escape(_ESCAPE.sub(_unescape_character,
+                                                value[quotes:-quotes])) + u'"'
+            if self.token[0] == 'langtag':
+                literal = literal + self.token[1]
+                self._advance()
+            elif self.token[0] == 'datatype':
+                self._advance()
+                literal = literal + u'^^' + self._iri()
+            return literal
+        if kind in ('integer', 'decimal', 'double'):
+            self._advance()
+            return u'"{}"^^<{}{}>'.format(value, XSD, kind)
+        if kind == 'keyword' and value in ('true', 'false'):
+            self._advance()
+            return u'"{}"^^<{}boolean>'.format(value, XSD)
+        if self.token == ('punct', '['):
+            return self._blank_node_property_list()
+        return self._subject()
+
+    def _iri(self):
+        (kind, value) = self.token
+        if kind == 'iri':
+            self._advance()
+            return u'<' + self._resolve(value) + u'>'
+        if kind == 'pname':
+            self._advance()
+            (prefix, local) = value.split(u':', 1)
+            if prefix not in self.namespaces:
+                raise SyntaxError('Unknown prefix {}'.format(prefix.encode('utf-8')))
+            return u'<' + self.namespaces[prefix] + _LOCAL_ESCAPE.sub(ur'\1', local) + u'>'
+        raise SyntaxError('Expected an IRI but got "{}"'.format((value or 'EOF').encode('utf-8')))
+
+    def _resolve(self, value):
+        iri = value[1:-1]
+        if self.base != None and not _ABSOLUTE.match(iri):
+            iri = urlparse.urljoin(self.base, iri)
+        return iri
+
+    def _new_node(self):
+        self.anonymous = self.anonymous + 1
+        return u'_:a{}'.format(self.anonymous)
+
+    def _blank_node_property_list(self):
+        self._expect('punct', '[')
+        node = self._new_node()
+        if self.token != ('punct', ']'):
+            self._predicate_object_list(node)
+        self._expect('punct', ']')
+        return node
+
+    def _collection(self):
+        self._expect('punct', '(')
+        head = u'<' + RDF + u'nil>'
+        previous = None
+        while self.token != ('punct', ')'):
+            if self.token == _EOF:
+                raise SyntaxError('Unterminated collection')
+            node = self._new_node()
+            if previous == None:
+                head = node
+            else:
+                self.triples.append((previous, u'<' + RDF + u'rest>', node))
+            self.triples.append((node, u'<' + RDF + u'first>', self._object()))
+            previous = node
+        self._advance()
+        if previous != None:
+            self.triples.append((previous, u'<' + RDF + u'rest>', u'<' + RDF + u'nil>'))
+        return head
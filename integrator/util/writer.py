@@ -0,0 +1,180 @@
+import bz2
+import re
+
+from rdflib.namespace import RDF
+from rdflib.term import Node, URIRef, Literal, BNode
+
+# Number of statements buffered before being written to the output
+BUFFER_SIZE = 10000
+
+# File extension associated to every output format
+EXTENSIONS = {'n3'     : '.ttl',
+              'turtle' : '.ttl',
+              'nt'     : '.nt'}
+
+# Local names that can safely be written as a prefixed name in Turtle
+LOCAL_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_\-]*$')
+
+# Define the logger
+import logging
+log = logging.getLogger(__name__)
+
+def open_output(file_name, compress):
+    '''
+    Open an output file, compressing it if needed. The '.bz2' extension is
+    added to the name of compressed files
+    '''
+    if compress:
+        return bz2.BZ2File(file_name + '.bz2', 'wb', compresslevel=9)
+    return open(file_name, 'wb')
+
+def escape(value):
+    '''
+    Escape the content of a string for N-Triples and Turtle
+    '''
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+                 .replace('\n', '\\n').replace('\r', '\\r')
+                 .replace('\t', '\\t'))
+
+class TriplesWriter(object):
+    '''
+    Write triples to a N-Triples or Turtle file as soon as they are added.
+    Only the statements waiting to be written are kept in memory. There is no
+    re-ordering nor any de-duplication so the same statements added in the
+    same order always produce the same file. Blank nodes are re-labelled in
+    order of appearance. In Turtle, the statements added one after the other
+    about the same subject are grouped.
+    '''
+    def __init__(self, output_file_name, output_format='nt', compress=True,
+                 header=True):
+        """
+        Constructor
+        """
+        if output_format not in ('nt', 'turtle'):
+            raise ValueError('Unsupported format {}'.format(output_format))
+        self.output_format = output_format
+        self.out = open_output(output_file_name, compress)
+        self.header = header
+        self._namespaces = {}
+        self.bnodes = {}
+        self.buffer = []
+        self.count = 0
+        # Subject of the last statement, while it is not terminated
+        self.subject = None
+
+    def bind(self, prefix, namespace):
+        """
+        Bind a prefix to a namespace, only used for Turtle
+        """
+        self._namespaces[prefix] = unicode(namespace)
+
+    def namespaces(self):
+        """
+        Iterate over all the (prefix, namespace) bindings
+        """
+        for (prefix, namespace) in self._namespaces.iteritems():
+            yield (prefix, URIRef(namespace))
+
+    def add(self, triple):
+        """
+        Add a triple to the output
+        """
+        (s, p, o) = triple
+        assert isinstance(s, Node), "Subject %s must be an rdflib term" % (s,)
+        assert isinstance(p, Node), "Predicate %s must be an rdflib term" % (p,)
+        assert isinstance(o, Node), "Object %s must be an rdflib term" % (o,)
+
+        if self.header:
+            self._write_header()
+        if self.output_format == 'turtle':
+            subject = self._term(s)
+            predicate = u'a' if p == RDF.type else self._term(p)
+            if subject == self.subject:
+                self.buffer.append(u' ;\n    {} {}'.format(predicate, self._term(o)))
+            else:
+                self._end_statement()
+                self.buffer.append(u'{} {} {}'.format(subject, predicate, self._term(o)))
+                self.subject = subject
+        else:
+            self.buffer.append(u'{} {} {} .\n'.format(self._term(s),
+                                                      self._term(p),
+                                                      self._term(o)))
+        self.count = self.count + 1
+        if len(self.buffer) == BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all the buffered statements to the output
+        """
+        if len(self.buffer) != 0:
+            self.out.write(u''.join(self.buffer).encode('utf-8'))
+            self.buffer = []
+
+    def append(self, file_name, count):
+        """
+        Copy the count statements of an uncompressed file written by another
+        TriplesWriter, without header and using the same bindings. Blank
+        nodes are not relabelled
+        """
+        if self.header:
+            self._write_header()
+        self._end_statement()
+        self.flush()
+        with open(file_name, 'rb') as part:
+            for line in part:
+                self.out.write(line)
+        self.count = self.count + count
+
+    def close(self):
+        """
+        Flush and close the output
+        """
+        if self.header:
+            self._write_header()
+        self._end_statement()
+        self.flush()
+        self.out.close()
+
+    def __len__(self):
+        return self.count
+
+    def _end_statement(self):
+        if self.subject != None:
+            self.buffer.append(u' .\n')
+            self.subject = None
+
+    def _write_header(self):
+        if self.output_format == 'turtle':
+            for prefix in sorted(self._namespaces.keys()):
+                self.buffer.append(u'@prefix {}: <{}> .\n'.format(prefix, self._namespaces[prefix]))
+            self.buffer.append(u'\n')
+        self.header = False
+
+    def _term(self, term):
+        if isinstance(term, URIRef):
+            return self._uri(term)
+        elif isinstance(term, Literal):
+            value = u'"{}"'.format(escape(term))
+            if term.language != None:
+                value = value + u'@' + term.language
+            elif term.datatype != None:
+                value = value + u'^^' + self._uri(term.datatype)
+            return value
+        elif isinstance(term, BNode):
+            if term not in self.bnodes:
+                self.bnodes[term] = u'_:b{}'.format(len(self.bnodes))
+            return self.bnodes[term]
+        raise ValueError('Can not serialise {}'.format(repr(term)))
+
+    def _uri(self, uri):
+        if self.output_format == 'turtle':
+            # Look for the longest namespace matching the URI
+            best = None
+            for (prefix, namespace) in self._namespaces.iteritems():
+                if uri.startswith(namespace) and (best == None or len(namespace) > len(self._namespaces[best])):
+                    if LOCAL_NAME.match(uri[len(namespace):]):
+                        best = prefix
+            if best != None:
+                return u'{}:{}'.format(best, uri[len(self._namespaces[best]):])
+        return u'<{}>'.format(uri)